@@ -1,31 +1,225 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
 import sys
-sys.path.append('classes')
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classes'))
 from classes import Record, Note
 from address_book import AddressBook
 from note_book import NotesBook
-
-def input_error(func):
+from note_index import MODE_AND, MODE_OR
+from validators import normalize_tag
+from contact_query import parse_query, QueryError, FILTER, SCAN
+from journal import Journal
+from sqlite_storage import SQLiteAddressBook, SQLiteNotesBook
+from sharded_book import ShardedAddressBook, ShardedNotesBook, stored_shard_count
+from trie import PrefixTrie
+from bulk_import import import_contacts, write_error_report
+from command_stats import STATS
+from server import BookServer, DEFAULT_HOST, DEFAULT_PORT
+from left_right import LeftRight
+from autosave import Autosaver, AUTOSAVE_DELAY
+from bisect import bisect_right
+from collections import namedtuple
+from collections.abc import Iterator
+from functools import wraps
+from itertools import chain, islice
+
+JOURNAL_PATH = "assistant_bot.journal"
+BATCH_BUFFER_SIZE = 1024 * 1024
+EXIT_COMMANDS = ["close", "exit"]
+MAX_SUGGESTIONS = 5
+IMPORT_ERRORS_SHOWN = 10
+NOTE_SEARCH_LIMIT = 10
+DEFAULT_PAGE_SIZE = 20
+
+HANDLED_ERRORS = (ValueError, AttributeError, IndexError, KeyError)
+
+
+def error_text(error):
+    '''
+    Відповідь бота на виняток, перехоплений input_error
     '''
-    Обробка винятків
+    if isinstance(error, ValueError):
+        if str(error) in ["Phone number must be 10 digits long", "Birthday must be in the format DD.MM.YYYY", "Email is not valid",
+                          "Tag must be a single word"]:
+            return str(error)
+        return "Give me correct data please"
+    if isinstance(error, AttributeError):
+        return "Attribute 'value' is missing" if "NoneType" in str(error) else "Give me correct data please"
+    if isinstance(error, IndexError):
+        return "Missing arguments"
+    return "Not found"
+
+
+def guard_stream(name, chunks, elapsed):
     '''
+    Видає частини потокового виводу обробника. Винятки під час ітерації обробляються так само,
+    як під час виклику, а статистика (elapsed не None) враховує й час на кожну частину
+    '''
+    error = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                if elapsed is not None:
+                    elapsed += time.perf_counter() - start
+            yield chunk
+    except HANDLED_ERRORS as e:
+        error = e
+        yield f"\n{error_text(e)}\n"
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if elapsed is not None:
+            STATS.record(name, elapsed, error)
+
+
+def input_error(func=None, *, stats=True):
+    '''
+    Обробка винятків та, якщо увімкнено, збір статистики викликів обробника.
+    Потоковий вивід обгортається, тож обидва охоплюють і його споживання.
+    @input_error(stats=False) лише обробляє винятки функції, яка не є обробником команди
+    '''
+    if func is None:
+        return lambda func: input_error(func, stats=stats)
+    name = func.__name__
+
+    @wraps(func)
     def inner(*args, **kwargs):
+        start = time.perf_counter() if stats and STATS.enabled else None
+        error = None
+        result = None
         try:
-            return func(*args, **kwargs)
-        except ValueError as e:
-            if str(e) in ["Phone number must be 10 digits long", "Birthday must be in the format DD.MM.YYYY", "Email is not valid"]:
-                return str(e)
-            else:
-                return "Give me correct data please"
-        except AttributeError as e:
-            if "NoneType" in str(e):
-                return "Attribute 'value' is missing"
-        except IndexError:
-            return "Missing arguments"
-        except KeyError:
-            return "Not found"
+            result = func(*args, **kwargs)
+        except HANDLED_ERRORS as e:
+            error = e
+            return error_text(e)
+        finally:
+            elapsed = time.perf_counter() - start if start is not None else None
+            # Необроблений виняток теж враховується, хоча й не перехоплюється
+            error = error or sys.exc_info()[1]
+            if elapsed is not None and (error is not None or not isinstance(result, Iterator)):
+                STATS.record(name, elapsed, error)
+        if isinstance(result, Iterator):
+            return guard_stream(name, result, elapsed)
+        return result
     return inner
 
 
+# Сторінка виводу: номер, розмір (None - без обмеження), ключ, після якого починати,
+# та команда з аргументами для підказки, як отримати наступну сторінку
+Paging = namedtuple('Paging', ['page', 'limit', 'after', 'command'])
+
+PAGING_OPTIONS = ("--page", "--limit", "--after")
+
+
+def parse_paging(command, args):
+    '''
+    Відокремлює від аргументів --page N, --limit K та --after КЛЮЧ.
+    Повертає решту аргументів і сторінку або повідомлення про помилку
+    '''
+    rest = []
+    options = {}
+    args = iter(args)
+    for arg in args:
+        if arg not in PAGING_OPTIONS:
+            rest.append(arg)
+            continue
+        value = next(args, None)
+        if value is None:
+            return rest, f"\nMissing value for {arg}.\n"
+        options[arg] = value
+
+    try:
+        page = int(options.get("--page", 1))
+        limit = options.get("--limit")
+        limit = int(limit) if limit is not None else (DEFAULT_PAGE_SIZE if "--page" in options else None)
+    except ValueError:
+        return rest, "\nPage and limit must be numbers.\n"
+    if page < 1 or (limit is not None and limit < 1):
+        return rest, "\nPage and limit must be positive.\n"
+    return rest, Paging(page, limit, options.get("--after"), ' '.join([command, *rest]))
+
+
+def stream_page(items, paging, render, key, empty, next_page=None):
+    '''
+    Видає вивід частинами, по запису за раз. Якщо після сторінки лишились записи,
+    останньою частиною йде команда для наступної сторінки
+    '''
+    shown = 0
+    last = None
+    for item in items:
+        if paging.limit is not None and shown == paging.limit:
+            if next_page is None:
+                hint = f"{paging.command} --after {key(last)} --limit {paging.limit}"
+            else:
+                hint = next_page()
+            yield f"\n\nMore results: {hint}\n"
+            return
+        yield ('\n' if not shown else '\n\n') + render(item)
+        shown += 1
+        last = item
+    yield '\n' if shown else f"\n{empty}\n"
+
+
+def result_text(result):
+    '''
+    Відповідь обробника одним рядком: потоковий вивід збирається повністю, None - порожній рядок
+    '''
+    if result is None:
+        return ''
+    return result if isinstance(result, str) else ''.join(result)
+
+
+def show_result(result):
+    '''
+    Друкує відповідь обробника; потоковий вивід з'являється частинами, без збирання в один рядок.
+    Для None нічого не друкується
+    '''
+    if result is None:
+        return
+    if isinstance(result, str):
+        print(result)
+        return
+    for chunk in result:
+        sys.stdout.write(chunk)
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+
+
+def record_name(record):
+    return record.name.value
+
+
+def note_title(note):
+    return note.title.value
+
+
+def render_note(note):
+    text = f"Title: {note.title}\nDescription: {note.description}"
+    if note.tags:
+        text += f"\nTags: {', '.join(map(str, note.tags))}"
+    return text
+
+
+def not_found(book, name, message):
+    '''
+    Повідомлення про відсутній контакт з підказкою найближчих за написанням імен
+    '''
+    names = [record.name.value for record in book.find_similar(name)]
+    if names:
+        return f"\n{message} Did you mean: {', '.join(names)}?\n"
+    return f"\n{message}\n"
+
+
 @input_error
 def add_contact(args, book):
     name, phone = args
@@ -60,20 +254,16 @@ def show_phone(args, book):
     if record:
         return '\n' + ', '.join(map(str, record.phones)) + '\n'
     else:
-        return "\nNot found.\n"
+        return not_found(book, name, "Not found.")
 
 
 @input_error
-def show_all_contacts(book):
+def show_all_contacts(book, paging):
     '''
-    Відображає всі збережені контакти
+    Відображає збережені контакти за зростанням імені, посторінково за потреби
     '''
-    if not book.data:
-        return "\nNo contacts stored.\n"
-
-    contact_details = [str(record) for record in book.data.values()]
-
-    return '\n' + f'\n\n'.join(contact_details) + '\n'
+    offset = (paging.page - 1) * paging.limit if paging.limit else 0
+    return stream_page(book.iter_sorted(paging.after, offset), paging, str, record_name, "No contacts stored.")
 
 
 @input_error
@@ -96,6 +286,8 @@ def show_address(args, book):
     record = book.find(name)
     if record and record.address:
         return '\n' + record.address.value + '\n'
+    elif record is None:
+        return not_found(book, name, "No contact or address found.")
     else:
         return "\nNo contact or address found.\n"
 
@@ -117,6 +309,8 @@ def show_email(args, book):
     record = book.find(name)
     if record and record.email:
         return '\n' + record.email.value + '\n'
+    elif record is None:
+        return not_found(book, name, "No contact or email found.")
     else:
         return "\nNo contact or email found.\n"
 
@@ -164,6 +358,8 @@ def show_birthday(args, book):
     record = book.find(name)
     if record and record.birthday:
         return '\n' + record.birthday.value.strftime('%d.%m.%Y') + '\n'
+    elif record is None:
+        return not_found(book, name, "No birthday found for this contact.")
     else:
         return "\nNo birthday found for this contact.\n"
 
@@ -205,29 +401,125 @@ def show_birthdays_in_x_days(args, book):
     return "\n" + "\n".join(response) + "\n"
 
 
+def render_search_result(record):
+    info = f"Name: {record.name.value}"
+    if record.phones:
+        phones_info = "; ".join(phone.value for phone in record.phones)
+        info += f"\nPhones: {phones_info}"
+    if record.email:
+        info += f"\nEmail: {record.email.value}"
+    if record.address:
+        info += f"\nAddress: {record.address.value}"
+    if record.birthday:
+        info += f"\nBirthday: {record.birthday.value.strftime('%d.%m.%Y')}"
+    return info
+
+
 @input_error
-def search_contacts(args, book):
+def search_contacts(args, book, paging):
     search_string = args[0]
+    # Книга повертає збіги, впорядковані за іменем
     matching_records = book.search_contacts(search_string)
-    
-    if matching_records:
-        result = []
-        for record in matching_records:
-            info = f"Name: {record.name.value}"
-            if record.phones:
-                phones_info = "; ".join(phone.value for phone in record.phones)
-                info += f"\nPhones: {phones_info}"
-            if record.email:
-                info += f"\nEmail: {record.email.value}"
-            if record.address:
-                info += f"\nAddress: {record.address.value}"
-            if record.birthday:
-                info += f"\nBirthday: {record.birthday.value.strftime('%d.%m.%Y')}"
-            result.append(info)
-        
-        return "\n" + "\n\n".join(result) + '\n'
+    start = 0
+    if paging.after is not None:
+        start = bisect_right([record.name.value for record in matching_records], paging.after)
+    if paging.limit:
+        start += (paging.page - 1) * paging.limit
+
+    return stream_page(islice(matching_records, start, None), paging, render_search_result, record_name,
+                       "No matching contacts found.")
+
+
+@input_error
+def query_contacts(args, book, paging):
+    '''
+    Пошук контактів за окремими полями: name:, phone:, email:, address:, bday:
+    '''
+    try:
+        terms = parse_query(args)
+    except QueryError as error:
+        return f"\n{error}\n"
+    matching_records = book.query_contacts(terms).records
+    start = 0
+    if paging.after is not None:
+        start = bisect_right([record.name.value for record in matching_records], paging.after)
+    if paging.limit:
+        start += (paging.page - 1) * paging.limit
+
+    return stream_page(islice(matching_records, start, None), paging, render_search_result, record_name,
+                       "No matching contacts found.")
+
+
+@input_error
+def explain_query(args, book):
+    '''
+    Показує, який індекс обслужив запит query-contacts і скільки кандидатів перевірено
+    '''
+    try:
+        terms = parse_query(args)
+    except QueryError as error:
+        return f"\n{error}\n"
+    result = book.query_contacts(terms)
+    lines = ["Query plan:"]
+    for plan in result.plans:
+        marker = '*' if plan.chosen else ' '
+        estimate = f", ~{plan.estimate} candidate(s)" if plan.estimate is not None else ""
+        shards = f", chosen in {plan.chosen} of {result.shards} shards" if plan.chosen and result.shards > 1 else ""
+        index = plan.index if plan.index in (FILTER, SCAN) else f"{plan.index} index"
+        lines.append(f"  {marker} {plan.source} -> {index}{estimate}{shards}")
+    lines.extend(f"  {detail}" for detail in result.details)
+    if result.examined is not None:
+        lines.append(f"Examined {result.examined} candidate(s), {len(result.records)} matched.")
     else:
-        return "\nNo matching contacts found.\n"
+        lines.append(f"{len(result.records)} matched.")
+    return '\n' + '\n'.join(lines) + '\n'
+
+
+def render_duplicate_group(item):
+    number, group = item
+    return f"{number}. {group.keeper} <- {', '.join(group.duplicates)} (same {', '.join(group.reasons)})"
+
+
+@input_error
+def find_duplicates(book, paging):
+    '''
+    Відображає пронумеровані групи ймовірних дублікатів контактів
+    '''
+    report = book.find_duplicates()
+    groups = list(enumerate(report.groups, 1))
+    start = 0
+    if paging.after is not None:
+        start = bisect_right([group.keeper for group in report.groups], paging.after)
+    if paging.limit:
+        start += (paging.page - 1) * paging.limit
+
+    footer = []
+    if report.groups:
+        footer.append("Run merge-duplicates to merge all groups or merge-duplicates [number...] to merge selected ones.\n")
+    if report.skipped_blocks:
+        footer.append(f"{report.skipped_blocks} oversized block(s) of contacts sharing a key were not compared.\n")
+    return chain(stream_page(islice(groups, start, None), paging, render_duplicate_group,
+                             lambda item: item[1].keeper, "No duplicate contacts found."), footer)
+
+
+@input_error
+def merge_duplicates(args, book):
+    '''
+    Зливає всі групи дублікатів або лише вибрані за номерами з find-duplicates
+    '''
+    groups = book.find_duplicates().groups
+    if not groups:
+        return "\nNo duplicate contacts found.\n"
+    if args:
+        try:
+            numbers = sorted({int(arg) for arg in args})
+        except ValueError:
+            return "\nGroup numbers must be integers.\n"
+        if numbers[0] < 1 or numbers[-1] > len(groups):
+            return f"\nGroup numbers must be between 1 and {len(groups)}.\n"
+        groups = [groups[number - 1] for number in numbers]
+    merged = book.merge_records(groups)
+    return f"\nMerged {merged} duplicate contact(s) into {len(groups)} contact(s).\n"
 
 
 @input_error
@@ -240,6 +532,51 @@ def delete_contact(args, book):
         return "\nContact not found.\n"
 
 
+@input_error
+def find_by_phone(args, book):
+    '''
+    Відображає контакти, яким належить вказаний номер телефону
+    '''
+    [phone] = args
+    records = book.find_by_phone(phone)
+    if not records:
+        return "\nNo contact with this phone found.\n"
+
+    return '\n' + '\n\n'.join(str(record) for record in records) + '\n'
+
+
+@input_error
+def show_shared_phones(book):
+    '''
+    Відображає номери телефонів, записані у кількох контактів
+    '''
+    shared_phones = book.find_shared_phones()
+    if not shared_phones:
+        return "\nNo shared phones found.\n"
+
+    lines = [f"{phone}: {', '.join(names)}" for phone, names in sorted(shared_phones.items())]
+    return '\n' + '\n'.join(lines) + '\n'
+
+
+@input_error
+def import_contacts_file(args, book):
+    '''
+    Масовий імпорт контактів з CSV чи vCard зі звітом про відхилені рядки
+    '''
+    path = ' '.join(args)
+    if not os.path.isfile(path):
+        return "\nFile not found.\n"
+
+    imported, errors = import_contacts(path, book)
+    response = [f"Imported {imported} contact(s)."]
+    if errors:
+        report_path = path + ".errors.txt"
+        write_error_report(report_path, errors)
+        response.append(f"{len(errors)} row(s) rejected, see {report_path}:")
+        response.extend(f"Row {number}: {message}" for number, message in errors[:IMPORT_ERRORS_SHOWN])
+    return '\n' + '\n'.join(response) + '\n'
+
+
 @input_error
 def add_note(args, notebook):
     title, description_lines = args[0], args[1:]
@@ -269,33 +606,134 @@ def show_note(args, notebook):
     note = notebook.find(title)
 
     if note:
-        return f"\nTitle: {note.title}\nDescription: {note.description}\n"
+        return f"\n{render_note(note)}\n"
     return "\nNo note found.\n"
 
 
 @input_error
-def search_notes(args, notebook):
-    [term] = args
-    if len(term) < 3:
+def search_notes(args, notebook, paging):
+    '''
+    Ранжований пошук нотаток: усі слова запиту або, з OR між ними, будь-яке з них.
+    --top N задає кількість найрелевантніших результатів; --page та --limit гортають їх далі
+    '''
+    if paging.after is not None:
+        return "\nSearch results are ranked, use --page instead of --after.\n"
+    args = list(args)
+    limit = NOTE_SEARCH_LIMIT
+    if "--top" in args:
+        position = args.index("--top")
+        try:
+            limit = int(args[position + 1])
+        except (IndexError, ValueError):
+            return "\nInvalid number of results.\n"
+        if limit < 1:
+            return "\nPlease provide a positive number of results.\n"
+        del args[position:position + 2]
+
+    mode = MODE_OR if "OR" in args else MODE_AND
+    terms = [arg for arg in args if arg not in ("AND", "OR")]
+    if not terms:
+        return "Missing arguments"
+    if any(len(term) < 3 for term in terms):
         return f"\nSearch term need at least 3 characters.\n"
 
-    results = notebook.search(term)
+    size = paging.limit or limit
+    # Зайвий результат показує, чи є наступна сторінка
+    results = notebook.search(terms, mode, paging.page * size + 1)
+    page = paging._replace(limit=size)
 
-    if not results:
-        return "\nNo matching notes found.\n"
-    
-    return '\n' + '\n'.join([f"Title: {note.title}\nDescription: {note.description}\n" for note in results]) + '\n'
+    def next_page():
+        return f"{paging.command} --page {paging.page + 1} --limit {size}"
+
+    return stream_page(islice(results, (paging.page - 1) * size, None), page, render_note, note_title,
+                       "No matching notes found.", next_page)
 
 
 @input_error
-def show_all_notes(notebook):
+def show_all_notes(notebook, paging):
     '''
-    Відображає всі збережені нотатки
+    Відображає збережені нотатки за зростанням заголовка, посторінково за потреби
     '''
-    if not notebook.data:
-        return "\nNo notes stored.\n"
+    offset = (paging.page - 1) * paging.limit if paging.limit else 0
+    return stream_page(notebook.iter_sorted(paging.after, offset), paging, render_note, note_title,
+                       "No notes stored.")
 
-    return '\n' + f'\n'.join([f"Title: {note.title}\nDescription: {note.description}\n" for note in notebook.data.values()])  + '\n'
+
+@input_error
+def add_tag(args, notebook):
+    title, tags = args[0], args[1:]
+    note = notebook.find(title)
+    if not note:
+        return "\nNote not found.\n"
+    added = note.add_tags(tags)
+    return "\nTags added.\n" if added else "\nNote already has these tags.\n"
+
+
+@input_error
+def remove_tag(args, notebook):
+    title, tag = args
+    note = notebook.find(title)
+    if not note:
+        return "\nNote not found.\n"
+    if note.remove_tag(tag):
+        return "\nTag removed.\n"
+    return "\nTag not found.\n"
+
+
+def parse_tag_query(args):
+    '''
+    Розбирає запит тегів на групи та виключення: теги поспіль мають бути всі (AND),
+    OR об'єднує сусідні теги в групу, з якої достатньо одного, NOT виключає тег.
+    "work urgent OR important NOT done" - work та (urgent або important), але не done
+    '''
+    groups, exclude = [], []
+    join, negate = False, False
+    for arg in args:
+        word = arg.upper()
+        if word == "OR":
+            join = bool(groups)
+        elif word == "NOT":
+            negate = True
+        elif word != "AND":
+            tag = normalize_tag(arg)
+            if negate:
+                exclude.append(tag)
+            elif join:
+                groups[-1].append(tag)
+            else:
+                groups.append([tag])
+            join, negate = False, False
+    return tuple(map(tuple, groups)), tuple(exclude)
+
+
+@input_error
+def find_by_tags(args, notebook, paging):
+    '''
+    Відображає нотатки за запитом тегів з AND, OR та NOT, впорядковані за заголовком
+    '''
+    groups, exclude = parse_tag_query(args)
+    if not groups and not exclude:
+        return "Missing arguments"
+    notes = notebook.find_by_tags(groups, exclude)
+    start = 0
+    if paging.after is not None:
+        start = bisect_right([note.title.value for note in notes], paging.after)
+    if paging.limit:
+        start += (paging.page - 1) * paging.limit
+
+    return stream_page(islice(notes, start, None), paging, render_note, note_title, "No matching notes found.")
+
+
+@input_error
+def show_notes_by_tag(notebook):
+    '''
+    Відображає теги за абеткою разом із заголовками їхніх нотаток
+    '''
+    grouped = notebook.notes_by_tag()
+    if not grouped:
+        return "\nNo tags stored.\n"
+    lines = [f"#{tag} ({len(notes)}): {', '.join(note.title.value for note in notes)}" for tag, notes in grouped]
+    return '\n' + '\n'.join(lines) + '\n'
 
 
 @input_error
@@ -308,11 +746,36 @@ def delete_note(args, notebook):
         return "\nNot found.\n"
 
 
+def show_cache_stats(book, notebook):
+    '''
+    Відображає влучання та промахи кешів запитів адресної книги та нотаток
+    '''
+    lines = []
+    for name, target in (("contacts", book), ("notes", notebook)):
+        cache = getattr(target, 'query_cache', None)
+        if cache is None:
+            lines.append(f"{name}: no query cache for this storage")
+            continue
+        stats = cache.stats()
+        lines.append(f"{name}: {stats['hits']} hits, {stats['misses']} misses "
+                     f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} cached queries")
+    return '\n' + '\n'.join(lines) + '\n'
+
+
+def show_stats():
+    '''
+    Відображає кількість викликів, затримки та винятки за командами
+    '''
+    if not STATS.enabled:
+        return "\nStatistics are disabled. Start the bot with --stats to collect them.\n"
+    return '\n' + STATS.report(handler_command_names()) + '\n'
+
+
 def hello_command():
     return "\nHow can I help you?\n"
 
 
-@input_error
+@input_error(stats=False)
 def parse_input(user_input):
     '''
     Обробляє введені дані, розділяючи рядок на команду та аргументи
@@ -322,14 +785,159 @@ def parse_input(user_input):
     return cmd, *args
 
 
+# Опис команди: обробник, книга, з якою він працює, допустима кількість аргументів
+# (max_args None - без обмеження), чи змінює команда книгу, підказка щодо використання
+# та чи приймає команда параметри сторінки --page, --limit і --after
+Command = namedtuple('Command', ['handler', 'target', 'min_args', 'max_args', 'mutates', 'usage', 'paged'],
+                     defaults=[False])
+
+BOOK = "book"
+NOTEBOOK = "notebook"
+BOTH_BOOKS = "both"
+
+COMMANDS = {
+    # addressbook commands
+    "hello": Command(hello_command, None, 0, 0, False, "hello"),
+    "stats": Command(show_stats, None, 0, 0, False, "stats"),
+    "cache-stats": Command(show_cache_stats, BOTH_BOOKS, 0, 0, False, "cache-stats"),
+    "add-contact": Command(add_contact, BOOK, 2, 2, True, "add-contact [name] [phone]"),
+    "change-phone": Command(change_contact, BOOK, 2, 2, True, "change-phone [name] [new phone]"),
+    "show-phone": Command(show_phone, BOOK, 1, 1, False, "show-phone [name]"),
+    "all-contacts": Command(show_all_contacts, BOOK, 0, 0, False, "all-contacts [--page N] [--limit K] [--after name]", True),
+    "add-birthday": Command(add_birthday, BOOK, 2, 2, True, "add-birthday [name] [DD.MM.YYYY]"),
+    "show-birthday": Command(show_birthday, BOOK, 1, 1, False, "show-birthday [name]"),
+    "change-birthday": Command(change_birthday, BOOK, 2, 2, True, "change-birthday [name] [DD.MM.YYYY]"),
+    "birthdays-in-x-days": Command(show_birthdays_in_x_days, BOOK, 1, 1, False, "birthdays-in-x-days [days]"),
+    "search-contacts": Command(search_contacts, BOOK, 1, None, False,
+                               "search-contacts [text] [--page N] [--limit K] [--after name]", True),
+    "query-contacts": Command(query_contacts, BOOK, 1, None, False,
+                              "query-contacts [field:value...] [--page N] [--limit K] [--after name]", True),
+    "explain-query": Command(explain_query, BOOK, 1, None, False, "explain-query [field:value...]"),
+    "delete-contact": Command(delete_contact, BOOK, 1, None, True, "delete-contact [name]"),
+    "find-duplicates": Command(find_duplicates, BOOK, 0, 0, False,
+                               "find-duplicates [--page N] [--limit K] [--after name]", True),
+    "merge-duplicates": Command(merge_duplicates, BOOK, 0, None, True, "merge-duplicates [number...]"),
+    "find-by-phone": Command(find_by_phone, BOOK, 1, 1, False, "find-by-phone [phone]"),
+    "shared-phones": Command(show_shared_phones, BOOK, 0, 0, False, "shared-phones"),
+    "import-contacts": Command(import_contacts_file, BOOK, 1, None, True, "import-contacts [file.csv|file.vcf]"),
+    "add-address": Command(add_address, BOOK, 2, None, True, "add-address [name] [address]"),
+    "show-address": Command(show_address, BOOK, 1, 1, False, "show-address [name]"),
+    "add-email": Command(add_email, BOOK, 2, 2, True, "add-email [name] [email]"),
+    "show-email": Command(show_email, BOOK, 1, 1, False, "show-email [name]"),
+    "change-address": Command(change_address, BOOK, 2, None, True, "change-address [name] [new address]"),
+    "change-email": Command(change_email, BOOK, 2, 2, True, "change-email [name] [new email]"),
+    # notebook commands
+    "add-note": Command(add_note, NOTEBOOK, 1, None, True, "add-note [title] [description]"),
+    "change-note": Command(change_note, NOTEBOOK, 1, None, True, "change-note [title] [new description]"),
+    "show-note": Command(show_note, NOTEBOOK, 1, 1, False, "show-note [title]"),
+    "all-notes": Command(show_all_notes, NOTEBOOK, 0, 0, False, "all-notes [--page N] [--limit K] [--after title]", True),
+    "delete-note": Command(delete_note, NOTEBOOK, 1, 1, True, "delete-note [title]"),
+    "search-notes": Command(search_notes, NOTEBOOK, 1, None, False,
+                            "search-notes [term] [OR term...] [--top N] [--page N] [--limit K]", True),
+    "add-tag": Command(add_tag, NOTEBOOK, 2, None, True, "add-tag [title] [tag...]"),
+    "remove-tag": Command(remove_tag, NOTEBOOK, 2, 2, True, "remove-tag [title] [tag]"),
+    "find-tags": Command(find_by_tags, NOTEBOOK, 1, None, False,
+                         "find-tags [tag] [OR tag] [NOT tag] [--page N] [--limit K] [--after title]", True),
+    "notes-by-tag": Command(show_notes_by_tag, NOTEBOOK, 0, 0, False, "notes-by-tag"),
+}
+
+def handler_command_names():
+    '''
+    Назви команд за іменами їхніх обробників для звітів статистики
+    '''
+    return {entry.handler.__name__: name for name, entry in COMMANDS.items()}
+
+
+# Команди, що змінюють книги і тому записуються в журнал
+MUTATING_COMMANDS = {name for name, entry in COMMANDS.items() if entry.mutates}
+# Команди, що читають зовнішній файл: журнал зберігає лише шлях до нього, тож одразу після
+# такої команди книги зберігаються, щоб відновлення не залежало від того, чи файл ще існує
+SNAPSHOT_COMMANDS = {"import-contacts"}
+
+COMMAND_TRIE = PrefixTrie(list(COMMANDS) + EXIT_COMMANDS)
+
+
+def resolve_command(command):
+    '''
+    Повертає повну назву команди за точною назвою чи однозначним скороченням
+    та повідомлення з підказками, якщо команду не впізнано
+    '''
+    if command in COMMANDS or command in EXIT_COMMANDS:
+        return command, None
+
+    depth, node = COMMAND_TRIE.longest_prefix(command)
+    if depth == len(command) and len(node.words) == 1:
+        return node.words[0], None
+
+    # Пропонуємо команди з найдовшим спільним префіксом
+    suggestions = node.words[:MAX_SUGGESTIONS] if depth else []
+    if suggestions:
+        return None, f"Command not recognized. Did you mean: {', '.join(suggestions)}?"
+    return None, "Command not recognized"
+
+
+def prepare_command(line):
+    '''
+    Розбирає рядок команди: повертає введену назву, повну назву команди
+    (None, якщо не впізнано), аргументи та повідомлення про помилку
+    '''
+    name, *args = parse_input(line)
+    command, error = resolve_command(name)
+    return name, command, args, error
+
+
+def run_command(command, args, book, notebook):
+    '''
+    Виконує команду та повертає відповідь бота: рядок або, для довгого виводу,
+    генератор частин рядка; None для невідомої команди
+    '''
+    entry = COMMANDS.get(command)
+    if entry is None:
+        return None
+
+    extra = ()
+    if entry.paged:
+        args, paging = parse_paging(command, args)
+        if isinstance(paging, str):
+            return paging
+        extra = (paging,)
+
+    if len(args) < entry.min_args:
+        return f"\nMissing arguments. Usage: {entry.usage}\n"
+    if entry.max_args is not None and len(args) > entry.max_args:
+        return f"\nToo many arguments. Usage: {entry.usage}\n"
+
+    if entry.target is None:
+        return entry.handler()
+    if entry.target == BOTH_BOOKS:
+        return entry.handler(book, notebook)
+    target = book if entry.target == BOOK else notebook
+    if entry.max_args == 0:
+        return entry.handler(target, *extra)
+    return entry.handler(args, target, *extra)
+
+
+def report_load_errors(path, errors, limit=10):
+    '''
+    Виводить помилки записів, пропущених під час завантаження файлу
+    '''
+    if not errors:
+        return
+    print(f"\n{len(errors)} record(s) in {path} could not be loaded:")
+    for error in errors[:limit]:
+        print(f"  {error}")
+    if len(errors) > limit:
+        print(f"  ... and {len(errors) - limit} more")
+
+
 def test_commands():
     address_book_path = "test_address_book.json"
     book = AddressBook()
-    book.load_address_book(address_book_path)
+    report_load_errors(address_book_path, book.load_address_book(address_book_path))
 
     note_book_path = "test_note_book.json"
     notebook = NotesBook()
-    notebook.load_notes(note_book_path)
+    report_load_errors(note_book_path, notebook.load_notes(note_book_path))
 
     commands = [
         "hello",
@@ -342,6 +950,8 @@ def test_commands():
         "change-birthday John 02.02.1991",
         "birthdays-in-x-days 30",
         "search-contacts John",
+        "find-by-phone 9876543210",
+        "shared-phones",
         "delete-contact John",
         "add-address John 123 Main St",
         "show-address John",
@@ -359,133 +969,332 @@ def test_commands():
 
     for command in commands:
         print(f"Testing command: {command}")
-        command, *args = parse_input(command)
-        if command == "exit":
+        _, command, args, error = prepare_command(command)
+        if error:
+            print(error)
+        elif command in EXIT_COMMANDS:
             book.save_address_book(address_book_path)
             notebook.save_notes(note_book_path)
             print(f"\nGood bye!\n")
             break
-        elif command == "hello":
-            print(hello_command())
-        elif command == "add-contact":
-            print(add_contact(args, book))
-        elif command == "change-phone":
-            print(change_contact(args, book))
-        elif command == "show-phone":
-            print(show_phone(args, book))
-        elif command == "all-contacts":
-            print(show_all_contacts(book))
-        elif command == "add-birthday":
-            print(add_birthday(args, book))
-        elif command == "show-birthday":
-            print(show_birthday(args, book))
-        elif command == "change-birthday":
-            print(change_birthday(args, book))
-        elif command == "birthdays-in-x-days":
-            print(show_birthdays_in_x_days(args, book))
-        elif command == "search-contacts":
-            print(search_contacts(args, book))
-        elif command == "delete-contact":
-            print(delete_contact(args, book))
-        elif command == "add-address":
-            print(add_address(args, book))
-        elif command == "show-address":
-            print(show_address(args, book))
-        elif command == "add-email":
-            print(add_email(args, book))
-        elif command == "show-email":
-            print(show_email(args, book))
-        elif command == "change-address":
-            print(change_address(args, book))
-        elif command == "change-email":
-            print(change_email(args, book))
-        elif command == "add-note":
-            print(add_note(args, notebook))
-        elif command == "change-note":
-            print(change_note(args, notebook))
-        elif command == "show-note":
-            print(show_note(args, notebook))
-        elif command == "all-notes":
-            print(show_all_notes(notebook))
-        elif command == "search-notes":
-            print(search_notes(args, notebook))
-
-
-def main():
+        else:
+            show_result(run_command(command, args, book, notebook))
+
+
+def applied_changes(book, notebook):
+    '''
+    Записи обох книг, змінені з попереднього виклику, у вигляді для журналу
+    '''
+    return {"contacts": book.take_changes(), "notes": notebook.take_changes()}
+
+
+def run_journaled(journal, command, args, book, notebook):
+    '''
+    Виконує зміну з журналом: команда записується до виконання, а змінені нею записи - після
+    '''
+    sequence = journal.append(command, args)
+    result = run_command(command, args, book, notebook)
+    journal.append_changes(sequence, applied_changes(book, notebook))
+    return result
+
+
+def replay_journal(journal, book, notebook):
+    '''
+    Відновлює зміни з журналу поверх останнього знімка книг
+    '''
+    replayed = 0
+    for command, args, changes in journal.replay():
+        if changes is None:
+            # Записів після зміни немає лише для останніх команд, які ще не могли потрапити у знімок
+            run_command(command, args, book, notebook)
+        else:
+            book.apply_changes(changes.get("contacts") or {})
+            notebook.apply_changes(changes.get("notes") or {})
+        replayed += 1
+    # Відновлені зміни вже є в журналі
+    applied_changes(book, notebook)
+    return replayed
+
+
+def compact_journal(journal, book, notebook, address_book_path, note_book_path):
+    '''
+    Згортає журнал у знімок: зберігає обидві книги та очищує журнал
+    '''
+    # Якщо збій станеться до очищення, журнал буде повторно застосовано до нового знімка.
+    # Команди відновлюються із записаних після них записів книг, а не виконуються знову,
+    # тож ці записи синхронізуються до того, як файли книг їх випередять
+    journal.sync()
+    book.save_address_book(address_book_path)
+    notebook.save_notes(note_book_path)
+    journal.truncate()
+
+
+def run_batch(lines, book, notebook, output, save, checkpoint=0):
+    '''
+    Виконує команди з файлу чи stdin без запрошення на введення.
+    Для кожної команди записує в output рядок JSON з результатом;
+    save викликається кожні checkpoint змін (0 - лише в кінці)
+    '''
+    changes = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        name, command, args, error = prepare_command(line)
+        if command in EXIT_COMMANDS:
+            break
+
+        result = error if error else result_text(run_command(command, args, book, notebook))
+        entry = {
+            "line": number,
+            "command": command or name,
+            "args": args,
+            "recognized": error is None,
+            "result": result.strip(),
+        }
+        output.write(json.dumps(entry, ensure_ascii=False))
+        output.write('\n')
+
+        if command in MUTATING_COMMANDS:
+            changes += 1
+            if checkpoint and changes % checkpoint == 0:
+                save()
+    save()
+
+
+def apply_command(books, command, args):
+    '''
+    Виконує команду над парою (адресна книга, нотатки)
+    '''
+    return run_command(command, args, *books)
+
+
+def prepare_books(books):
+    '''
+    Добудовує відкладені індекси пари книг, перш ніж її опублікувати для читачів
+    '''
+    for book in books:
+        book.prepare()
+
+
+def run_server(book, notebook, journal, host, port, compact, replicas=None, read_threads=0):
+    '''
+    Обслуговує книги через мережу, доки сервер не зупинять Ctrl+C.
+    З replicas читання виконуються в пулі з read_threads потоків над опублікованою копією книг
+    '''
+    if replicas is None:
+        def execute(command, args):
+            return result_text(run_command(command, args, book, notebook))
+
+        def applied():
+            return applied_changes(book, notebook)
+        write = None
+        read_pool = None
+    else:
+        def execute(command, args):
+            # Потоковий вивід збирається, поки читач ще тримає опубліковану копію
+            with replicas.read() as books:
+                return result_text(apply_command(books, command, args))
+        def applied():
+            return applied_changes(*replicas.unpublished())
+        write = replicas.write
+        read_pool = ThreadPoolExecutor(read_threads)
+
+    def after_writes(commands):
+        # Виконується в потоці письменника; одна публікація на пачку змін
+        if replicas is not None:
+            replicas.publish()
+            # Зміни, повторені на другій копії, вже записано в журнал з першої
+            applied_changes(*replicas.unpublished())
+        if journal is not None and (journal.needs_compaction()
+                                    or any(command in SNAPSHOT_COMMANDS for command, _ in commands)):
+            compact()
+
+    server = BookServer(prepare_command, execute, MUTATING_COMMANDS, EXIT_COMMANDS, journal, after_writes,
+                        write, read_pool, applied if journal is not None else None)
+
+    async def serve():
+        address, bound_port = await server.start(host, port)
+        print(f"\nServing the books on {address}:{bound_port}. Press Ctrl+C to stop.\n")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if read_pool is not None:
+            read_pool.shutdown()
+
+
+def create_books(storage, shards=0):
+    '''
+    Створює книги для вибраного сховища та повертає їх разом зі шляхами до файлів
+    '''
+    if storage == "sqlite":
+        return SQLiteAddressBook(), "address_book.db", SQLiteNotesBook(), "note_book.db"
+    if shards:
+        return ShardedAddressBook(shards), "address_book.json", ShardedNotesBook(shards), "note_book.json"
+    return AddressBook(), "address_book.json", NotesBook(), "note_book.json"
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Assistant bot for contacts and notes")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json",
+                        help="storage backend for the address book and notes")
+    parser.add_argument("--shards", type=int, default=0, metavar="N",
+                        help="split the JSON books into N files by a hash of the name and save only changed ones")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run commands from FILE ('-' for stdin) and print JSON Lines results")
+    parser.add_argument("--checkpoint", type=int, default=0, metavar="N",
+                        help="in batch mode, save the books after every N changes")
+    parser.add_argument("--stats", action="store_true",
+                        help="collect per-command call counts, latency and errors")
+    parser.add_argument("--stats-file", metavar="FILE",
+                        help="write collected statistics to FILE as JSON on exit (implies --stats)")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve the books to network clients as a JSON Lines API over TCP")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="address for --serve to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port for --serve to listen on")
+    parser.add_argument("--read-threads", type=int, default=0, metavar="N",
+                        help="with --serve, run reads in N threads over a second in-memory copy of the books")
+    parser.add_argument("--autosave-delay", type=float, default=AUTOSAVE_DELAY, metavar="SECONDS",
+                        help="in interactive mode, save changed records in the background after SECONDS "
+                             "without changes (0 disables)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     '''
     Головна функція, де знаходиться логіка бота
     '''
-    address_book_path = "address_book.json"
-    book = AddressBook()
-    book.load_address_book(address_book_path)
+    options = parse_arguments(argv)
+    if options.read_threads and options.storage != "json":
+        sys.exit("--read-threads is only supported with --storage json")
+    if options.shards and options.storage != "json":
+        sys.exit("--shards is only supported with --storage json")
+    STATS.enabled = options.stats or bool(options.stats_file)
+    book, address_book_path, notebook, note_book_path = create_books(options.storage, options.shards)
+    if options.storage == "json":
+        for path in (address_book_path, note_book_path):
+            try:
+                shards = stored_shard_count(path)
+            except ValueError as error:
+                sys.exit(str(error))
+            # Після розбиття звичайний файл книги більше не оновлюється
+            if shards and not options.shards:
+                sys.exit(f"{path} is split into {shards} shards; run with --shards {shards}")
+    report_load_errors(address_book_path, book.load_address_book(address_book_path))
+    report_load_errors(note_book_path, notebook.load_notes(note_book_path))
+
+    # SQLite фіксує кожну зміну сам, журнал потрібен лише для JSON
+    journal = None
+    if options.storage == "json":
+        journal = Journal(JOURNAL_PATH)
+        replayed = replay_journal(journal, book, notebook)
+        if replayed:
+            print(f"\nRestored {replayed} change(s) from {JOURNAL_PATH}.")
+
+    def save():
+        if journal is None:
+            book.save_address_book(address_book_path)
+            notebook.save_notes(note_book_path)
+        else:
+            compact_journal(journal, book, notebook, address_book_path, note_book_path)
 
-    note_book_path = "note_book.json"
-    notebook = NotesBook()
-    notebook.load_notes(note_book_path)
+    def close_books():
+        if journal is None:
+            book.save_address_book(address_book_path)
+            notebook.save_notes(note_book_path)
+        else:
+            # Усі зміни вже в журналі; знімок переписується лише після накопичення журналу
+            if journal.needs_compaction():
+                compact_journal(journal, book, notebook, address_book_path, note_book_path)
+            journal.close()
+        if options.stats_file:
+            STATS.dump(options.stats_file, handler_command_names())
+
+    if options.batch:
+        # Вивід буферизується великими блоками замість друку після кожної команди
+        output = open(sys.stdout.fileno(), 'w', encoding='utf-8', buffering=BATCH_BUFFER_SIZE, closefd=False)
+        source = sys.stdin if options.batch == "-" else open(options.batch, encoding='utf-8')
+        with output, source:
+            run_batch(source, book, notebook, output, save, options.checkpoint)
+        if journal is not None:
+            journal.close()
+        if options.stats_file:
+            STATS.dump(options.stats_file, handler_command_names())
+        return
+
+    if options.serve:
+        replicas = None
+        if options.read_threads:
+            # Друга копія книг для читачів; обидві проходять однакові завантаження та журнал
+            second_book, _, second_notebook, _ = create_books(options.storage, options.shards)
+            second_book.load_address_book(address_book_path)
+            second_notebook.load_notes(note_book_path)
+            replay_journal(journal, second_book, second_notebook)
+            replicas = LeftRight((book, notebook), (second_book, second_notebook), apply_command, prepare_books)
+        run_server(book, notebook, journal, options.host, options.port, save, replicas, options.read_threads)
+        close_books()
+        print(f"\nGood bye!\n")
+        return
+
+    # Фонове збереження замінює згортання журналу в інтерактивному режимі
+    autosaver = None
+    if journal is not None and options.autosave_delay > 0:
+        autosaver = Autosaver(journal, [(book, address_book_path), (notebook, note_book_path)], options.autosave_delay)
+        autosaver.start()
 
     print(f"\nWelcome to the assistant bot!\n")
 
     while True:
         # Отримання команди від користувача
         user_input = input("Enter a command: ")
-        command, *args = parse_input(user_input)  # Парсинг команди
-
-        # Перевірка команд та відповідна дія
-        # addressbook commands
-        if command == "hello":
-            print(hello_command())
-        elif command == "add-contact":
-            print(add_contact(args, book))
-        elif command == "change-phone":
-            print(change_contact(args, book))
-        elif command == "show-phone":
-            print(show_phone(args, book))
-        elif command == "all-contacts":
-            print(show_all_contacts(book))
-        elif command == "add-birthday":
-            print(add_birthday(args, book))
-        elif command == "show-birthday":
-            print(show_birthday(args, book))
-        elif command == "change-birthday":
-            print(change_birthday(args, book))
-        elif command == "birthdays-in-x-days":
-            print(show_birthdays_in_x_days(args, book))
-        elif command == "search-contacts":
-            print(search_contacts(args, book))
-        elif command == "delete-contact":
-            print(delete_contact(args, book))
-        elif command == "add-address":
-            print(add_address(args, book))
-        elif command == "show-address":
-            print(show_address(args, book))
-        elif command == "add-email":
-            print(add_email(args, book))
-        elif command == "show-email":
-            print(show_email(args, book))
-        elif command == "change-address":
-            print(change_address(args, book))
-        elif command == "change-email":
-            print(change_email(args, book))
-        # notebook commands
-        elif command == "add-note":
-            print(add_note(args, notebook))
-        elif command == "change-note":
-            print(change_note(args, notebook))
-        elif command == "show-note":
-            print(show_note(args, notebook))
-        elif command == "all-notes":
-            print(show_all_notes(notebook))
-        elif command == "delete-note":
-            print(delete_note(args, notebook))
-        elif command == "search-notes":
-            print(search_notes(args, notebook))
-        elif command in ["close", "exit"]:
-            book.save_address_book(address_book_path)
-            notebook.save_notes(note_book_path)
+        _, command, args, error = prepare_command(user_input)  # Парсинг команди та повна назва за скороченням
+        if error:
+            print(error)
+            continue
+
+        if command in EXIT_COMMANDS:
+            if autosaver is not None:
+                autosaver.stop()
+                # Фонове збереження пише лише JSON; знімки для швидкого запуску оновлюються тут
+                book.refresh_snapshot(address_book_path)
+                notebook.refresh_snapshot(note_book_path)
+            close_books()
             print(f"\nGood bye!\n")
             break  # Вихід
+
+        if autosaver is not None and command in MUTATING_COMMANDS:
+            # Фонове збереження не бачить книги посеред зміни
+            with autosaver.lock:
+                result = run_journaled(journal, command, args, book, notebook)
+            show_result(result)
+            if command in SNAPSHOT_COMMANDS:
+                try:
+                    autosaver.save()
+                except OSError as error:
+                    autosaver.error = error
+            else:
+                autosaver.notify()
         else:
-            print(f"Command not recognized")
+            # Перевірка команд та відповідна дія
+            if journal is not None and command in MUTATING_COMMANDS:
+                show_result(run_journaled(journal, command, args, book, notebook))
+            else:
+                show_result(run_command(command, args, book, notebook))
+
+            if journal is not None and (journal.needs_compaction() or command in SNAPSHOT_COMMANDS):
+                compact_journal(journal, book, notebook, address_book_path, note_book_path)
+
+        if autosaver is not None and autosaver.error is not None:
+            print(f"Autosave failed, changes are kept in {JOURNAL_PATH}: {autosaver.error}")
+            autosaver.error = None
 
 
 # Точка входу
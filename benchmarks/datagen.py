@@ -0,0 +1,92 @@
+'''
+Детермінований генератор контактів, нотаток і команд для бенчмарків
+'''
+from datetime import date, timedelta
+import random
+
+
+FIRST_NAMES = [
+    "Oleksandr", "Olena", "Andrii", "Iryna", "Dmytro", "Natalia", "Serhii", "Tetiana",
+    "Mykola", "Oksana", "Volodymyr", "Yulia", "Taras", "Kateryna", "Bohdan", "Sofiia",
+    "John", "Mary", "Ivan", "Anna", "Petro", "Maria", "Yurii", "Halyna",
+]
+LAST_NAMES = [
+    "Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Oliinyk",
+    "Shevchuk", "Polishchuk", "Boiko", "Melnyk", "Lysenko", "Moroz", "Marchenko", "Savchenko",
+]
+OPERATOR_CODES = ["050", "063", "066", "067", "068", "073", "093", "095", "096", "097", "098", "099"]
+EMAIL_DOMAINS = ["gmail.com", "ukr.net", "example.com", "i.ua", "outlook.com"]
+STREETS = ["Khreshchatyk", "Shevchenka", "Franka", "Sumska", "Deribasivska", "Lesi Ukrainky", "Soborna"]
+CITIES = ["Kyiv", "Lviv", "Kharkiv", "Odesa", "Dnipro", "Poltava", "Vinnytsia"]
+WORDS = (
+    "project meeting budget report deadline review client release design plan call "
+    "invoice contract sprint backlog retro demo roadmap feedback hiring onboarding "
+    "travel ticket hotel conference doctor dentist school birthday gift grocery milk "
+    "bread coffee repair car insurance tax bank transfer password backup server deploy"
+).split()
+
+FIRST_BIRTHDAY = date(1950, 1, 1)
+BIRTHDAY_SPAN_DAYS = 365 * 55
+
+
+def generate_contacts(count, seed=0):
+    '''
+    Повертає словники контактів у форматі save_address_book
+    '''
+    rng = random.Random(seed)
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        phones = [rng.choice(OPERATOR_CODES) + f"{rng.randrange(10_000_000):07d}"
+                  for _ in range(rng.choice((1, 1, 1, 2, 2, 3)))]
+        birthday = None
+        if rng.random() < 0.8:
+            birthday = (FIRST_BIRTHDAY + timedelta(days=rng.randrange(BIRTHDAY_SPAN_DAYS))).strftime('%d.%m.%Y')
+        email = None
+        if rng.random() < 0.7:
+            email = f"{first.lower()}.{last.lower()}{i}@{rng.choice(EMAIL_DOMAINS)}"
+        address = None
+        if rng.random() < 0.5:
+            address = f"{rng.choice(CITIES)}, {rng.choice(STREETS)} st. {rng.randrange(1, 200)}"
+        yield {
+            'name': f"{first}{last}{i}",
+            'phones': phones,
+            'birthday': birthday,
+            'address': address,
+            'email': email,
+        }
+
+
+def generate_notes(count, seed=0, words=(20, 200)):
+    '''
+    Повертає словники нотаток з довгими описами
+    '''
+    rng = random.Random(seed + 1)
+    for i in range(count):
+        length = rng.randint(*words)
+        yield {
+            'title': f"{rng.choice(WORDS)}-{i}",
+            'description': ' '.join(rng.choice(WORDS) for _ in range(length)),
+        }
+
+
+def generate_commands(count, contacts, seed=0):
+    '''
+    Повертає суміш команд читання й зміни для наскрізного виконання
+    '''
+    rng = random.Random(seed + 2)
+    names = [contact['name'] for contact in contacts]
+    for i in range(count):
+        name = rng.choice(names)
+        choice = rng.random()
+        if choice < 0.3:
+            yield f"show-phone {name}"
+        elif choice < 0.5:
+            yield f"search-contacts {name[:5].lower()}"
+        elif choice < 0.6:
+            yield f"search-notes {rng.choice(WORDS)}"
+        elif choice < 0.7:
+            yield f"birthdays-in-x-days {rng.randint(1, 30)}"
+        elif choice < 0.85:
+            yield f"add-contact New{i} {rng.choice(OPERATOR_CODES)}{rng.randrange(10_000_000):07d}"
+        else:
+            yield f"add-note bench-{i} {' '.join(rng.choice(WORDS) for _ in range(10))}"
@@ -0,0 +1,86 @@
+'''
+Навантажувальний клієнт для серверного режиму бота (python assistant_bot.py --serve).
+
+Відкриває --connections з'єднань, кожне надсилає свою частку --requests команд
+із синтетичної суміші читань і змін та чекає на відповідь перед наступним запитом.
+Виводить кількість запитів за секунду та перцентилі затримки.
+
+Запуск: python benchmarks/load_client.py --connections 50 --requests 100000 --contacts 10000 --populate
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'classes'))
+from command_stats import LatencyHistogram, PERCENTILES
+from server import DEFAULT_HOST, DEFAULT_PORT
+
+from datagen import generate_contacts, generate_commands
+
+
+async def run_connection(host, port, commands, histogram, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for number, command in enumerate(commands):
+            start = time.perf_counter()
+            writer.write(json.dumps({'id': number, 'command': command}).encode('utf-8') + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            histogram.record(time.perf_counter() - start)
+            if 'error' in response or not response['recognized']:
+                errors.append(response)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_load(host, port, commands, connections):
+    histogram = LatencyHistogram()
+    errors = []
+    # Команди розподіляються між з'єднаннями по колу
+    shares = [commands[i::connections] for i in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(host, port, share, histogram, errors) for share in shares if share))
+    return time.perf_counter() - start, histogram, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--contacts", type=int, default=1000,
+                        help="number of synthetic contact names the commands refer to")
+    parser.add_argument("--populate", action="store_true",
+                        help="add the synthetic contacts to the server book before the run")
+    parser.add_argument("--reads-only", action="store_true",
+                        help="drop commands that change the books from the mix")
+    options = parser.parse_args(argv)
+
+    contacts = list(generate_contacts(options.contacts))
+    if options.populate:
+        commands = [f"add-contact {contact['name']} {contact['phones'][0]}" for contact in contacts]
+        elapsed, _, _ = asyncio.run(run_load(options.host, options.port, commands, options.connections))
+        print(f"Populated {len(commands)} contacts in {elapsed:.2f} s")
+
+    commands = list(generate_commands(options.requests, contacts))
+    if options.reads_only:
+        commands = [command for command in commands if not command.startswith("add-")]
+
+    elapsed, histogram, errors = asyncio.run(run_load(options.host, options.port, commands, options.connections))
+    print(f"{len(commands)} requests over {options.connections} connections in {elapsed:.2f} s: "
+          f"{len(commands) / elapsed:,.0f} requests/s")
+    print("latency " + ", ".join(f"p{percent} {histogram.percentile(percent) * 1000:.3f} ms"
+                                 for percent in PERCENTILES)
+          + f", max {histogram.maximum * 1000:.3f} ms")
+    if errors:
+        print(f"{len(errors)} request(s) failed, first: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
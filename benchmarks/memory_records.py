@@ -0,0 +1,101 @@
+'''
+Порівняння пам'яті, яку займають контакти зі __slots__ та зі словниками атрибутів,
+а також адресна книга з тими самими контактами разом з її індексами
+
+Запуск: python benchmarks/memory_records.py --count 1000000
+'''
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes'))
+from classes import Record, Phone, Birthday
+from address_book import AddressBook
+
+from datagen import generate_contacts
+
+
+class LegacyField:
+    '''
+    Поле у попередньому вигляді: окремий об'єкт зі словником атрибутів
+    '''
+    def __init__(self, value):
+        self.value = value
+
+
+class LegacyRecord:
+    def __init__(self, name, phones, email, address, birthday):
+        self.name = LegacyField(name)
+        self.address = LegacyField(address) if address else None
+        self.email = LegacyField(email) if email else None
+        self.birthday = LegacyField(Birthday(birthday).value) if birthday else None
+        self.phones = [LegacyField(Phone(phone).value) for phone in phones]
+
+
+def generate_rows(count):
+    for contact in generate_contacts(count):
+        yield (contact['name'], contact['phones'], contact['email'], contact['address'], contact['birthday'])
+
+
+def build_slotted(rows):
+    records = []
+    for name, phones, email, address, birthday in rows:
+        record = Record(name, birthday=birthday)
+        if address:
+            record.add_address(address)
+        if email:
+            record.add_email(email)
+        for phone in phones:
+            record.add_phone(phone)
+        records.append(record)
+    return records
+
+
+def build_legacy(rows):
+    return [LegacyRecord(*row) for row in rows]
+
+
+def build_book(rows):
+    book = AddressBook()
+    book.add_records(build_slotted(rows))
+    book.prepare()
+    return book
+
+
+def measure(builder, rows):
+    '''
+    Пам'ять, яку додають побудовані записи, без урахування вхідних рядків
+    '''
+    gc.collect()
+    tracemalloc.start()
+    records = builder(rows)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    gc.collect()
+    return current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1_000_000, help="number of contacts")
+    options = parser.parse_args(argv)
+
+    rows = list(generate_rows(options.count))
+    legacy = measure(build_legacy, rows)
+    slotted = measure(build_slotted, rows)
+    book = measure(build_book, rows)
+
+    mb = 1024 * 1024
+    print(f"Contacts:            {options.count}")
+    print(f"__dict__ fields:     {legacy / mb:8.1f} MiB ({legacy / options.count:6.0f} B/contact)")
+    print(f"__slots__ fields:    {slotted / mb:8.1f} MiB ({slotted / options.count:6.0f} B/contact)")
+    print(f"Reduction:           {100 * (1 - slotted / legacy):8.1f} %")
+    print(f"AddressBook total:   {book / mb:8.1f} MiB ({book / options.count:6.0f} B/contact)")
+
+
+if __name__ == "__main__":
+    main()
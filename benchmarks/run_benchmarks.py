@@ -0,0 +1,199 @@
+'''
+Бенчмарки книг і команд бота на синтетичних даних.
+
+Для кожного масштабу генерує контакти й нотатки, вимірює час операцій (найкращий
+з --repeat запусків) та пікову пам'ять за tracemalloc (окремий запуск з того самого
+початкового стану) і записує результати в JSON для порівняння між ревізіями.
+
+Запуск: python benchmarks/run_benchmarks.py --scales 1000,100000,1000000 --output results.json
+'''
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'classes'))
+from address_book import AddressBook
+from note_book import NotesBook
+from snapshot import snapshot_path
+from storage import write_json_records
+from query_cache import next_generation
+import assistant_bot
+
+from datagen import generate_contacts, generate_notes, generate_commands
+
+
+SEARCH_QUERIES = ["shev", "olena", "067", "gmail", "kyiv", "1990"]
+NOTE_QUERIES = ["project", "deadline", "coffee", "server"]
+BIRTHDAY_WINDOWS = [1, 7, 30, 365]
+
+
+def measure(function, repeat, setup=None):
+    '''
+    Найкращий час з repeat запусків та пікова пам'ять окремого запуску під tracemalloc.
+    setup() перед кожним запуском відновлює початковий стан, який function змінює,
+    і не входить ні в час, ні в пам'ять
+    '''
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def uncached(book, function):
+    '''
+    Запускає function з порожнім кешем запитів: нове покоління книги скидає кеш,
+    тож кожен повтор вимірює сам пошук, а не читання з кешу
+    '''
+    def run():
+        book.generation = next_generation()
+        function()
+    return run
+
+
+def cached(function):
+    '''
+    Заповнює кеш запитів одним запуском, щоб далі вимірювати лише читання з кешу
+    '''
+    function()
+    return function
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(contacts_count, notes_count, commands_count, repeat, directory):
+    contacts = list(generate_contacts(contacts_count))
+    notes = list(generate_notes(notes_count))
+    book_path = os.path.join(directory, f"address_book_{contacts_count}.json")
+    notes_path = os.path.join(directory, f"note_book_{contacts_count}.json")
+    write_json_records(book_path, contacts)
+    write_json_records(notes_path, notes)
+
+    book = AddressBook()
+    notebook = NotesBook()
+    results = {}
+
+    def remove_snapshot():
+        # Знімок видаляється, щоб виміряти саме розбір JSON
+        if os.path.exists(snapshot_path(book_path)):
+            os.remove(snapshot_path(book_path))
+
+    def load_json():
+        book.load_address_book(book_path)
+
+    def load_snapshot():
+        book.load_address_book(book_path)
+
+    def save():
+        book.save_address_book(book_path)
+
+    def search():
+        for query in SEARCH_QUERIES:
+            book.search_contacts(query)
+
+    def birthdays():
+        for days in BIRTHDAY_WINDOWS:
+            book.get_birthdays_in_x_days(days)
+
+    def load_notes():
+        notebook.load_notes(notes_path)
+
+    def search_notes():
+        for query in NOTE_QUERIES:
+            notebook.search(query)
+
+    results["load_address_book_json"] = measure(load_json, 1, remove_snapshot)
+    results["save_address_book"] = measure(save, 1)
+    results["load_address_book_snapshot"] = measure(load_snapshot, 1)
+    results["search_contacts"] = measure(uncached(book, search), repeat)
+    results["search_contacts_cached"] = measure(cached(search), repeat)
+    results["get_birthdays_in_x_days"] = measure(uncached(book, birthdays), repeat)
+    results["load_notes"] = measure(load_notes, 1)
+    results["notes_search"] = measure(uncached(notebook, search_notes), repeat)
+    results["notes_search_cached"] = measure(cached(search_notes), repeat)
+
+    commands = list(generate_commands(commands_count, contacts))
+
+    def reload_books():
+        # Команди змінюють книги, тож кожен запуск починає з тих самих збережених файлів
+        book.load_address_book(book_path)
+        notebook.load_notes(notes_path)
+
+    def dispatch():
+        output = io.StringIO()
+        assistant_bot.run_batch(commands, book, notebook, output, save=lambda: None)
+
+    results["command_dispatch"] = measure(dispatch, 1, reload_books)
+
+    return [
+        {
+            "contacts": contacts_count,
+            "notes": notes_count,
+            "operation": operation,
+            "seconds": seconds,
+            "peak_bytes": peak,
+        }
+        for operation, (seconds, peak) in results.items()
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1000,100000,1000000",
+                        help="comma-separated numbers of contacts")
+    parser.add_argument("--notes-ratio", type=float, default=0.1,
+                        help="number of notes per contact")
+    parser.add_argument("--commands", type=int, default=10000,
+                        help="number of commands for the dispatch benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_results.json")
+    options = parser.parse_args(argv)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in (int(value) for value in options.scales.split(',')):
+            rows = run_scale(scale, int(scale * options.notes_ratio), options.commands, options.repeat, directory)
+            for row in rows:
+                print(f"{row['contacts']:>9} {row['operation']:<28} "
+                      f"{row['seconds'] * 1000:10.1f} ms {row['peak_bytes'] / 1024 / 1024:9.1f} MiB")
+            report["results"].extend(rows)
+
+    with open(options.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,126 +1,311 @@
-from classes import Record
-from datetime import datetime, timedelta
+from classes import Record, Phone
+from indexes import TrigramIndex, PhoneIndex, BirthdayIndex, NameIndex, SortedKeys, FUZZY_LIMIT, FUZZY_MAX_DISTANCE
+from storage import iter_json_records, write_json_records, SerializedRecords
+from query_cache import QueryCache, cached_query, next_generation
+from contact_query import run_query
+from dedupe import find_duplicate_groups, merge_groups
+from snapshot import KIND_CONTACTS, read_snapshot, write_snapshot, snapshot_is_fresh, snapshot_path, source_stamp
+from datetime import datetime, date
 import calendar
 from collections import defaultdict
 from collections import UserDict
-import json
 import os
 
 
+def group_birthdays(upcoming):
+    '''
+    Групує пари (ім'я, дата святкування), впорядковані за датою, за днями тижня
+    '''
+    birthdays = defaultdict(list)
+    for name, birthday_this_year in upcoming:
+        day_of_week = birthday_this_year.weekday()
+        day_name = calendar.day_name[day_of_week]
+
+        # Якщо припадає на вихідні, тоді переносимо на понеділок
+        if day_of_week in [5, 6]:
+            day_name = 'Monday'
+
+        birthdays[day_name].append((name, birthday_this_year))
+
+    return birthdays
+
+
+def iter_address_book(path, errors):
+    '''
+    Потоково читає записи адресної книги з JSON;
+    помилки записів, які не вдалося завантажити, додаються до errors
+    '''
+    for number, record_dict in iter_json_records(path, errors):
+        try:
+            record = Record.from_dict(record_dict)
+        except KeyError as e:
+            errors.append(f"Record {number}: missing field {e}")
+        except (TypeError, ValueError, AttributeError) as e:
+            errors.append(f"Record {number}: {e}")
+        else:
+            yield record
+
+
+def read_address_book(path, errors):
+    '''
+    Читає адресну книгу зі свіжого знімка або з JSON. Повертає пару (записи, індекс триграм);
+    індекс є лише у знімка, а записи JSON читаються потоково
+    '''
+    if not os.path.isfile(path):
+        return [], None
+
+    # Свіжий двійковий знімок завантажується без повторної валідації полів
+    snapshot = read_snapshot(snapshot_path(path), KIND_CONTACTS, source_stamp(path))
+    if snapshot is not None:
+        return snapshot
+    return iter_address_book(path, errors), None
+
+
 class AddressBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        self.query_cache = QueryCache()
+        self.generation = next_generation()
+        self.serialized = SerializedRecords('name')
+        self.create_indexes()
+        super().__init__(*args, **kwargs)
+
+
+    def create_indexes(self):
+        self.search_index = TrigramIndex()
+        self.phone_index = PhoneIndex()
+        self.birthday_index = BirthdayIndex()
+        self.name_index = NameIndex()
+        self.order_index = SortedKeys(lambda record: record.name.value)
+        self.indexes = [self.search_index, self.phone_index, self.birthday_index, self.name_index, self.order_index]
+
+
     def add_record(self, record):
         if isinstance(record, Record):
-            self.data[record.name.value] = record
+            self.generation = next_generation()
+            key = record.name.value
+            self.serialized.mark(key)
+            previous = self.data.get(key)
+            if previous is not None:
+                self.unindex_record(key)
+                previous.book = None
+            self.data[key] = record
+            record.book = self
+            for index in self.indexes:
+                index.add(record)
+
+
+    def add_records(self, records):
+        '''
+        Додає кілька записів за один прохід, наприклад після масового імпорту
+        '''
+        for record in records:
+            self.add_record(record)
+
+
+    def unindex_record(self, key):
+        for index in self.indexes:
+            index.remove(key)
+
+
+    def reindex_record(self, record):
+        '''
+        Оновлює індекси після зміни полів запису
+        '''
+        self.generation = next_generation()
+        key = record.name.value
+        if self.data.get(key) is record:
+            self.serialized.mark(key)
+            self.unindex_record(key)
+            for index in self.indexes:
+                index.add(record)
+
+
+    def prepare(self):
+        '''
+        Завершує відкладені вставки індексів, перш ніж копію книги побачать читачі.
+        Дерево імен, яке ще не будувалося, лишається лінивим до першого нечіткого пошуку
+        '''
+        self.birthday_index.flush()
+        self.order_index.flush()
+        if self.name_index.root is not None:
+            self.name_index.flush()
 
 
     def find(self, name):
         return self.data.get(name)
 
 
+    def iter_sorted(self, after=None, offset=0):
+        '''
+        Записи за зростанням імені, починаючи після імені after і пропустивши ще offset записів
+        '''
+        return (self.data[key] for key in self.order_index.keys_from(after, offset))
+
+
+    @cached_query()
     def search_contacts(self, search_string):
-        search_string = search_string.lower()
-        matching_records = []
-        for record in self.data.values():
-            if (
-                record.name and search_string in record.name.value.lower()
-                or (record.birthday and search_string in record.birthday.value.strftime("%d.%m.%Y"))
-            ):
-                matching_records.append(record)
+        keys = self.search_index.search(search_string, self.data)
+        return [self.data[key] for key in sorted(keys)]
+
+
+    @cached_query()
+    def query_contacts(self, terms):
+        '''
+        Запит за окремими полями (див. contact_query): записи за іменем разом зі статистикою плану
+        '''
+        return run_query(self, terms)
 
-            if record.phones:
-                for phone in record.phones:
-                    if search_string in phone.value:
-                        matching_records.append(record)
 
-            if record.email and search_string in record.email.value:
-                matching_records.append(record)
+    def find_similar(self, name, limit=FUZZY_LIMIT, max_distance=FUZZY_MAX_DISTANCE):
+        '''
+        Найближчі за відстанню редагування імена контактів, від найближчого
+        '''
+        return [self.data[key] for key in self.name_index.search(name, max_distance, limit)]
 
-            if record.address and search_string in record.address.value:
-                matching_records.append(record)
 
-        return matching_records
+    def find_by_phone(self, phone_number):
+        '''
+        Пошук власників номера телефону через індекс номерів
+        '''
+        phone = Phone(phone_number).value
+        return [self.data[key] for key in sorted(self.phone_index.find(phone))]
+
+
+    def find_shared_phones(self):
+        '''
+        Номери телефонів, записані у кількох контактів
+        '''
+        return self.phone_index.shared()
+
+
+    @cached_query()
+    def find_duplicates(self):
+        '''
+        Ймовірні дублікати контактів, знайдені порівнянням лише в межах блоків (див. dedupe)
+        '''
+        return find_duplicate_groups(self.data.values())
+
+
+    def merge_records(self, groups):
+        '''
+        Зливає групи дублікатів за один прохід
+        '''
+        return merge_groups(self, groups)
 
 
     def delete_record(self, name):
         if name in self.data:
-            del self.data[name]
+            self.generation = next_generation()
+            self.serialized.mark(name)
+            record = self.data.pop(name)
+            record.book = None
+            self.unindex_record(name)
+
+
+    def clear_records(self):
+        '''
+        Очищує книгу разом з індексами
+        '''
+        for record in self.data.values():
+            record.book = None
+        self.generation = next_generation()
+        self.serialized.reset()
+        self.data = {}
+        self.create_indexes()
 
 
+    @cached_query(key=lambda days: date.today())
     def get_birthdays_in_x_days(self, days):
         today = datetime.today().date()
-        target_date = today + timedelta(days=days)
-        birthdays = defaultdict(list)
-
-        for name, record in self.data.items():
-            if record.birthday:  # день народження
-                birthday_date = record.birthday.value.date()  # отримуємо об'єкт date
+        # Індекс повертає лише дні народження у межах проміжку, впорядковані за датою
+        return group_birthdays(self.birthday_index.upcoming(today, days))
 
-                # Створюємо об'єкт datetime дня народження цього року
-                birthday_this_year = birthday_date.replace(year=today.year)
 
-                # Якщо день народження вже був цього року, тоді перевіряємо наступний рік
-                if birthday_this_year < today:
-                    birthday_this_year = birthday_date.replace(
-                        year=today.year + 1)
+    def load_address_book(self, path):
+        '''
+        Потокове завантаження адресної книги з файлу.
+        Повертає список помилок записів, які не вдалося завантажити
+        '''
+        errors = []
+        self.fill(*read_address_book(path, errors))
+        if errors:
+            self.serialized.mark_all(self.data)
+        return errors
 
-                # Чи день народження через x днів
-                if today <= birthday_this_year <= target_date:
-                    day_of_week = birthday_this_year.weekday()
-                    day_name = calendar.day_name[day_of_week]
 
-                    # Якщо припадає на вихідні, тоді переносимо на понеділок
-                    if day_of_week in [5, 6]:
-                        day_name = 'Monday'
+    def fill(self, records, search_index=None):
+        '''
+        Замінює вміст книги завантаженими записами. Індекс триграм зі знімка вже містить
+        ці записи, тож заново будуються лише інші індекси
+        '''
+        self.clear_records()
+        if search_index is None:
+            self.add_records(records)
+        else:
+            indexes = [index for index in self.indexes if index is not self.search_index]
+            self.search_index = search_index
+            self.indexes = [search_index] + indexes
+            for record in records:
+                self.data[record.name.value] = record
+                record.book = self
+                for index in indexes:
+                    index.add(record)
+        # Завантажені записи вже є у файлі, тож фонове збереження їх не переписує
+        self.serialized.reset()
 
-                    birthdays[day_name].append(
-                        (record.name.value, birthday_this_year))
 
-        return birthdays
+    def serialize_changes(self, limit=None):
+        '''
+        Серіалізує записи, змінені з минулого фонового збереження; True, коли змін не лишилось
+        '''
+        return self.serialized.serialize(self.data, limit)
 
 
-    def load_address_book(self, path):
-        if not os.path.isfile(path):
-            self.data = {}
-            return
-        try:
-            with open(path, 'r', encoding='utf-8') as file:
-                records_list = json.load(file)
+    def take_changes(self):
+        '''
+        Записи, змінені з попереднього виклику, для журналу: ім'я -> словник запису
+        або None для видаленого
+        '''
+        return {key: self.data[key].to_dict() if key in self.data else None
+                for key in self.serialized.take_touched()}
 
-                for record_dict in records_list:
-                    name = record_dict['name']
-                    address = record_dict.get('address')
-                    email = record_dict.get('email')
-                    birthday = record_dict.get('birthday')
-                    phones = record_dict.get('phones', [])
 
-                    record = Record(name, birthday=birthday)
-                    if address:
-                        record.add_address(address)
-                    if email:
-                        record.add_email(email)
-                    for phone_number in phones:
-                        record.add_phone(phone_number)
+    def apply_changes(self, changes):
+        '''
+        Відновлює записи з журналу змін; повторне застосування тих самих змін нічого не змінює
+        '''
+        for name, record_dict in changes.items():
+            if record_dict is None:
+                self.delete_record(name)
+            else:
+                self.add_record(Record.from_dict(record_dict))
 
-                    self.add_record(record)
 
-        except json.decoder.JSONDecodeError:
-            self.data = {}
+    def autosave_files(self, path):
+        '''
+        Файли для фонового запису після serialize_changes: пари (файл, SerializedRecords)
+        '''
+        return [(path, self.serialized)]
 
 
     def save_address_book(self, filename):
         '''
         Зберігання адресної книги в файл
         '''
-        with open(filename, 'w') as file:
-            records_list = []
-            for record in self.data.values():
-                record_dict = {
-                    'name': record.name.value,
-                    'phones': [phone.value for phone in record.phones],
-                    'birthday': record.birthday.value.strftime('%d.%m.%Y') if record.birthday else None,
-                    'address': record.address.value if record.address else None,
-                    'email': record.email.value if record.email else None,
-                }
-                records_list.append(record_dict)
-
-            json.dump(records_list, file, ensure_ascii=False)
+        write_json_records(filename, (record.to_dict() for record in self.data.values()))
+        self.save_snapshot(filename)
+
+
+    def save_snapshot(self, filename):
+        '''
+        Записує двійковий знімок книги поруч із щойно збереженим JSON-файлом filename
+        '''
+        write_snapshot(snapshot_path(filename), KIND_CONTACTS, self.data, source_stamp(filename), self.search_index)
+
+
+    def refresh_snapshot(self, filename):
+        '''
+        Записує знімок, якщо його немає або він зроблений не з поточної версії filename
+        '''
+        if not snapshot_is_fresh(filename, KIND_CONTACTS):
+            self.save_snapshot(filename)
@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+# Скільки секунд без змін чекати перед фоновим збереженням
+AUTOSAVE_DELAY = 2.0
+# Найдовше очікування, якщо зміни йдуть безперервно
+AUTOSAVE_MAX_DELAY = 30.0
+# Скільки записів серіалізується за одне захоплення блокування
+SERIALIZE_CHUNK = 1000
+
+
+class Autosaver:
+    '''
+    Фонове збереження книг. Після кожної зміни бот викликає notify(); коли зміни на delay секунд
+    затихають (або минає max_delay від першої незбереженої), потік серіалізує лише змінені записи
+    невеликими частинами, щоразу ненадовго беручи lock, відкладає журнал і записує файли
+    вже без блокування. Бот тримає lock, поки виконує команду, що змінює книги.
+    Двійкові знімки потребують усієї книги, тож їх оновлює бот під час виходу (refresh_snapshot)
+    '''
+    def __init__(self, journal, books, delay=AUTOSAVE_DELAY, max_delay=AUTOSAVE_MAX_DELAY):
+        self.journal = journal
+        # Пари (книга, шлях до її файлу)
+        self.books = books
+        self.delay = delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        # Збереження з потоку та синхронне з бота не перекривають одне одного
+        self.saving = threading.Lock()
+        self.changed = threading.Condition()
+        self.pending = False
+        self.first_change = 0
+        self.last_change = 0
+        self.stopping = False
+        self.saves = 0
+        # Помилка останнього фонового збереження, доки бот її не показав
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="autosave", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def notify(self):
+        with self.changed:
+            now = time.monotonic()
+            if not self.pending:
+                self.pending = True
+                self.first_change = now
+            self.last_change = now
+            self.changed.notify()
+
+    def run(self):
+        while self.wait_for_changes():
+            try:
+                self.save()
+            except OSError as error:
+                # Журнал не видалено, тож зміни не втрачено; наступне збереження спробує знову
+                self.error = error
+
+    def wait_for_changes(self):
+        '''
+        Чекає, доки з'являться зміни і минуть затримки; False, якщо збереження зупинено
+        '''
+        with self.changed:
+            while not self.stopping:
+                if not self.pending:
+                    self.changed.wait()
+                    continue
+                deadline = min(self.last_change + self.delay, self.first_change + self.max_delay)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.pending = False
+                    return True
+                self.changed.wait(remaining)
+            return False
+
+    def save(self):
+        '''
+        Записує зміни, накопичені з минулого збереження. Журнал відкладається в ту саму мить,
+        коли захоплено вміст файлів, тож після збою його записи повторюються поверх цих файлів.
+        Бот може викликати save() і сам, коли зміни треба записати негайно
+        '''
+        with self.saving:
+            while True:
+                with self.lock:
+                    if all([book.serialize_changes(SERIALIZE_CHUNK) for book, _ in self.books]):
+                        files = [(path, serialized, serialized.snapshot()) for book, book_path in self.books
+                                 for path, serialized in book.autosave_files(book_path)]
+                        self.journal.rotate()
+                        break
+            for path, serialized, changes in files:
+                serialized.write(path, changes)
+            self.journal.discard_rotated()
+            self.saves += 1
+
+    def stop(self):
+        '''
+        Зупиняє потік і синхронно записує зміни, що ще не збережені
+        '''
+        with self.changed:
+            self.stopping = True
+            self.changed.notify()
+        self.thread.join()
+        if self.journal.has_entries():
+            self.save()
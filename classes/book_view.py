@@ -0,0 +1,28 @@
+from collections.abc import Mapping
+
+
+class BookView(Mapping):
+    '''
+    Подання книги у вигляді словника, що на вимогу читає записи через методи самої книги
+    (з бази даних SQLite чи з шардів)
+    '''
+    def __init__(self, book):
+        self.book = book
+
+    def __getitem__(self, key):
+        item = self.book.find(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def __iter__(self):
+        return self.book.keys()
+
+    def __len__(self):
+        return len(self.book)
+
+    def __contains__(self, key):
+        return self.book.find(key) is not None
+
+    def values(self):
+        return self.book.values()
@@ -0,0 +1,223 @@
+'''
+Масовий імпорт контактів з CSV та vCard.
+
+Рядки файлу читаються частинами, кожна частина перевіряється правилами полів
+з classes.py в окремому процесі, а перевірені контакти додаються до книги одним
+проходом. Рядки з помилками не зупиняють імпорт, а потрапляють у звіт.
+'''
+from classes import Record
+from validators import normalize_phones_many, validate_emails_many, parse_birthdays_many
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import chain, islice
+import csv
+import os
+
+
+CHUNK_SIZE = 5000
+
+# Менші файли перевіряються в поточному процесі: запуск пулу коштує дорожче
+MIN_PARALLEL_ROWS = 20000
+
+CSV_PHONE_SEPARATORS = ';,'
+
+
+def read_csv_rows(path):
+    '''
+    Повертає пари (номер рядка, словник контакту) з CSV з колонками
+    name, phones (або phone), email, birthday, address
+    '''
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+            phones = row.get('phones') or row.get('phone') or ''
+            for separator in CSV_PHONE_SEPARATORS:
+                phones = phones.replace(separator, ' ')
+            yield reader.line_num, {
+                'name': row.get('name', ''),
+                'phones': phones.split(),
+                'email': row.get('email') or None,
+                'birthday': row.get('birthday') or None,
+                'address': row.get('address') or None,
+            }
+
+
+def _unfold_vcard_lines(file):
+    # Рядок, що починається з пробілу чи табуляції, продовжує попередній (RFC 6350)
+    number, current = 0, None
+    for line_number, line in enumerate(file, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        number, current = line_number, line
+    if current is not None:
+        yield number, current
+
+
+def _vcard_birthday(value):
+    # BDAY у vCard має вигляд YYYY-MM-DD або YYYYMMDD
+    digits = value.replace('-', '')
+    if len(digits) == 8 and digits.isdigit():
+        return f"{digits[6:8]}.{digits[4:6]}.{digits[0:4]}"
+    return value
+
+
+def read_vcard_rows(path):
+    '''
+    Повертає пари (номер рядка BEGIN:VCARD, словник контакту) з файлу vCard
+    '''
+    card = None
+    with open(path, encoding='utf-8-sig') as file:
+        for number, line in _unfold_vcard_lines(file):
+            prop, _, value = line.partition(':')
+            name = prop.split(';', 1)[0].strip().upper()
+            if name == 'BEGIN' and value.strip().upper() == 'VCARD':
+                card = (number, {'name': '', 'phones': [], 'email': None, 'birthday': None, 'address': None})
+            elif card is None:
+                continue
+            elif name == 'END':
+                yield card
+                card = None
+            elif name == 'FN':
+                card[1]['name'] = value.strip()
+            elif name == 'TEL':
+                card[1]['phones'].append(value.strip())
+            elif name == 'EMAIL' and not card[1]['email']:
+                card[1]['email'] = value.strip()
+            elif name == 'BDAY':
+                card[1]['birthday'] = _vcard_birthday(value.strip())
+            elif name == 'ADR' and not card[1]['address']:
+                parts = [part.strip() for part in value.split(';') if part.strip()]
+                card[1]['address'] = ', '.join(parts) or None
+
+
+def read_rows(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.vcf', '.vcard'):
+        return read_vcard_rows(path)
+    return read_csv_rows(path)
+
+
+def _validate_column(values, validate_batch):
+    '''
+    Перевіряє присутні значення колонки одним пакетом; повертає значення та помилки за позицією рядка
+    '''
+    positions = [position for position, value in enumerate(values) if value]
+    results, errors = validate_batch([values[position] for position in positions])
+    column = [None] * len(values)
+    for position, result in zip(positions, results):
+        column[position] = result
+    return column, {positions[index]: message for index, message in errors}
+
+
+def validate_chunk(rows):
+    '''
+    Перевіряє частину рядків і повертає нормалізовані значення полів та помилки.
+    Кожна колонка перевіряється пакетно; виконується в процесах пулу,
+    тому повертає лише прості значення
+    '''
+    birthdays, birthday_errors = _validate_column([row.get('birthday') for _, row in rows], parse_birthdays_many)
+    emails, email_errors = _validate_column([row.get('email') for _, row in rows], validate_emails_many)
+
+    flat_phones, owners = [], []
+    for position, (_, row) in enumerate(rows):
+        for phone in row.get('phones') or []:
+            flat_phones.append(phone)
+            owners.append(position)
+    phone_values, phone_errors = normalize_phones_many(flat_phones)
+    phones = [[] for _ in rows]
+    for owner, phone in zip(owners, phone_values):
+        phones[owner].append(phone)
+    phone_errors = {owners[index]: message for index, message in reversed(phone_errors)}
+
+    valid, errors = [], []
+    for position, (number, row) in enumerate(rows):
+        # Порядок перевірок такий самий, як у Record.from_dict
+        if not row.get('name'):
+            error = "Name is missing"
+        else:
+            error = birthday_errors.get(position) or email_errors.get(position) or phone_errors.get(position)
+        if error:
+            errors.append((number, error))
+            continue
+        valid.append((row['name'], phones[position], birthdays[position], row.get('address') or None, emails[position]))
+    return valid, errors
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_rows(rows, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Перевіряє рядки частинами; великі файли - у пулі процесів
+    '''
+    chunks = _chunks(rows, chunk_size)
+    workers = workers or os.cpu_count() or 1
+
+    # Читаємо початок файлу, щоб вирішити, чи варто запускати пул
+    head, head_rows = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        head_rows += len(chunk)
+        if head_rows >= MIN_PARALLEL_ROWS:
+            break
+    if head_rows < MIN_PARALLEL_ROWS or workers == 1:
+        for chunk in chain(head, chunks):
+            yield validate_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Обмежуємо кількість частин у роботі, щоб не читати весь файл у пам'ять
+        in_flight = deque()
+        for chunk in chain(head, chunks):
+            in_flight.append(executor.submit(validate_chunk, chunk))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def import_contacts(path, book, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Імпортує контакти з CSV чи vCard у книгу.
+    Повертає кількість імпортованих контактів і список помилок (номер рядка, повідомлення)
+    '''
+    merged = {}
+    errors = []
+    for valid, chunk_errors in validate_rows(read_rows(path), workers, chunk_size):
+        errors.extend(chunk_errors)
+        for name, phones, birthday, address, email in valid:
+            record = Record.restore(name, phones, birthday=birthday, address=address, email=email)
+            if name in merged:
+                merged[name].merge(record)
+            else:
+                merged[name] = record
+
+    # Наявні контакти доповнюються, нові додаються до книги одним проходом
+    new_records = []
+    for name, record in merged.items():
+        existing = book.find(name)
+        if existing is not None:
+            existing.merge(record)
+        else:
+            new_records.append(record)
+    book.add_records(new_records)
+
+    errors.sort()
+    return len(merged), errors
+
+
+def write_error_report(path, errors):
+    with open(path, 'w', encoding='utf-8') as file:
+        for number, message in errors:
+            file.write(f"Row {number}: {message}\n")
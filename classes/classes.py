@@ -1,80 +1,118 @@
-from datetime import datetime
-import re
+from functools import wraps
+from validators import normalize_phone, validate_email, parse_birthday, normalize_tag
+
+
+def reindex(method):
+    '''
+    Оновлює індекси книги, якій належить запис, після його зміни
+    '''
+    @wraps(method)
+    def inner(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if self.book is not None:
+            self.book.reindex_record(self)
+        return result
+    return inner
 
 
 class Field:
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
+    @classmethod
+    def trusted(cls, value):
+        '''
+        Створює поле з уже перевіреного й нормалізованого значення без повторної валідації
+        '''
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
     def __str__(self):
         return str(self.value)
 
 
 class Name(Field):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
 
 class Address(Field):
+    __slots__ = ()
+
     def __init__(self, address):
         super().__init__(address)
 
 
 class Email(Field):
+    __slots__ = ()
+
     def __init__(self, email):
-        # Регулярний вираз для парсингу email
-        pattern = r'[a-zA-Z][a-zA-Z0-9_.]{1,}@[a-zA-Z]+\.[a-zA-Z]{2,}'
-        if not re.findall(pattern, email):
-            raise ValueError("Email is not valid")
-        super().__init__(email)
+        super().__init__(validate_email(email))
 
 
 class Phone(Field):
-    def __init__(self, phone):
-        cleaned_number = re.sub(r'[^0-9]', '', phone)
-        if not (len(cleaned_number) == 10 and cleaned_number.isdigit()):
-            raise ValueError("Phone number must be 10 digits long")
+    __slots__ = ()
 
-        super().__init__(cleaned_number)
+    def __init__(self, phone):
+        super().__init__(normalize_phone(phone))
 
 
 class Birthday(Field):
-    def __init__(self, birthday):
-        try:
-            date = datetime.strptime(birthday, '%d.%m.%Y')
-        except ValueError:
-            raise ValueError("Birthday must be in the format DD.MM.YYYY")
+    __slots__ = ()
 
-        super().__init__(date)
+    def __init__(self, birthday):
+        super().__init__(parse_birthday(birthday))
 
 
 class Title(Field):
+    __slots__ = ()
+
     def __init__(self, title):
         super().__init__(title)
 
 
 class Description(Field):
+    __slots__ = ()
+
     def __init__(self, description):
         super().__init__(description)
 
 
+class Tag(Field):
+    __slots__ = ()
+
+    def __init__(self, tag):
+        super().__init__(normalize_tag(tag))
+
+
 class Record:
+    __slots__ = ('name', 'address', 'email', 'birthday', 'phones', 'book')
+
     def __init__(self, name, birthday=None):
         self.name = Name(name)
         self.address = None
         self.email = None
         self.birthday = Birthday(birthday) if birthday else None
         self.phones = []
+        # Книга, що індексує запис; встановлюється в AddressBook.add_record
+        self.book = None
 
+    @reindex
     def add_phone(self, phone_number):
         phone = Phone(phone_number)
         self.phones.append(phone)
 
+    @reindex
     def change_phone(self, old_number, new_number):
-        phone = Phone(new_number)
+        new_phone = Phone(new_number)
         phone = self.find_phone(old_number)
         if phone:
-            phone.value = new_number
+            phone.value = new_phone.value
             return True
         return False
 
@@ -84,9 +122,11 @@ class Record:
                 return phone
         return None
     
+    @reindex
     def add_address(self, address):
         self.address = Address(address)
 
+    @reindex
     def change_address(self, new_address):
         if self.address:
             try:
@@ -97,9 +137,11 @@ class Record:
                 return str(e)
         return "Address not found."
 
+    @reindex
     def add_email(self, email):
         self.email = Email(email)
 
+    @reindex
     def change_email(self, new_email):
         if self.email:
             try:
@@ -110,9 +152,11 @@ class Record:
                 return str(e)
         return "Email not found."
 
+    @reindex
     def add_birthday(self, birthday):
         self.birthday = Birthday(birthday)
 
+    @reindex
     def change_birthday(self, new_birthday):
         try:
             new_birthday = Birthday(new_birthday)
@@ -121,6 +165,63 @@ class Record:
         except ValueError as e:
             return str(e)
 
+    @reindex
+    def merge(self, other):
+        '''
+        Доповнює запис даними іншого: додає нові телефони та заповнює відсутні поля
+        '''
+        known_phones = {phone.value for phone in self.phones}
+        for phone in other.phones:
+            if phone.value not in known_phones:
+                self.phones.append(phone)
+                known_phones.add(phone.value)
+        if other.birthday and not self.birthday:
+            self.birthday = other.birthday
+        if other.address and not self.address:
+            self.address = other.address
+        if other.email and not self.email:
+            self.email = other.email
+
+    def to_dict(self):
+        '''
+        Подання запису для збереження у файл
+        '''
+        return {
+            'name': self.name.value,
+            'phones': [phone.value for phone in self.phones],
+            'birthday': self.birthday.value.strftime('%d.%m.%Y') if self.birthday else None,
+            'address': self.address.value if self.address else None,
+            'email': self.email.value if self.email else None,
+        }
+
+    @classmethod
+    def from_dict(cls, record_dict):
+        '''
+        Відновлює запис зі словника, збереженого у файлі
+        '''
+        record = cls(record_dict['name'], birthday=record_dict.get('birthday'))
+        if record_dict.get('address'):
+            record.add_address(record_dict['address'])
+        if record_dict.get('email'):
+            record.add_email(record_dict['email'])
+        for phone_number in record_dict.get('phones') or []:
+            record.add_phone(phone_number)
+        return record
+
+    @classmethod
+    def restore(cls, name, phones, birthday=None, address=None, email=None):
+        '''
+        Відновлює запис з уже нормалізованих значень, наприклад з двійкового знімка
+        '''
+        record = cls.__new__(cls)
+        record.name = Name.trusted(name)
+        record.phones = [Phone.trusted(phone) for phone in phones]
+        record.birthday = Birthday.trusted(birthday) if birthday else None
+        record.address = Address.trusted(address) if address else None
+        record.email = Email.trusted(email) if email else None
+        record.book = None
+        return record
+
     def __str__(self):
         details = [f"Contact name: {self.name.value}"]
         if self.phones:
@@ -136,15 +237,63 @@ class Record:
     
 
 class Note:
-    def __init__(self, title, description):
+    __slots__ = ('title', 'description', 'tags', 'book')
+
+    def __init__(self, title, description, tags=()):
         self.title = Title(title)
         self.description = Description(description)
-    
+        self.tags = []
+        for tag in tags:
+            self._add_tag(Tag(tag))
+        # Книга, що зберігає нотатку й оновлюється після її зміни
+        self.book = None
+
+    def to_dict(self):
+        return {
+            'title': self.title.value if self.title else None,
+            'description': self.description.value if self.description else None,
+            'tags': [tag.value for tag in self.tags],
+        }
+
+    @classmethod
+    def from_dict(cls, note_dict):
+        return cls(note_dict['title'], note_dict.get('description') or '', note_dict.get('tags') or ())
+
     def __str__(self):
         details = [f"Note title: {self.title.value}, Description: {self.description.value}"]
+        if self.tags:
+            details.append(f"Tags: {', '.join(map(str, self.tags))}")
     
         return '\n'.join(details)
 
+    def _add_tag(self, tag):
+        if self.find_tag(tag.value) is None:
+            self.tags.append(tag)
+            return True
+        return False
+
+    def find_tag(self, tag):
+        for known in self.tags:
+            if known.value == tag:
+                return known
+        return None
+
+    @reindex
+    def add_tags(self, tags):
+        '''
+        Додає теги, яких ще немає; повертає кількість доданих
+        '''
+        return sum(self._add_tag(tag) for tag in [Tag(tag) for tag in tags])
+
+    @reindex
+    def remove_tag(self, tag):
+        known = self.find_tag(Tag(tag).value)
+        if known is None:
+            return False
+        self.tags.remove(known)
+        return True
+
+    @reindex
     def change_note(self, new_description):
         new_description = Description(new_description)
         self.description.value = new_description.value
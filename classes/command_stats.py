@@ -0,0 +1,96 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+import json
+
+
+# Межі кошиків гістограми затримок: від 1 мкс до ~100 с з кроком 2^(1/4)
+BUCKET_BOUNDS = [1e-6 * 2 ** (step / 4) for step in range(4 * 27)]
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    '''
+    Гістограма затримок з логарифмічними кошиками; похибка перцентилів до ~19%
+    '''
+    __slots__ = ('counts', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, percent):
+        count = sum(self.counts)
+        if not count:
+            return 0.0
+        rank = percent / 100 * count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                # Верхня межа кошика, але не більше за найбільше значення
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.maximum
+                return min(bound, self.maximum)
+        return self.maximum
+
+
+class CommandStats:
+    '''
+    Лічильники викликів, гістограми затримок і винятки для обробників команд.
+    Поки збір вимкнено, input_error лише перевіряє прапорець enabled
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()
+        self.latency = defaultdict(LatencyHistogram)
+        self.errors = defaultdict(Counter)
+
+    def record(self, name, seconds, error=None):
+        self.calls[name] += 1
+        self.latency[name].record(seconds)
+        if error is not None:
+            self.errors[name][type(error).__name__] += 1
+
+    def to_dict(self, names=None):
+        '''
+        Статистика за командами; names перейменовує обробники на назви команд
+        '''
+        names = names or {}
+        result = {}
+        for handler, calls in self.calls.most_common():
+            histogram = self.latency[handler]
+            result[names.get(handler, handler)] = {
+                'calls': calls,
+                'mean_ms': histogram.total / calls * 1000,
+                **{f'p{percent}_ms': histogram.percentile(percent) * 1000 for percent in PERCENTILES},
+                'max_ms': histogram.maximum * 1000,
+                'errors': dict(self.errors.get(handler, {})),
+            }
+        return result
+
+    def report(self, names=None):
+        rows = self.to_dict(names)
+        if not rows:
+            return "No commands recorded yet."
+        lines = [f"{'command':<22}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  errors"]
+        for name, row in rows.items():
+            errors = ', '.join(f"{error}: {count}" for error, count in row['errors'].items())
+            lines.append(f"{name:<22}{row['calls']:>8}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+                         f"{row['p99_ms']:>10.3f}{row['max_ms']:>10.3f}  {errors}")
+        return '\n'.join(lines)
+
+    def dump(self, path, names=None):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(names), file, indent=2)
+
+
+STATS = CommandStats()
@@ -0,0 +1,243 @@
+'''
+Мова запитів до контактів за окремими полями.
+
+Запит - слова через пробіл, кожне має збігтися (AND):
+    name:^Ol         ім'я починається з "ol" (^ - початок, $ - кінець значення)
+    phone:067        номер містить цифри 067; 10 цифр - точний номер
+    email:@example.com, address:kyiv
+    bday:03..05      день народження в березні-травні; також bday:03, bday:15.03,
+                     bday:25.12..10.01, bday:15.03.1990 та bday:1990
+    слово без поля   шукається в усіх полях, як у search-contacts
+Регістр літер не враховується.
+
+Планувальник оцінює, скільки кандидатів дасть кожен доступний індекс (номерів, днів
+народження чи триграм), бере найвибірковіший і перевіряє решту умов лише на його кандидатах.
+'''
+from collections import namedtuple
+from datetime import date
+import calendar
+import re
+
+from indexes import FIELD_SEPARATOR, LEAP_YEAR, birthday_key, searchable_text
+from validators import PHONE_LENGTH
+
+
+class QueryError(ValueError):
+    pass
+
+
+YEAR_PATTERN = re.compile(r'\d{4}')
+DATE_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+DAY_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})')
+MONTH_PATTERN = re.compile(r'\d{1,2}')
+
+TEXT_FIELDS = ('name', 'phone', 'email', 'address')
+BIRTHDAY_FIELDS = ('bday', 'birthday')
+# Останній день року в ключах днів народження (31 грудня високосного року)
+LAST_KEY = 366
+
+# Триграмний індекс допомагає лише для підрядків від трьох символів
+MIN_TRIGRAM_QUERY = 3
+
+SCAN = 'scan'
+FILTER = 'filter'
+
+
+def field_values(record, field):
+    if field == 'name':
+        return [record.name.value.lower()]
+    if field == 'phone':
+        return [phone.value for phone in record.phones]
+    if field == 'email':
+        return [record.email.value.lower()] if record.email else []
+    if field == 'address':
+        return [record.address.value.lower()] if record.address else []
+    return searchable_text(record).split(FIELD_SEPARATOR)
+
+
+class TextTerm(namedtuple('TextTerm', ['source', 'field', 'text', 'prefix', 'suffix'])):
+    '''
+    Умова на текстове поле; field None - будь-яке поле
+    '''
+    __slots__ = ()
+
+    def matches(self, record):
+        for value in field_values(record, self.field):
+            if self.prefix and self.suffix:
+                if value == self.text:
+                    return True
+            elif self.prefix:
+                if value.startswith(self.text):
+                    return True
+            elif self.suffix:
+                if value.endswith(self.text):
+                    return True
+            elif self.text in value:
+                return True
+        return False
+
+
+class BirthdayTerm(namedtuple('BirthdayTerm', ['source', 'ranges', 'year'])):
+    '''
+    Умова на день народження: діапазони ключів днів року та, за потреби, рік
+    '''
+    __slots__ = ()
+
+    def matches(self, record):
+        if not record.birthday:
+            return False
+        value = record.birthday.value
+        if self.year is not None and value.year != self.year:
+            return False
+        if not self.ranges:
+            return True
+        key = birthday_key(value.month, value.day)
+        return any(low <= key <= high for low, high in self.ranges)
+
+
+def parse_text_term(source, field, value):
+    prefix = value.startswith('^')
+    suffix = len(value) > prefix and value.endswith('$')
+    text = value[prefix:len(value) - suffix].lower()
+    if field == 'phone':
+        text = re.sub(r'[^0-9]', '', text)
+    if not text:
+        raise QueryError(f"Empty value in '{source}'")
+    return TextTerm(source, field, text, prefix, suffix)
+
+
+def day_key(month, day, source):
+    try:
+        date(LEAP_YEAR, month, day)
+    except ValueError:
+        raise QueryError(f"Invalid date in '{source}'")
+    return birthday_key(month, day)
+
+
+def bound_keys(bound, source):
+    '''
+    Перший та останній ключ дня для межі діапазону: місяця MM або дня DD.MM
+    '''
+    match = DAY_PATTERN.fullmatch(bound)
+    if match:
+        key = day_key(int(match[2]), int(match[1]), source)
+        return key, key
+    if MONTH_PATTERN.fullmatch(bound):
+        month = int(bound)
+        if not 1 <= month <= 12:
+            raise QueryError(f"Invalid month in '{source}'")
+        return birthday_key(month, 1), birthday_key(month, calendar.monthrange(LEAP_YEAR, month)[1])
+    raise QueryError(f"Birthday query must be MM, DD.MM, a range of them or DD.MM.YYYY: '{source}'")
+
+
+def parse_birthday_term(source, value):
+    if YEAR_PATTERN.fullmatch(value):
+        return BirthdayTerm(source, (), int(value))
+    match = DATE_PATTERN.fullmatch(value)
+    if match:
+        key = day_key(int(match[2]), int(match[1]), source)
+        return BirthdayTerm(source, ((key, key),), int(match[3]))
+
+    first, separator, last = value.partition('..')
+    low = bound_keys(first, source)[0]
+    high = bound_keys(last if separator else first, source)[1]
+    if low <= high:
+        return BirthdayTerm(source, ((low, high),), None)
+    # Діапазон через кінець року, наприклад 25.12..10.01
+    return BirthdayTerm(source, ((low, LAST_KEY), (1, high)), None)
+
+
+def parse_query(words):
+    '''
+    Перетворює слова запиту на кортеж умов; некоректний запит спричиняє QueryError
+    '''
+    terms = []
+    for word in words:
+        field, separator, value = word.partition(':')
+        field = field.lower()
+        if not separator or not field.isalpha():
+            terms.append(parse_text_term(word, None, word))
+        elif field in TEXT_FIELDS:
+            terms.append(parse_text_term(word, field, value))
+        elif field in BIRTHDAY_FIELDS:
+            terms.append(parse_birthday_term(word, value))
+        else:
+            raise QueryError(f"Unknown field '{field}'. Fields: {', '.join(TEXT_FIELDS + BIRTHDAY_FIELDS[:1])}")
+    if not terms:
+        raise QueryError("Empty query")
+    return tuple(terms)
+
+
+# Як умову може обслужити індекс: назва індексу, оцінка кількості кандидатів
+# та функція, що повертає ключі кандидатів
+Access = namedtuple('Access', ['index', 'estimate', 'fetch'])
+
+# План однієї умови для explain: chosen - скільки разів (у скількох шардах) її індекс обрано
+TermPlan = namedtuple('TermPlan', ['source', 'index', 'estimate', 'chosen'])
+
+# Результат запиту: записи за іменем та статистика для explain.
+# details - рядки плану, який повідомило сховище (для SQLite)
+QueryResult = namedtuple('QueryResult', ['records', 'plans', 'examined', 'shards', 'details'],
+                         defaults=[1, ()])
+
+
+def term_access(book, term):
+    '''
+    Найкращий індекс книги для умови або None, якщо умову можна лише перевірити на кандидатах
+    '''
+    if isinstance(term, BirthdayTerm):
+        if not term.ranges:
+            return None
+        index = book.birthday_index
+
+        def fetch():
+            return [name for low, high in term.ranges for _, name in index.key_range(low, high)]
+        return Access('birthday', sum(index.count_range(low, high) for low, high in term.ranges), fetch)
+
+    if term.field == 'phone' and len(term.text) == PHONE_LENGTH:
+        owners = book.phone_index.find(term.text)
+        return Access('phone', len(owners), lambda: list(owners))
+
+    if len(term.text) >= MIN_TRIGRAM_QUERY:
+        # Триграми дають кандидатів з підрядком у будь-якому полі; підрядок, поле й межі перевіряє сама умова
+        return Access('full-text', book.search_index.estimate(term.text), lambda: book.search_index.candidates(term.text))
+    return None
+
+
+def run_query(book, terms):
+    '''
+    Виконує запит над AddressBook: бере кандидатів з найвибірковішого індексу
+    та перевіряє на них усі умови
+    '''
+    accesses = [term_access(book, term) for term in terms]
+    usable = [(access.estimate, position) for position, access in enumerate(accesses) if access is not None]
+    chosen = min(usable)[1] if usable else None
+    keys = accesses[chosen].fetch() if chosen is not None else list(book.data)
+
+    records = []
+    for key in keys:
+        record = book.data[key]
+        if all(term.matches(record) for term in terms):
+            records.append(record)
+    records.sort(key=lambda record: record.name.value)
+
+    plans = tuple(
+        TermPlan(term.source, access.index if access else FILTER, access.estimate if access else None,
+                 int(position == chosen))
+        for position, (term, access) in enumerate(zip(terms, accesses)))
+    if chosen is None:
+        plans += (TermPlan('(all records)', SCAN, len(book.data), 1),)
+    return QueryResult(records, plans, len(keys))
+
+
+def combine_results(results, records):
+    '''
+    Об'єднує статистику запиту, виконаного окремо в кожному шарді
+    '''
+    # Чи має умова індекс, залежить лише від самої умови, тож плани шардів збігаються рядок у рядок
+    plans = []
+    for shard_plans in zip(*(result.plans for result in results)):
+        estimates = [plan.estimate for plan in shard_plans if plan.estimate is not None]
+        plans.append(shard_plans[0]._replace(estimate=sum(estimates) if estimates else None,
+                                             chosen=sum(plan.chosen for plan in shard_plans)))
+    return QueryResult(records, tuple(plans), sum(result.examined for result in results), len(results))
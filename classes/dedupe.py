@@ -0,0 +1,162 @@
+'''
+Пошук і злиття контактів-дублікатів.
+
+Замість порівняння кожної пари контактів записи розкладаються по блоках за ключами:
+нормалізоване ім'я, номер телефону, email у нижньому регістрі та дата народження.
+Порівнюються лише записи одного блоку, тож робота лінійна від розміру книги,
+доки блоки невеликі. Пари з однаковим ім'ям вважаються дублікатами одразу; спільний номер,
+email чи дата народження - лише разом зі схожим ім'ям. Щоб блоки дат не порівнювались
+попарно цілком, дата поєднується з двома першими, а окремо - з двома останніми літерами
+імені: схожі імена майже завжди збігаються хоча б в одному з них.
+
+Група - це контакт, що лишається, і ті, кого з ним безпосередньо порівняно, тож ланцюжок
+"A схожий на B, B схожий на C" не зливає A з C.
+'''
+from collections import defaultdict, namedtuple
+
+from indexes import edit_distance
+
+
+# Блоки, більші за цей розмір (наприклад, спільний номер офісу), не порівнюються
+MAX_BLOCK_SIZE = 100
+# Наскільки можуть відрізнятися імена контактів зі спільним номером, email чи датою народження
+NAME_DISTANCE = 2
+# Скільки перших і останніх літер імені додається до ключа дати народження
+BIRTHDAY_NAME_AFFIX = 2
+
+REASON_NAME = 'name'
+REASON_PHONE = 'phone'
+REASON_EMAIL = 'email'
+REASON_BIRTHDAY = 'birthday'
+
+# Група дублікатів: ім'я контакту, що лишається, імена тих, що зливаються з ним,
+# та ключі, за якими їх знайдено
+DuplicateGroup = namedtuple('DuplicateGroup', ['keeper', 'duplicates', 'reasons'])
+DuplicateReport = namedtuple('DuplicateReport', ['groups', 'skipped_blocks'])
+
+
+def normalize_name(name):
+    return ' '.join(name.casefold().split())
+
+
+def blocking_keys(record):
+    name = normalize_name(record.name.value)
+    yield REASON_NAME, name
+    for phone in record.phones:
+        yield REASON_PHONE, phone.value
+    if record.email:
+        yield REASON_EMAIL, record.email.value.lower()
+    if record.birthday:
+        birthday = record.birthday.value.date()
+        yield REASON_BIRTHDAY, (birthday, 'start', name[:BIRTHDAY_NAME_AFFIX])
+        yield REASON_BIRTHDAY, (birthday, 'end', name[-BIRTHDAY_NAME_AFFIX:])
+
+
+def filled_fields(record):
+    '''
+    Скільки даних містить запис; контакт з найбільшою кількістю лишається після злиття
+    '''
+    return len(record.phones) + sum(1 for field in (record.birthday, record.address, record.email) if field)
+
+
+def may_be_close(first, second, distance):
+    '''
+    Швидка перевірка перед відстанню редагування: якщо рядки відрізняються не більше
+    ніж на distance правок, хоча б один з distance + 1 шматків першого рядка
+    трапляється в другому без змін
+    '''
+    size = len(first) // (distance + 1)
+    if not size:
+        return True
+    bounds = [part * size for part in range(distance + 1)] + [len(first)]
+    return any(first[start:end] in second for start, end in zip(bounds, bounds[1:]))
+
+
+def similar_names(first, second):
+    '''
+    Чи схожі нормалізовані імена: відрізняються не більше ніж на NAME_DISTANCE правок
+    або всі слова одного є в іншому ("olena" та "olena petrenko")
+    '''
+    if may_be_close(first, second, NAME_DISTANCE) and edit_distance(first, second, NAME_DISTANCE) <= NAME_DISTANCE:
+        return True
+    first_words, second_words = set(first.split()), set(second.split())
+    return first_words <= second_words or second_words <= first_words
+
+
+def block_edges(kind, names):
+    '''
+    Пари записів блоку, які вважаються дублікатами
+    '''
+    normalized = [(name, normalize_name(name)) for name in names]
+    edges = []
+    for position, (first, first_normalized) in enumerate(normalized):
+        for second, second_normalized in normalized[position + 1:]:
+            if first == second:
+                continue
+            # У блоці імені нормалізовані імена однакові, інші ключі ще потребують схожого імені
+            if kind == REASON_NAME or similar_names(first_normalized, second_normalized):
+                edges.append((first, second, kind))
+    return edges
+
+
+def find_duplicate_groups(records, max_block_size=MAX_BLOCK_SIZE):
+    '''
+    Групи ймовірних дублікатів серед записів, впорядковані за іменем контакту, що лишається
+    '''
+    blocks = defaultdict(list)
+    filled = {}
+    for record in records:
+        name = record.name.value
+        filled[name] = filled_fields(record)
+        for key in blocking_keys(record):
+            blocks[key].append(name)
+
+    # Для кожного контакту - з ким його порівняно і за якими ключами
+    neighbours = defaultdict(lambda: defaultdict(set))
+    skipped = 0
+    for (kind, _), names in blocks.items():
+        if len(names) < 2:
+            continue
+        if len(names) > max_block_size:
+            skipped += 1
+            continue
+        for first, second, reason in block_edges(kind, names):
+            neighbours[first][second].add(reason)
+            neighbours[second][first].add(reason)
+
+    # Контакти з найбільшою кількістю даних першими стають тими, що лишаються,
+    # і забирають у групу лише ще не розподілених сусідів
+    grouped = set()
+    groups = []
+    for keeper in sorted(neighbours, key=lambda name: (-filled[name], name)):
+        if keeper in grouped:
+            continue
+        duplicates = [name for name in neighbours[keeper] if name not in grouped]
+        if not duplicates:
+            continue
+        grouped.add(keeper)
+        grouped.update(duplicates)
+        reasons = set().union(*(neighbours[keeper][name] for name in duplicates))
+        groups.append(DuplicateGroup(keeper, tuple(sorted(duplicates)), tuple(sorted(reasons))))
+    groups.sort()
+    return DuplicateReport(groups, skipped)
+
+
+def merge_groups(book, groups):
+    '''
+    Зливає дублікати кожної групи з контактом, що лишається: телефони об'єднуються,
+    порожні поля заповнюються, а дублікати видаляються. Повертає кількість злитих записів
+    '''
+    merged = 0
+    for group in groups:
+        keeper = book.find(group.keeper)
+        if keeper is None:
+            continue
+        for name in group.duplicates:
+            duplicate = book.find(name)
+            if duplicate is None:
+                continue
+            keeper.merge(duplicate)
+            book.delete_record(name)
+            merged += 1
+    return merged
@@ -0,0 +1,570 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import date, timedelta
+import calendar
+import heapq
+import threading
+
+
+# Роздільник полів у тексті пошуку; не може потрапити в запит з командного рядка
+FIELD_SEPARATOR = '\n'
+
+# Високосний рік, у якому рахуються ключі днів народження (29 лютого = 60)
+LEAP_YEAR = 2000
+FEB_28_KEY = 59
+FEB_29_KEY = 60
+
+# Скільки відкладених вставок індекс днів народження вставляє по одній
+PENDING_INSERT_LIMIT = 64
+
+# BK-дерево імен перебудовується, а списки триграм очищуються, коли видалених записів більше, ніж живих
+REBUILD_MIN_TOMBSTONES = 256
+
+# Скільки опечаток допускає нечіткий пошук імені та скільки варіантів повертає
+FUZZY_MAX_DISTANCE = 2
+FUZZY_LIMIT = 3
+
+
+def trigrams(text):
+    '''
+    Повертає множину триграм рядка
+    '''
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def searchable_text(record):
+    '''
+    Формує текст запису, за яким здійснюється пошук контактів
+    '''
+    parts = [record.name.value.lower()]
+    if record.birthday:
+        parts.append(record.birthday.value.strftime('%d.%m.%Y'))
+    parts.extend(phone.value for phone in record.phones)
+    if record.email:
+        parts.append(record.email.value.lower())
+    if record.address:
+        parts.append(record.address.value.lower())
+    return FIELD_SEPARATOR.join(parts)
+
+
+def text_contains(record, query):
+    '''
+    Чи містить текст пошуку запису підрядок query у нижньому регістрі. Запит без роздільника
+    може знайтись лише в межах одного поля, тож поля перевіряються по черзі без складання тексту
+    '''
+    if FIELD_SEPARATOR in query:
+        return query in searchable_text(record)
+    if query in record.name.value.lower():
+        return True
+    if record.email and query in record.email.value.lower():
+        return True
+    if record.address and query in record.address.value.lower():
+        return True
+    # Телефони складаються лише з цифр, а дата народження - з цифр і крапок
+    if not query.replace('.', '').isdigit():
+        return False
+    if '.' not in query and any(query in phone.value for phone in record.phones):
+        return True
+    return bool(record.birthday) and query in record.birthday.value.strftime('%d.%m.%Y')
+
+
+class TrigramIndex:
+    '''
+    Інвертований індекс триграм для пошуку підрядків серед полів контактів.
+    Записи нумеруються цілими числами, а список записів кожної триграми - масив номерів.
+    Текст записів не зберігається: підрядок перевіряється за текстом самого запису
+    '''
+    def __init__(self):
+        self.postings = {}
+        self.ids = {}
+        # Номер запису -> ключ; None для видаленого запису, номер якого ще лишається у списках
+        self.keys = []
+        self.removed = 0
+
+    @classmethod
+    def restore(cls, keys, postings):
+        '''
+        Відновлює індекс зі збережених номерів записів (None - видалений) та масивів триграм
+        '''
+        index = cls()
+        index.keys = keys
+        index.ids = {key: number for number, key in enumerate(keys) if key is not None}
+        index.postings = postings
+        index.removed = len(keys) - len(index.ids)
+        return index
+
+    def add(self, record):
+        key = record.name.value
+        number = len(self.keys)
+        self.ids[key] = number
+        self.keys.append(key)
+        for gram in trigrams(searchable_text(record)):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('I')
+            posting.append(number)
+
+    def remove(self, key):
+        # Поля запису на момент видалення вже можуть бути змінені, тож його триграми невідомі:
+        # номер лише позначається видаленим, а списки очищуються, коли таких номерів більше, ніж живих
+        number = self.ids.pop(key, None)
+        if number is None:
+            return
+        self.keys[number] = None
+        self.removed += 1
+        if self.removed >= REBUILD_MIN_TOMBSTONES and self.removed > len(self.ids):
+            self.compact()
+
+    def compact(self):
+        '''
+        Перенумеровує живі записи підряд і прибирає номери видалених зі списків триграм
+        '''
+        numbers = array('I', bytes(4 * len(self.keys)))
+        keys = []
+        for number, key in enumerate(self.keys):
+            if key is not None:
+                numbers[number] = self.ids[key] = len(keys)
+                keys.append(key)
+
+        alive = self.keys
+        postings = {}
+        for gram, posting in self.postings.items():
+            kept = array('I', [numbers[number] for number in posting if alive[number] is not None])
+            if kept:
+                postings[gram] = kept
+        self.postings = postings
+        self.keys = keys
+        self.removed = 0
+
+    def candidates(self, query):
+        '''
+        Ключі записів, текст яких містить усі триграми query; підрядок ще треба перевірити
+        '''
+        grams = trigrams(query.lower())
+        if not grams:
+            # Запит коротший за триграму: індекс не допоможе
+            return list(self.ids)
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        if not postings[0]:
+            return []
+        numbers = set(postings[0]).intersection(*postings[1:])
+        keys = self.keys
+        return [keys[number] for number in numbers if keys[number] is not None]
+
+    def search(self, query, records):
+        '''
+        Повертає ключі записів зі словника records, що містять підрядок query
+        '''
+        query = query.lower()
+        candidates = self.candidates(query)
+        if len(query) == 3:
+            # Запит з однієї триграми збігається зі своїм списком точно
+            return candidates
+        # Наявність усіх триграм не гарантує суцільного входження підрядка
+        return [key for key in candidates if text_contains(records[key], query)]
+
+    def estimate(self, query):
+        '''
+        Верхня межа кількості записів з підрядком query: розмір найкоротшого списку триграми
+        '''
+        grams = trigrams(query.lower())
+        if not grams:
+            return len(self.ids)
+        return min(len(self.postings.get(gram, ())) for gram in grams)
+
+
+def edit_distance(first, second, bound=None):
+    '''
+    Відстань Левенштейна між двома рядками; якщо вона більша за bound,
+    обчислення обривається і повертається bound + 1.
+    Бітово-паралельний алгоритм Маєрса: стовпчик матриці відстаней зберігається
+    у бітах цілих чисел, тож на кожен символ довшого рядка припадає сталий набір операцій
+    '''
+    if len(first) < len(second):
+        first, second = second, first
+    if bound is not None and len(first) - len(second) > bound:
+        return bound + 1
+    if not second:
+        return len(first)
+
+    matches = {}
+    for position, char in enumerate(second):
+        matches[char] = matches.get(char, 0) | (1 << position)
+    mask = (1 << len(second)) - 1
+    last = 1 << (len(second) - 1)
+    positive, negative = mask, 0
+    score = len(second)
+    remaining = len(first)
+    for char in first:
+        remaining -= 1
+        equal = matches.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | ~(horizontal | positive)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        positive = (horizontal_negative | ~(vertical | horizontal_positive)) & mask
+        negative = horizontal_positive & vertical & mask
+        # Кожен наступний символ зменшує відстань щонайбільше на одиницю
+        if bound is not None and score - remaining > bound:
+            return bound + 1
+    return score
+
+
+class NameNode:
+    __slots__ = ('word', 'keys', 'children')
+
+    def __init__(self, word):
+        self.word = word
+        self.keys = set()
+        self.children = {}
+
+
+class NameIndex:
+    '''
+    BK-дерево імен контактів (без урахування регістру) для пошуку з опечатками.
+    Видалені імена лишаються у дереві порожніми вузлами до перебудови
+    '''
+    def __init__(self):
+        self.root = None
+        self.nodes = {}
+        self.pending = []
+        self.tombstones = 0
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        self.add_name(record.name.value)
+
+    def add_name(self, key):
+        word = key.lower()
+        node = self.nodes.get(word)
+        if node is None:
+            # Вузол вставляється в дерево лише перед першим пошуком,
+            # тож завантаження книги не обчислює відстаней
+            node = self.nodes[word] = NameNode(word)
+            self.pending.append(node)
+        elif not node.keys:
+            self.tombstones -= 1
+        node.keys.add(key)
+
+    def flush(self):
+        '''
+        Вставляє відкладені вузли в дерево. Пошуки, що застали відкладені вузли, чекають на lock,
+        поки їх вставляє один з них, а порожній pending означає вже готове дерево
+        '''
+        if not self.pending:
+            return
+        with self.lock:
+            for node in self.pending:
+                self._link(node)
+            self.pending = []
+
+    def _link(self, node):
+        word = node.word
+        if self.root is None:
+            self.root = node
+            return
+        parent = self.root
+        while True:
+            distance = edit_distance(word, parent.word)
+            child = parent.children.get(distance)
+            if child is None:
+                parent.children[distance] = node
+                return
+            parent = child
+
+    def remove(self, key):
+        node = self.nodes.get(key.lower())
+        if node is None or key not in node.keys:
+            return
+        node.keys.discard(key)
+        if not node.keys:
+            self.tombstones += 1
+            if self.tombstones > REBUILD_MIN_TOMBSTONES and self.tombstones * 2 > len(self.nodes):
+                self.rebuild()
+
+    def rebuild(self):
+        live = [node for node in self.nodes.values() if node.keys]
+        self.root = None
+        self.tombstones = 0
+        self.nodes = {}
+        self.pending = []
+        for old in live:
+            node = self.nodes[old.word] = NameNode(old.word)
+            node.keys = old.keys
+            self.pending.append(node)
+
+    def search(self, name, max_distance, limit):
+        '''
+        Повертає до limit ключів, найближчих до name, з відстанню не більше max_distance
+        '''
+        self.flush()
+        word = name.lower()
+        # Купа найближчих кандидатів; коли вона повна, радіус пошуку звужується
+        best = []
+        radius = max_distance
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            # Точна відстань потрібна лише в межах, де ще можуть знайтися діти
+            distance = edit_distance(word, node.word, radius + max(node.children, default=0))
+            if distance <= radius:
+                for key in node.keys:
+                    heapq.heappush(best, (-distance, key))
+                    if len(best) > limit:
+                        heapq.heappop(best)
+                if len(best) == limit:
+                    radius = min(radius, -best[0][0])
+            # Нерівність трикутника: ближчі вузли лише серед дітей з такими відстанями
+            for child_distance, child in node.children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return [key for _, key in sorted((-negative, key) for negative, key in best)]
+
+
+class SortedKeys:
+    '''
+    Відсортований список ключів книги, щоб сторінки виводу не сортували всю книгу щоразу.
+    key_of повертає ключ запису, за яким він зберігається в книзі
+    '''
+    def __init__(self, key_of):
+        self.key_of = key_of
+        self.entries = []
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def add(self, item):
+        key = self.key_of(item)
+        if not self.pending and (not self.entries or key > self.entries[-1]):
+            self.entries.append(key)
+        else:
+            # Як і в індексі днів народження, вставки під час завантаження сортуються разом
+            self.pending.append(key)
+
+    def remove(self, key):
+        self.flush()
+        position = bisect_left(self.entries, key)
+        if position < len(self.entries) and self.entries[position] == key:
+            del self.entries[position]
+
+    def flush(self):
+        if not self.pending:
+            return
+        # Читачі опублікованої копії можуть застати відкладені вставки одночасно
+        with self.lock:
+            if len(self.pending) <= PENDING_INSERT_LIMIT:
+                for key in self.pending:
+                    insort(self.entries, key)
+            else:
+                self.entries.extend(self.pending)
+                self.entries.sort()
+            self.pending = []
+
+    def keys_from(self, after=None, offset=0):
+        '''
+        Ключі за зростанням, починаючи після after і пропустивши ще offset ключів
+        '''
+        self.flush()
+        start = bisect_right(self.entries, after) if after is not None else 0
+        for position in range(start + offset, len(self.entries)):
+            yield self.entries[position]
+
+
+class PhoneIndex:
+    '''
+    Хеш-індекс нормалізованих номерів телефонів до імен власників
+    '''
+    def __init__(self):
+        self.owners = defaultdict(set)
+        self.phones = {}
+
+    def add(self, record):
+        key = record.name.value
+        phones = tuple(phone.value for phone in record.phones)
+        self.phones[key] = phones
+        for phone in phones:
+            self.owners[phone].add(key)
+
+    def remove(self, key):
+        for phone in self.phones.pop(key, ()):
+            owners = self.owners.get(phone)
+            if owners is not None:
+                owners.discard(key)
+                if not owners:
+                    del self.owners[phone]
+
+    def find(self, phone):
+        '''
+        Повертає імена власників нормалізованого номера
+        '''
+        return self.owners.get(phone, set())
+
+    def shared(self):
+        '''
+        Повертає номери, що належать кільком контактам, за один прохід індексом
+        '''
+        return {phone: sorted(owners) for phone, owners in self.owners.items() if len(owners) > 1}
+
+
+class TagIndex:
+    '''
+    Інвертований індекс тегів до заголовків нотаток.
+    Запити до тегів обчислюються перетином і різницею множин заголовків, без перегляду нотаток
+    '''
+    def __init__(self):
+        self.titles = defaultdict(set)
+        self.tags = {}
+
+    def add(self, note):
+        key = note.title.value
+        tags = tuple(tag.value for tag in note.tags)
+        self.tags[key] = tags
+        for tag in tags:
+            self.titles[tag].add(key)
+
+    def remove(self, key):
+        for tag in self.tags.pop(key, ()):
+            titles = self.titles.get(tag)
+            if titles is not None:
+                titles.discard(key)
+                if not titles:
+                    del self.titles[tag]
+
+    def find(self, tag):
+        return self.titles.get(tag, set())
+
+    def query(self, groups, exclude=(), universe=()):
+        '''
+        Заголовки нотаток, що мають хоча б один тег з кожної групи та жодного з exclude.
+        Без груп відбір починається з universe (усіх заголовків книги)
+        '''
+        if groups:
+            # Об'єднання для кожної групи; перетин починаємо з найменшої множини
+            unions = sorted((set().union(*map(self.find, group)) for group in groups), key=len)
+            result = unions[0].intersection(*unions[1:])
+        else:
+            result = set(universe)
+        for tag in exclude:
+            result -= self.find(tag)
+        return result
+
+    def grouped(self):
+        '''
+        Пари (тег, заголовки його нотаток) за зростанням тегу
+        '''
+        return [(tag, sorted(self.titles[tag])) for tag in sorted(self.titles)]
+
+
+def birthday_key(month, day):
+    '''
+    Номер дня у високосному році, за яким сортуються дні народження
+    '''
+    return (date(LEAP_YEAR, month, day) - date(LEAP_YEAR, 1, 1)).days + 1
+
+
+def birthday_in_year(month, day, year):
+    '''
+    Дата дня народження у вказаному році; 29 лютого в невисокосний рік святкуємо 28 лютого
+    '''
+    if month == 2 and day == 29 and not calendar.isleap(year):
+        return date(year, 2, 28)
+    return date(year, month, day)
+
+
+def birthday_key_ranges(today, days):
+    '''
+    Розбиває проміжок [today, today + days] на діапазони ключів по роках
+    '''
+    target = today + timedelta(days=days)
+    for year in range(today.year, target.year + 1):
+        start = today if year == today.year else date(year, 1, 1)
+        end = target if year == target.year else date(year, 12, 31)
+        low = birthday_key(start.month, start.day)
+        high = birthday_key(end.month, end.day)
+        if high == FEB_28_KEY and not calendar.isleap(year):
+            high = FEB_29_KEY
+        yield year, low, high
+
+
+class BirthdayIndex:
+    '''
+    Відсортований масив пар (день року, ім'я) для пошуку найближчих днів народження
+    '''
+    def __init__(self):
+        self.entries = []
+        self.pending = []
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        if not record.birthday:
+            return
+        key = record.name.value
+        value = record.birthday.value
+        entry = (birthday_key(value.month, value.day), key)
+        self.keys[key] = entry
+        if not self.pending and (not self.entries or entry >= self.entries[-1]):
+            self.entries.append(entry)
+        else:
+            # Під час завантаження книги вставки відкладаються й сортуються разом
+            self.pending.append(entry)
+
+    def remove(self, key):
+        entry = self.keys.pop(key, None)
+        if entry is None:
+            return
+        self.flush()
+        position = bisect_left(self.entries, entry)
+        del self.entries[position]
+
+    def flush(self):
+        if not self.pending:
+            return
+        # Читачі опублікованої копії можуть застати відкладені вставки одночасно
+        with self.lock:
+            if len(self.pending) <= PENDING_INSERT_LIMIT:
+                for entry in self.pending:
+                    insort(self.entries, entry)
+            else:
+                self.entries.extend(self.pending)
+                self.entries.sort()
+            self.pending = []
+
+    def key_range(self, low, high):
+        '''
+        Записи (день року, ім'я) з днем року від low до high включно
+        '''
+        self.flush()
+        start = bisect_left(self.entries, (low,))
+        end = bisect_left(self.entries, (high + 1,))
+        return self.entries[start:end]
+
+    def count_range(self, low, high):
+        self.flush()
+        return bisect_left(self.entries, (high + 1,)) - bisect_left(self.entries, (low,))
+
+    def upcoming(self, today, days):
+        '''
+        Повертає пари (ім'я, дата святкування) для днів народження протягом days днів
+        '''
+        self.flush()
+        result = []
+        seen = set()
+        for year, low, high in birthday_key_ranges(today, days):
+            start = bisect_left(self.entries, (low,))
+            end = bisect_left(self.entries, (high + 1,))
+            for key, name in self.entries[start:end]:
+                if name in seen:
+                    continue
+                seen.add(name)
+                birthday = date(LEAP_YEAR, 1, 1) + timedelta(days=key - 1)
+                result.append((name, birthday_in_year(birthday.month, birthday.day, year)))
+            if len(seen) == len(self.entries):
+                break
+        return result
@@ -0,0 +1,129 @@
+import json
+import os
+import shutil
+
+
+# Розмір журналу, після якого він згортається у знімок книг
+COMPACTION_THRESHOLD = 1024 * 1024
+
+# Суфікс журналу, відкладеного на час фонового збереження книг
+ROTATED_SUFFIX = '.old'
+
+
+class Journal:
+    '''
+    Журнал змін: кожна команда, що змінює книги, дописується в кінець файлу
+    та синхронізується з диском до її виконання, а після виконання дописуються
+    записи, які вона фактично змінила
+    '''
+    def __init__(self, path, compaction_threshold=COMPACTION_THRESHOLD):
+        self.path = path
+        self.rotated_path = path + ROTATED_SUFFIX
+        self.compaction_threshold = compaction_threshold
+        self.file = open(path, 'a', encoding='utf-8')
+        # Номер останньої команди; replay() продовжує нумерацію з наявних записів
+        self.sequence = 0
+
+    def append(self, command, args, sync=True):
+        '''
+        Дописує команду в журнал і повертає її номер; з sync=False синхронізацію робить наступний sync()
+        '''
+        self.sequence += 1
+        self.write({'seq': self.sequence, 'command': command, 'args': list(args)}, sync)
+        return self.sequence
+
+    def append_changes(self, sequence, changes, sync=False):
+        '''
+        Дописує записи книг після виконання команди sequence. Їх синхронізують rotate()
+        та синхронізація перед згортанням, тож файли книг не випереджають журнал
+        '''
+        self.write({'seq': sequence, 'changes': changes}, sync)
+
+    def write(self, entry, sync):
+        self.file.write(json.dumps(entry, ensure_ascii=False))
+        self.file.write('\n')
+        if sync:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def replay(self):
+        '''
+        Повертає трійки (команда, аргументи, зміни) у порядку запису, спершу з відкладеного журналу.
+        Зміни - записи книг після виконання команди; їх повторне застосування до знімка, який
+        уже містить команду, нічого не змінює. None означає, що збій стався до запису змін,
+        тож команду треба виконати знову. Останній рядок, обірваний під час збою, пропускається
+        '''
+        entries = []
+        # Номер команди -> її позиція в entries; зміни належать останній команді з таким номером
+        positions = {}
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        sequence = entry.get('seq')
+                        if 'changes' in entry:
+                            if sequence in positions:
+                                entries[positions[sequence]][2] = entry['changes']
+                            continue
+                        command, args = entry['command'], entry['args']
+                    except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+                        continue
+                    if isinstance(sequence, int):
+                        positions[sequence] = len(entries)
+                        self.sequence = max(self.sequence, sequence)
+                    entries.append([command, args, None])
+        for command, args, changes in entries:
+            yield command, args, changes
+
+    def size(self):
+        return self.file.tell()
+
+    def needs_compaction(self):
+        return self.size() >= self.compaction_threshold
+
+    def has_entries(self):
+        return self.size() > 0 or os.path.exists(self.rotated_path)
+
+    def rotate(self):
+        '''
+        Відкладає записи журналу на час фонового збереження книг і починає порожній журнал.
+        Якщо попередній відкладений журнал ще не видалено, записи дописуються до нього
+        '''
+        self.sync()
+        self.file.close()
+        if os.path.exists(self.rotated_path):
+            with open(self.path, 'rb') as source, open(self.rotated_path, 'ab') as target:
+                shutil.copyfileobj(source, target)
+                target.flush()
+                os.fsync(target.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.rotated_path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def discard_rotated(self):
+        '''
+        Видаляє відкладений журнал, коли книги з усіма його змінами вже записано
+        '''
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def truncate(self):
+        '''
+        Очищує журнал після збереження знімка книг
+        '''
+        self.file.truncate(0)
+        self.file.seek(0)
+        os.fsync(self.file.fileno())
+        self.discard_rotated()
+
+    def close(self):
+        self.file.close()
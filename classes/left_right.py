@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+import threading
+
+
+class LeftRight:
+    '''
+    Дві копії даних для читання без блокувань (left-right).
+    Читачі працюють з опублікованою копією, яку ніхто не змінює; письменник змінює іншу
+    і запам'ятовує операції. publish() міняє копії місцями, чекає, доки старою копією
+    перестануть користуватися, та повторює на ній лише накопичені операції.
+    publish() блокується на час очікування читачів, тож його викликає потік письменника
+    '''
+    def __init__(self, left, right, apply, prepare=None):
+        self.replicas = (left, right)
+        # apply(копія, *операція) -> результат операції
+        self.apply = apply
+        # prepare(копія) завершує відкладену роботу копії, перш ніж її побачать читачі
+        self.prepare = prepare
+        self.active = 0
+        self.readers = [0, 0]
+        self.readers_changed = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.log = []
+
+    @contextmanager
+    def read(self):
+        '''
+        Видає опубліковану копію; вона не змінюється, поки читач її тримає
+        '''
+        with self.readers_changed:
+            side = self.active
+            self.readers[side] += 1
+        try:
+            yield self.replicas[side]
+        finally:
+            with self.readers_changed:
+                self.readers[side] -= 1
+                if not self.readers[side]:
+                    self.readers_changed.notify_all()
+
+    def write(self, *operation):
+        '''
+        Застосовує операцію до неопублікованої копії; читачі побачать її після publish()
+        '''
+        with self.write_lock:
+            result = self.apply(self.replicas[1 - self.active], *operation)
+            self.log.append(operation)
+            return result
+
+    def unpublished(self):
+        '''
+        Копія, яку зараз змінює письменник; викликається лише з потоку письменника
+        '''
+        return self.replicas[1 - self.active]
+
+    def publish(self):
+        with self.write_lock:
+            if not self.log:
+                return
+            if self.prepare is not None:
+                self.prepare(self.replicas[1 - self.active])
+            with self.readers_changed:
+                previous = self.active
+                self.active = 1 - previous
+                # Нові читачі вже отримують свіжу копію; чекаємо лише тих, хто почав раніше
+                self.readers_changed.wait_for(lambda: not self.readers[previous])
+            for operation in self.log:
+                self.apply(self.replicas[previous], *operation)
+            self.log.clear()
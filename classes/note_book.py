@@ -1,58 +1,191 @@
 from classes import Note
+from note_index import NoteIndex, MODE_AND, tokenize
+from indexes import SortedKeys, TagIndex
+from query_cache import QueryCache, cached_query, next_generation
 from collections import UserDict
-import json
+from storage import iter_json_records, write_json_records, SerializedRecords
+from snapshot import KIND_NOTES, read_snapshot, write_snapshot, snapshot_is_fresh, snapshot_path, source_stamp
 import os
 
 
+def iter_notes(filename, errors):
+    '''
+    Потоково читає нотатки зі свіжого знімка або з JSON;
+    помилки нотаток, які не вдалося завантажити, додаються до errors
+    '''
+    if not os.path.isfile(filename):
+        return
+
+    snapshot = read_snapshot(snapshot_path(filename), KIND_NOTES, source_stamp(filename))
+    if snapshot is not None:
+        yield from snapshot.items
+        return
+
+    for number, note_dict in iter_json_records(filename, errors):
+        try:
+            note = Note.from_dict(note_dict)
+        except KeyError as e:
+            errors.append(f"Note {number}: missing field {e}")
+        except (TypeError, ValueError, AttributeError) as e:
+            errors.append(f"Note {number}: {e}")
+        else:
+            yield note
+
+
 class NotesBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        self.query_cache = QueryCache()
+        self.generation = next_generation()
+        self.serialized = SerializedRecords('title')
+        self.index = NoteIndex()
+        self.tag_index = TagIndex()
+        self.order_index = SortedKeys(lambda note: note.title.value)
+        super().__init__(*args, **kwargs)
+
     def add_note(self, note):
         if isinstance(note, Note):
-            self.data[note.title.value] = note
+            self.generation = next_generation()
+            key = note.title.value
+            self.serialized.mark(key)
+            previous = self.data.get(key)
+            if previous is not None:
+                self.index.remove(key)
+                self.tag_index.remove(key)
+                self.order_index.remove(key)
+                previous.book = None
+            self.data[key] = note
+            note.book = self
+            self.index.add(note)
+            self.tag_index.add(note)
+            self.order_index.add(note)
+
+    def reindex_record(self, note):
+        '''
+        Оновлює індекси після зміни опису чи тегів нотатки
+        '''
+        self.generation = next_generation()
+        key = note.title.value
+        if self.data.get(key) is note:
+            self.serialized.mark(key)
+            self.index.remove(key)
+            self.index.add(note)
+            self.tag_index.remove(key)
+            self.tag_index.add(note)
+
+    def prepare(self):
+        '''
+        Завершує відкладені вставки індексів, перш ніж копію книги побачать читачі
+        '''
+        self.order_index.flush()
 
     def find(self, title):
         return self.data.get(title)
+
+    def iter_sorted(self, after=None, offset=0):
+        '''
+        Нотатки за зростанням заголовка, починаючи після after і пропустивши ще offset нотаток
+        '''
+        return (self.data[key] for key in self.order_index.keys_from(after, offset))
     
-    def search(self, term):
-        matches = []
-        for note in self.data.values():
-            if term.lower() in note.title.value.lower() or term.lower() in note.description.value.lower():
-                matches.append(note)
-        return matches
+    @cached_query()
+    def search(self, query, mode=MODE_AND, limit=None):
+        '''
+        Ранжований пошук нотаток за словами запиту (BM25).
+        mode визначає, чи мають збігтися всі слова, чи хоча б одне
+        '''
+        terms = tokenize(query) if isinstance(query, str) else [term for text in query for term in tokenize(text)]
+        return [self.data[key] for key in self.index.search(terms, mode, limit)]
+
+    @cached_query()
+    def find_by_tags(self, groups, exclude=()):
+        '''
+        Нотатки, що мають хоча б один тег з кожної групи та жодного з exclude, за зростанням заголовка
+        '''
+        titles = self.tag_index.query(groups, exclude, self.data)
+        return [self.data[key] for key in sorted(titles)]
+
+    @cached_query()
+    def notes_by_tag(self):
+        '''
+        Пари (тег, нотатки з ним) за зростанням тегу
+        '''
+        return [(tag, [self.data[key] for key in titles]) for tag, titles in self.tag_index.grouped()]
 
     def delete(self, title):
         if title in self.data:
+            self.generation = next_generation()
+            self.serialized.mark(title)
+            self.index.remove(title)
+            self.tag_index.remove(title)
+            self.order_index.remove(title)
+            self.data[title].book = None
             del self.data[title]
 
 
     def load_notes(self, filename):
-        if not os.path.isfile(filename):
-            self.data = {}
-            return
+        '''
+        Потокове завантаження нотаток з файлу.
+        Повертає список помилок записів, які не вдалося завантажити
+        '''
+        errors = []
+        self.fill(iter_notes(filename, errors))
+        if errors:
+            self.serialized.mark_all(self.data)
+        return errors
 
-        try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                notes_list = json.load(file)
+    def fill(self, notes):
+        '''
+        Замінює вміст книги завантаженими нотатками
+        '''
+        self.generation = next_generation()
+        self.serialized.reset()
+        self.data = {}
+        self.index = NoteIndex()
+        self.tag_index = TagIndex()
+        self.order_index = SortedKeys(lambda note: note.title.value)
+        for note in notes:
+            self.add_note(note)
+        # Завантажені нотатки вже є у файлі, тож фонове збереження їх не переписує
+        self.serialized.reset()
 
-                for note_dict in notes_list:
-                    title = note_dict['title']
-                    description = note_dict.get('description')
 
-                    note = Note(title, description)
+    def serialize_changes(self, limit=None):
+        '''
+        Серіалізує нотатки, змінені з минулого фонового збереження; True, коли змін не лишилось
+        '''
+        return self.serialized.serialize(self.data, limit)
 
-                    self.add_note(note)
-        except json.decoder.JSONDecodeError:
-            self.data = {}
+    def take_changes(self):
+        '''
+        Нотатки, змінені з попереднього виклику, для журналу: заголовок -> словник нотатки
+        або None для видаленої
+        '''
+        return {key: self.data[key].to_dict() if key in self.data else None
+                for key in self.serialized.take_touched()}
 
+    def apply_changes(self, changes):
+        '''
+        Відновлює нотатки з журналу змін; повторне застосування тих самих змін нічого не змінює
+        '''
+        for title, note_dict in changes.items():
+            if note_dict is None:
+                self.delete(title)
+            else:
+                self.add_note(Note.from_dict(note_dict))
+
+    def autosave_files(self, path):
+        return [(path, self.serialized)]
 
     def save_notes(self, filename):
-        with open(filename, 'w') as file:
-            notes_list = []
-            for note in self.data.values():
-                note_dict = {
-                    'title': note.title.value if note.title else None,
-                    'description': note.description.value if note.description else None,
-                }
-                notes_list.append(note_dict)
-
-            
-            json.dump(notes_list, file, ensure_ascii=False)
+        write_json_records(filename, (note.to_dict() for note in self.data.values()))
+        self.save_snapshot(filename)
+
+    def save_snapshot(self, filename):
+        write_snapshot(snapshot_path(filename), KIND_NOTES, self.data.values(), source_stamp(filename))
+
+    def refresh_snapshot(self, filename):
+        '''
+        Записує знімок, якщо його немає або він зроблений не з поточної версії filename
+        '''
+        if not snapshot_is_fresh(filename, KIND_NOTES):
+            self.save_snapshot(filename)
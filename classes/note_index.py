@@ -0,0 +1,127 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+import heapq
+import math
+import re
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Параметри ранжування BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+MODE_AND = 'and'
+MODE_OR = 'or'
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class NoteIndex:
+    '''
+    Інвертований індекс слів заголовків і описів нотаток з ранжуванням BM25.
+    Слово запиту збігається з усіма словами нотаток, що з нього починаються
+    '''
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.terms = {}
+        self.lengths = {}
+        self.total_length = 0
+        self.vocabulary = []
+        self.vocabulary_changed = False
+
+    def add(self, note):
+        key = note.title.value
+        counts = Counter(tokenize(note.title.value) + tokenize(note.description.value))
+        for term, count in counts.items():
+            posting = self.postings[term]
+            if not posting:
+                self.vocabulary_changed = True
+            posting[key] = count
+        length = sum(counts.values())
+        self.terms[key] = tuple(counts)
+        self.lengths[key] = length
+        self.total_length += length
+
+    def remove(self, key):
+        terms = self.terms.pop(key, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(key)
+        # Слова нотатки беремо з індексу: сама нотатка вже може бути змінена
+        for term in terms:
+            posting = self.postings[term]
+            del posting[key]
+            if not posting:
+                del self.postings[term]
+                self.vocabulary_changed = True
+
+    def expand(self, prefix):
+        '''
+        Слова словника, що починаються з prefix
+        '''
+        if self.vocabulary_changed:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_changed = False
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query_terms, mode=MODE_AND, limit=None):
+        '''
+        Повертає заголовки нотаток, впорядковані за спаданням оцінки BM25
+        '''
+        return [key for key, _ in self.search_scored(query_terms, mode, limit)]
+
+    def documents(self):
+        return len(self.lengths)
+
+    def average_length(self):
+        return self.total_length / len(self.lengths) if self.lengths else 0
+
+    def document_frequency(self, term):
+        return len(self.postings.get(term, ()))
+
+    def search_scored(self, query_terms, mode=MODE_AND, limit=None, collection=None):
+        '''
+        Пари (заголовок, оцінка BM25), впорядковані за спаданням оцінки.
+        collection задає статистику всієї колекції, якщо індекс містить лише її частину
+        '''
+        collection = collection or self
+        if not self.lengths:
+            return []
+        documents = collection.documents()
+        average_length = collection.average_length() or 1
+
+        scores = None
+        for query_term in query_terms:
+            term_scores = defaultdict(float)
+            for term in self.expand(query_term):
+                posting = self.postings[term]
+                doc_frequency = collection.document_frequency(term)
+                idf = math.log(1 + (documents - doc_frequency + 0.5) / (doc_frequency + 0.5))
+                for key, term_frequency in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[key] / average_length)
+                    term_scores[key] += idf * term_frequency * (BM25_K1 + 1) / (term_frequency + norm)
+
+            if scores is None:
+                scores = term_scores
+            elif mode == MODE_AND:
+                scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+            else:
+                for key, score in term_scores.items():
+                    scores[key] = scores.get(key, 0.0) + score
+            if mode == MODE_AND and not scores:
+                return []
+
+        ranked = scores.items() if scores else []
+        order = lambda item: (-item[1], item[0])
+        if limit is None:
+            return sorted(ranked, key=order)
+        return heapq.nsmallest(limit, ranked, key=order)
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from functools import wraps
+from itertools import count
+import threading
+
+
+# Скільки різних запитів пам'ятає кеш однієї книги
+QUERY_CACHE_SIZE = 256
+
+# Спільний лічильник поколінь: після будь-якої зміни книга отримує номер, якого ще не було,
+# навіть якщо її перезавантажили з файлу
+GENERATIONS = count()
+
+
+MISSING = object()
+
+
+def next_generation():
+    return next(GENERATIONS)
+
+
+class QueryCache:
+    '''
+    Обмежений LRU-кеш результатів запитів до книги.
+    Кожна зміна книги збільшує її покоління; щойно покоління змінилося, кеш очищується.
+    Блокування захищає лише сам словник, тож читачі в різних потоках не чекають на обчислення
+    '''
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation, compute):
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+            result = self.entries.get(key, MISSING)
+            if result is not MISSING:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return result
+            self.misses += 1
+
+        result = compute()
+        with self.lock:
+            # Поки результат обчислювався, книга могла змінитися
+            if generation == self.generation:
+                self.entries[key] = result
+                if len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.entries),
+        }
+
+
+def hashable(value):
+    '''
+    Списки слів запиту перетворюються на кортежі, щоб стати частиною ключа кешу
+    '''
+    return tuple(value) if isinstance(value, list) else value
+
+
+def cached_query(key=None):
+    '''
+    Кешує результат методу книги в її query_cache за поколінням книги.
+    key(*args) додає до ключа те, від чого ще залежить результат, наприклад сьогоднішню дату.
+    Закешований результат спільний для всіх викликів, тож його не можна змінювати
+    '''
+    def decorator(method):
+        name = method.__name__
+
+        @wraps(method)
+        def inner(self, *args):
+            cache_key = (name, *map(hashable, args))
+            if key is not None:
+                cache_key += (key(*args),)
+            return self.query_cache.get(cache_key, self.generation, lambda: method(self, *args))
+        return inner
+    return decorator
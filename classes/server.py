@@ -0,0 +1,181 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Найбільша довжина рядка запиту
+MAX_REQUEST_SIZE = 1024 * 1024
+# Скільки змін письменник застосовує за одну синхронізацію журналу
+WRITE_BATCH_LIMIT = 256
+
+BAD_REQUEST = 'Request must be a JSON object with a non-empty "command" string'
+
+
+class BookServer:
+    '''
+    Сервер JSON Lines поверх TCP. Кожен рядок запиту - об'єкт {"id": ..., "command": "..."},
+    кожен рядок відповіді - результат команди з тим самим id.
+    Зміни йдуть через чергу єдиного письменника, який записує їх у журнал пачками
+    та виконує в окремому потоці, щоб цикл подій тим часом обслуговував з'єднання.
+    З пулом потоків read_pool читання виконуються в ньому паралельно зі змінами
+    (над іншою копією книг), інакше - в потоці письменника між пачками змін
+    '''
+    def __init__(self, prepare, execute, mutating, exit_commands, journal=None, after_writes=None,
+                 write=None, read_pool=None, applied=None):
+        # prepare(line) -> (назва, повна назва команди, аргументи, помилка)
+        self.prepare = prepare
+        # execute(команда, аргументи) -> відповідь бота; write - те саме для змін
+        self.execute = execute
+        self.write = write or execute
+        self.read_pool = read_pool
+        self.mutating = mutating
+        self.exit_commands = exit_commands
+        self.journal = journal
+        # applied() -> записи, змінені останньою зміною, для журналу після її виконання
+        self.applied = applied
+        # after_writes(пари (команда, аргументи)) викликається після кожної пачки змін
+        self.after_writes = after_writes
+        self.server = None
+        self.writes = None
+        self.writer_task = None
+        self.writer_pool = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        '''
+        Запускає письменника та приймання з'єднань; повертає фактичну адресу сервера
+        '''
+        self.writes = asyncio.Queue()
+        self.writer_pool = ThreadPoolExecutor(1, thread_name_prefix="book-writer")
+        self.writer_task = asyncio.create_task(self.write_loop())
+        self.server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_REQUEST_SIZE)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def stop(self):
+        self.server.close()
+        # Зміни, які вже прийнято в чергу, застосовуються до зупинки
+        await self.writes.join()
+        self.writer_task.cancel()
+        self.writer_pool.shutdown()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(self.encode({'error': 'Request is too long'}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                response = await self.handle_request(line)
+                writer.write(self.encode(response))
+                await writer.drain()
+                if response.get('command') in self.exit_commands:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # З'єднання обривається клієнтом або зупинкою сервера
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line):
+        try:
+            request = json.loads(line)
+            text = request['command']
+        except (ValueError, KeyError, TypeError):
+            return {'error': BAD_REQUEST}
+        if not isinstance(text, str) or not text.strip():
+            return {'error': BAD_REQUEST}
+
+        name, command, args, error = self.prepare(text)
+        response = {
+            'id': request.get('id'),
+            'command': command or name,
+            'args': args,
+            'recognized': error is None,
+        }
+        if error:
+            result = error
+        elif command in self.exit_commands:
+            # Завершується лише з'єднання клієнта, а не сервер
+            result = "Good bye!"
+        elif command in self.mutating:
+            future = asyncio.get_running_loop().create_future()
+            await self.writes.put((command, args, future))
+            try:
+                result = await future
+            except Exception as error:
+                response['error'] = f'Change failed: {error}'
+                return response
+        else:
+            # Без окремої копії для читачів книги змінює й читає лише потік письменника
+            pool = self.read_pool or self.writer_pool
+            result = await asyncio.get_running_loop().run_in_executor(pool, self.execute, command, args)
+        response['result'] = result.strip()
+        return response
+
+    async def write_loop(self):
+        '''
+        Єдиний письменник: забирає з черги всі зміни, що накопичились, та застосовує їх по черзі
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.writes.get()]
+            while len(batch) < WRITE_BATCH_LIMIT and not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+            try:
+                commands = [(command, args) for command, args, _ in batch]
+                try:
+                    outcomes = await loop.run_in_executor(self.writer_pool, self.apply_writes, commands)
+                except Exception as error:
+                    # Збій журналу чи after_writes не зупиняє письменника: пачка отримує помилку,
+                    # а наступні зміни обробляються як звичайно
+                    outcomes = [(None, error)] * len(batch)
+                # Відповіді надсилаються після after_writes, тож клієнт одразу читає свої зміни
+                for (_, _, future), (result, error) in zip(batch, outcomes):
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            finally:
+                for _ in batch:
+                    self.writes.task_done()
+
+    def apply_writes(self, commands):
+        '''
+        Виконується в потоці письменника; повертає пари (результат, помилка) для кожної зміни
+        '''
+        # Групова фіксація: зміни потрапляють у журнал до виконання, але з однією синхронізацією на пачку
+        sequences = []
+        if self.journal is not None:
+            sequences = [self.journal.append(command, args, sync=False) for command, args in commands]
+            self.journal.sync()
+
+        outcomes = []
+        for number, (command, args) in enumerate(commands):
+            # Записану в журнал зміну треба виконати, навіть якщо клієнт уже відключився
+            try:
+                outcomes.append((self.write(command, args), None))
+            except Exception as error:
+                outcomes.append((None, error))
+            # Невдала зміна могла змінити частину записів, тож її записи теж потрапляють у журнал
+            if sequences and self.applied is not None:
+                self.journal.append_changes(sequences[number], self.applied())
+
+        if self.after_writes is not None:
+            self.after_writes(commands)
+        return outcomes
+
+    @staticmethod
+    def encode(response):
+        return json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n'
@@ -0,0 +1,452 @@
+from address_book import AddressBook, read_address_book, group_birthdays
+from note_book import NotesBook, iter_notes
+from note_index import MODE_AND, tokenize
+from indexes import FUZZY_LIMIT, FUZZY_MAX_DISTANCE, edit_distance
+from book_view import BookView
+from query_cache import QueryCache, cached_query
+from contact_query import combine_results
+from dedupe import find_duplicate_groups, merge_groups
+from snapshot import KIND_CONTACTS, KIND_NOTES, snapshot_is_fresh, snapshot_path
+from classes import Phone
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
+from itertools import islice
+import heapq
+import os
+import re
+import zlib
+
+
+DEFAULT_SHARDS = 8
+
+
+def shard_index(key, count):
+    '''
+    Номер шарду для ключа; crc32 не залежить від PYTHONHASHSEED, тож ключ завжди потрапляє в той самий файл
+    '''
+    return zlib.crc32(key.encode('utf-8', 'surrogatepass')) % count
+
+
+def shard_paths(path, count):
+    '''
+    Файли шардів: address_book.json -> address_book.shard-0-of-8.json, ...
+    '''
+    root, extension = os.path.splitext(path)
+    return [f"{root}.shard-{number}-of-{count}{extension}" for number in range(count)]
+
+
+def manifest_path(path):
+    '''
+    Файл з кількістю шардів книги: address_book.json -> address_book.shards
+    '''
+    return os.path.splitext(path)[0] + '.shards'
+
+
+def stored_shard_count(path):
+    '''
+    Кількість шардів, на яку розбито книгу path, або None, якщо книгу не розбито.
+    Книги, розбиті до появи файлу кількості, впізнаються за іменами файлів шардів;
+    ValueError, якщо поруч лежать шарди кількох розбиттів і невідомо, яке з них чинне
+    '''
+    try:
+        with open(manifest_path(path), 'r', encoding='utf-8') as file:
+            return int(file.read())
+    except FileNotFoundError:
+        pass
+    root, extension = os.path.splitext(os.path.basename(path))
+    pattern = re.compile(re.escape(root) + r'\.shard-\d+-of-(\d+)' + re.escape(extension) + '$')
+    directory = os.path.dirname(path) or '.'
+    counts = sorted({int(match.group(1)) for match in map(pattern.match, os.listdir(directory)) if match})
+    if len(counts) > 1:
+        raise ValueError(f"{path} has shard files for {', '.join(map(str, counts))} shards; "
+                         f"keep the files of one of them")
+    return counts[0] if counts else None
+
+
+def write_shard_count(path, count):
+    temp_path = manifest_path(path) + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(str(count))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, manifest_path(path))
+
+
+def load_contacts_file(path):
+    '''
+    Читає файл шарду контактів; повертає (аргументи AddressBook.fill, помилки)
+    '''
+    errors = []
+    records, search_index = read_address_book(path, errors)
+    return (list(records), search_index), errors
+
+
+def load_notes_file(path):
+    errors = []
+    return (list(iter_notes(path, errors)),), errors
+
+
+class AddressBookShard(AddressBook):
+    '''
+    Шард адресної книги, що пам'ятає, чи змінювався він після збереження
+    '''
+    def __init__(self):
+        self.dirty = False
+        super().__init__()
+
+    def add_record(self, record):
+        self.dirty = True
+        super().add_record(record)
+
+    def reindex_record(self, record):
+        self.dirty = True
+        super().reindex_record(record)
+
+    def delete_record(self, name):
+        if name in self.data:
+            self.dirty = True
+        super().delete_record(name)
+
+
+class NotesBookShard(NotesBook):
+    '''
+    Шард нотаток, що пам'ятає, чи змінювався він після збереження
+    '''
+    def __init__(self):
+        self.dirty = False
+        super().__init__()
+
+    def add_note(self, note):
+        self.dirty = True
+        super().add_note(note)
+
+    def reindex_record(self, note):
+        self.dirty = True
+        super().reindex_record(note)
+
+    def delete(self, title):
+        if title in self.data:
+            self.dirty = True
+        super().delete(title)
+
+
+class ShardedBook:
+    '''
+    Книга, розбита на шарди за хешем ключа. Кожен шард має власні індекси та файл;
+    під час збереження переписуються лише змінені шарди, а файли шардів, що потребують
+    розбору JSON, розбираються паралельно в пулі процесів.
+    Підкласи задають shard_class, snapshot_kind, key_of та метод add_item(item)
+    '''
+    shard_class = None
+    snapshot_kind = None
+    key_of = None
+
+    def __init__(self, shards=DEFAULT_SHARDS, workers=None):
+        self.shards = [self.shard_class() for _ in range(shards)]
+        self.query_cache = QueryCache()
+        # Кількість процесів для розбору JSON; None - за кількістю ядер, 1 - без пулу
+        self.workers = workers
+        self.data = BookView(self)
+
+    @property
+    def generation(self):
+        # Номери поколінь унікальні, тож набір поколінь шардів змінюється з будь-якою зміною книги
+        return tuple(shard.generation for shard in self.shards)
+
+    def shard_for(self, key):
+        return self.shards[shard_index(key, len(self.shards))]
+
+    def find(self, key):
+        return self.shard_for(key).find(key)
+
+    def keys(self):
+        for shard in self.shards:
+            yield from shard.data
+
+    def values(self):
+        for shard in self.shards:
+            yield from shard.data.values()
+
+    def __len__(self):
+        return sum(len(shard.data) for shard in self.shards)
+
+    def __iter__(self):
+        return self.keys()
+
+    def __contains__(self, key):
+        return key in self.shard_for(key).data
+
+    def iter_sorted(self, after=None, offset=0):
+        '''
+        Записи всіх шардів за зростанням ключа: кожен шард уже впорядкований, тож їх лише зливаємо
+        '''
+        merged = heapq.merge(*(shard.iter_sorted(after) for shard in self.shards), key=self.key_of)
+        return islice(merged, offset, None)
+
+    def prepare(self):
+        for shard in self.shards:
+            shard.prepare()
+
+    def load_shards(self, path, load_file, save_file):
+        '''
+        Завантажує шарди з їхніх файлів. Звичайний файл книги чи шарди іншої кількості
+        розподіляються по шардах одразу: нові файли записуються, потім кількість шардів,
+        і лише тоді старі файли шардів видаляються, тож збій посеред цього повторить розподіл
+        '''
+        count = stored_shard_count(path)
+        if count == len(self.shards):
+            return self.read_shards(path, load_file)
+
+        if count is None:
+            if not os.path.isfile(path):
+                self.shards = [self.shard_class() for _ in self.shards]
+                return []
+            loaded, errors = load_file(path)
+            items = loaded[0]
+        else:
+            source = type(self)(count, self.workers)
+            errors = source.read_shards(path, load_file)
+            items = list(source.values())
+
+        self.shards = [self.shard_class() for _ in self.shards]
+        for item in items:
+            self.add_item(item)
+        for shard in self.shards:
+            # Порожній шард теж переписується, щоб не лишився файл від перерваного розподілу
+            shard.dirty = True
+        self.save_shards(path, save_file)
+        write_shard_count(path, len(self.shards))
+        for shard in self.shards:
+            # Усі записи вже у файлах шардів
+            shard.serialized.reset()
+        if count is not None:
+            for shard_path in shard_paths(path, count):
+                for stale_path in (shard_path, snapshot_path(shard_path)):
+                    if os.path.isfile(stale_path):
+                        os.remove(stale_path)
+        return errors
+
+    def read_shards(self, path, load_file):
+        self.shards = [self.shard_class() for _ in self.shards]
+        paths = shard_paths(path, len(self.shards))
+        existing = [number for number, shard_path in enumerate(paths) if os.path.isfile(shard_path)]
+
+        # Свіжі знімки читаються швидше, ніж результати передаються між процесами,
+        # тож пул потрібен лише для кількох шардів, які доведеться розбирати з JSON
+        workers = self.workers or os.cpu_count() or 1
+        parsed = [number for number in existing if not snapshot_is_fresh(paths[number], self.snapshot_kind)]
+        if workers == 1 or len(parsed) < 2:
+            results = map(load_file, (paths[number] for number in existing))
+            return self.fill_shards(existing, paths, results)
+        with ProcessPoolExecutor(min(workers, len(parsed))) as pool:
+            return self.fill_shards(existing, paths, pool.map(load_file, (paths[number] for number in existing)))
+
+    def fill_shards(self, numbers, paths, results):
+        errors = []
+        for number, (loaded, shard_errors) in zip(numbers, results):
+            shard = self.shards[number]
+            shard.fill(*loaded)
+            if shard_errors:
+                shard.serialized.mark_all(shard.data)
+            shard.dirty = False
+            name = os.path.basename(paths[number])
+            errors.extend(f"{name}: {error}" for error in shard_errors)
+        return errors
+
+    def serialize_changes(self, limit=None):
+        done = True
+        for shard in self.shards:
+            if shard.serialized.changed:
+                done = shard.serialize_changes(limit) and done
+        return done
+
+    def autosave_files(self, path):
+        '''
+        Фонове збереження переписує лише шарди, змінені з минулого разу. Прапорець dirty
+        не скидається, тож звичайне збереження все одно запише ці шарди разом зі знімками
+        '''
+        return [file for shard, shard_path in zip(self.shards, shard_paths(path, len(self.shards)))
+                if shard.serialized.pending() for file in shard.autosave_files(shard_path)]
+
+    def save_shards(self, path, save):
+        '''
+        Переписує лише змінені шарди, а також ті, чиїх файлів чи свіжих знімків ще немає
+        '''
+        for shard, shard_path in zip(self.shards, shard_paths(path, len(self.shards))):
+            if shard.dirty or not snapshot_is_fresh(shard_path, self.snapshot_kind):
+                save(shard, shard_path)
+                shard.dirty = False
+
+    def take_changes(self):
+        changes = {}
+        for shard in self.shards:
+            changes.update(shard.take_changes())
+        return changes
+
+    def apply_changes(self, changes):
+        for key, item in changes.items():
+            self.shard_for(key).apply_changes({key: item})
+
+    def refresh_snapshot(self, path):
+        '''
+        Записує знімки шардів, яких немає або які зроблені не з поточних файлів шардів
+        '''
+        for shard, shard_path in zip(self.shards, shard_paths(path, len(self.shards))):
+            if os.path.isfile(shard_path):
+                shard.refresh_snapshot(shard_path)
+
+
+class ShardedAddressBook(ShardedBook):
+    '''
+    Адресна книга з тим самим інтерфейсом, що й AddressBook, розбита на шарди за іменем.
+    Запити розсилаються всім шардам, а впорядковані відповіді зливаються
+    '''
+    shard_class = AddressBookShard
+    snapshot_kind = KIND_CONTACTS
+
+    @staticmethod
+    def key_of(record):
+        return record.name.value
+
+    def add_item(self, record):
+        self.add_record(record)
+
+    def add_record(self, record):
+        self.shard_for(record.name.value).add_record(record)
+
+    def add_records(self, records):
+        for record in records:
+            self.add_record(record)
+
+    def delete_record(self, name):
+        self.shard_for(name).delete_record(name)
+
+    @cached_query()
+    def search_contacts(self, search_string):
+        # Кожен шард повертає записи, впорядковані за іменем
+        results = [shard.search_contacts(search_string) for shard in self.shards]
+        return list(heapq.merge(*results, key=lambda record: record.name.value))
+
+    @cached_query()
+    def query_contacts(self, terms):
+        # Кожен шард планує запит за статистикою власних індексів
+        results = [shard.query_contacts(terms) for shard in self.shards]
+        records = list(heapq.merge(*(result.records for result in results), key=self.key_of))
+        return combine_results(results, records)
+
+    def find_similar(self, name, limit=FUZZY_LIMIT, max_distance=FUZZY_MAX_DISTANCE):
+        candidates = [record for shard in self.shards for record in shard.find_similar(name, limit, max_distance)]
+        word = name.lower()
+        candidates.sort(key=lambda record: (edit_distance(word, record.name.value.lower()), record.name.value))
+        return candidates[:limit]
+
+    @cached_query()
+    def find_duplicates(self):
+        # Дублікати з різними іменами лежать у різних шардах, тож блоки будуються для всієї книги
+        return find_duplicate_groups(self.values())
+
+    def merge_records(self, groups):
+        return merge_groups(self, groups)
+
+    def find_by_phone(self, phone_number):
+        phone = Phone(phone_number).value
+        keys = sorted(key for shard in self.shards for key in shard.phone_index.find(phone))
+        return [self.find(key) for key in keys]
+
+    def find_shared_phones(self):
+        # Один номер може належати контактам з різних шардів, тож власників об'єднуємо
+        owners = defaultdict(list)
+        for shard in self.shards:
+            for phone, names in shard.phone_index.owners.items():
+                owners[phone].extend(names)
+        return {phone: sorted(names) for phone, names in owners.items() if len(names) > 1}
+
+    @cached_query(key=lambda days: date.today())
+    def get_birthdays_in_x_days(self, days):
+        today = datetime.today().date()
+        upcoming = [shard.birthday_index.upcoming(today, days) for shard in self.shards]
+        return group_birthdays(heapq.merge(*upcoming, key=lambda item: (item[1], item[0])))
+
+    def load_address_book(self, path):
+        return self.load_shards(path, load_contacts_file, AddressBook.save_address_book)
+
+    def save_address_book(self, path):
+        self.save_shards(path, AddressBook.save_address_book)
+
+
+class ShardStatistics:
+    '''
+    Статистика BM25 для всіх шардів разом, щоб оцінки різних шардів були порівнянні
+    '''
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.total_documents = sum(index.documents() for index in indexes)
+        total_length = sum(index.total_length for index in indexes)
+        self.total_average = total_length / self.total_documents if self.total_documents else 0
+        self.frequencies = {}
+
+    def documents(self):
+        return self.total_documents
+
+    def average_length(self):
+        return self.total_average
+
+    def document_frequency(self, term):
+        frequency = self.frequencies.get(term)
+        if frequency is None:
+            frequency = self.frequencies[term] = sum(index.document_frequency(term) for index in self.indexes)
+        return frequency
+
+
+class ShardedNotesBook(ShardedBook):
+    '''
+    Нотатки з тим самим інтерфейсом, що й NotesBook, розбиті на шарди за заголовком.
+    Кожен шард ранжує свої нотатки за спільною статистикою, а найкращі результати шардів зливаються
+    '''
+    shard_class = NotesBookShard
+    snapshot_kind = KIND_NOTES
+
+    @staticmethod
+    def key_of(note):
+        return note.title.value
+
+    def add_item(self, note):
+        self.add_note(note)
+
+    def add_note(self, note):
+        self.shard_for(note.title.value).add_note(note)
+
+    def delete(self, title):
+        self.shard_for(title).delete(title)
+
+    @cached_query()
+    def search(self, query, mode=MODE_AND, limit=None):
+        terms = tokenize(query) if isinstance(query, str) else [term for text in query for term in tokenize(text)]
+        statistics = ShardStatistics([shard.index for shard in self.shards])
+        results = []
+        for shard in self.shards:
+            scored = shard.index.search_scored(terms, mode, limit, statistics)
+            results.append([(-score, key, shard) for key, score in scored])
+        merged = heapq.merge(*results, key=lambda item: item[:2])
+        return [shard.data[key] for _, key, shard in islice(merged, limit)]
+
+    @cached_query()
+    def find_by_tags(self, groups, exclude=()):
+        results = [shard.find_by_tags(groups, exclude) for shard in self.shards]
+        return list(heapq.merge(*results, key=self.key_of))
+
+    @cached_query()
+    def notes_by_tag(self):
+        # Нотатки з одним тегом можуть лежати в різних шардах
+        notes = defaultdict(list)
+        for shard in self.shards:
+            for tag, tagged in shard.notes_by_tag():
+                notes[tag].append(tagged)
+        return [(tag, list(heapq.merge(*notes[tag], key=self.key_of))) for tag in sorted(notes)]
+
+    def load_notes(self, filename):
+        return self.load_shards(filename, load_notes_file, NotesBook.save_notes)
+
+    def save_notes(self, filename):
+        self.save_shards(filename, NotesBook.save_notes)
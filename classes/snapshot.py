@@ -0,0 +1,331 @@
+'''
+Двійковий знімок книг для швидкого запуску.
+
+Знімок містить уже перевірені й нормалізовані значення полів, тож під час
+завантаження не виконуються регулярні вирази та strptime. Поля зберігаються
+стовпцями: текст усіх значень поля декодується одним викликом, а числа
+читаються цілими масивами. Знімок контактів містить і списки індексу триграм,
+тож під час завантаження цей індекс не будується заново. Заголовок зберігає
+розмір і час зміни JSON-файлу, з якого зроблено знімок; якщо JSON змінився,
+знімок вважається застарілим і книга читається з JSON.
+
+Конвертер між форматами:
+    python classes/snapshot.py to-snapshot address_book.json
+    python classes/snapshot.py to-json address_book.snap
+'''
+from array import array
+from collections import namedtuple
+from datetime import datetime
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from classes import Record, Note, Tag
+from indexes import TrigramIndex
+from storage import iter_json_records, write_json_records
+
+
+MAGIC = b'YBSNAP\r\n'
+# Версія 2 додала теги нотаток, версія 3 зберігає поля стовпцями разом з індексом триграм контактів
+SNAPSHOT_VERSION = 3
+SNAPSHOT_EXTENSION = '.snap'
+
+KIND_CONTACTS = 1
+KIND_NOTES = 2
+
+# magic, версія, тип, час зміни та розмір JSON-джерела, кількість записів
+HEADER = struct.Struct('<8sHBxqqI')
+# Довжина розділу знімка в байтах
+SECTION = struct.Struct('<Q')
+SIZE = struct.Struct('<I')
+
+# Довжина відсутнього значення в стовпці тексту
+NO_VALUE = -1
+PHONE_SIZE = 10
+GRAM_SIZE = 3
+
+# Записи знімка: Snapshot.items; search_index - TrigramIndex контактів, None для нотаток
+Snapshot = namedtuple('Snapshot', ['items', 'search_index'])
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + SNAPSHOT_EXTENSION
+
+
+def source_stamp(path):
+    '''
+    Розмір і час зміни JSON-файлу, з яким порівнюється знімок
+    '''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def snapshot_is_fresh(path, kind):
+    '''
+    Чи є для JSON-файлу path знімок типу kind, зроблений саме з цієї версії файлу
+    '''
+    try:
+        _, version, snapshot_kind, mtime_ns, size, _ = read_snapshot_header(snapshot_path(path))
+    except (OSError, struct.error):
+        return False
+    return version == SNAPSHOT_VERSION and snapshot_kind == kind and (mtime_ns, size) == source_stamp(path)
+
+
+def _array_bytes(values):
+    # Масиви знімка зберігаються в порядку байтів little-endian незалежно від платформи
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _pack_texts(texts):
+    '''
+    Стовпець тексту: довжини значень у символах та всі значення одним блоком UTF-8
+    '''
+    lengths = array('i', [NO_VALUE if text is None else len(text) for text in texts])
+    data = ''.join(text for text in texts if text is not None).encode('utf-8', 'surrogatepass')
+    return [_array_bytes(lengths), data]
+
+
+def _pack_records(records, search_index):
+    '''
+    Розділи знімка контактів. Записи йдуть у порядку номерів індексу триграм,
+    тож його списки зберігаються як є, разом з номерами видалених записів
+    '''
+    numbers = array('I', [number for number, key in enumerate(search_index.keys) if key is not None])
+    records = [records[search_index.keys[number]] for number in numbers]
+    phones = [phone.value for record in records for phone in record.phones]
+    sections = _pack_texts([record.name.value for record in records])
+    sections.append(_array_bytes(array('i', [record.birthday.value.toordinal() if record.birthday else 0
+                                             for record in records])))
+    sections.extend(_pack_texts([record.address.value if record.address else None for record in records]))
+    sections.extend(_pack_texts([record.email.value if record.email else None for record in records]))
+    sections.append(_array_bytes(array('H', [len(record.phones) for record in records])))
+    sections.append(''.join(phones).encode('ascii'))
+
+    postings = search_index.postings
+    lengths = array('I', map(len, postings.values()))
+    positions = array('I')
+    for posting in postings.values():
+        positions.extend(posting)
+    sections.append(SIZE.pack(len(search_index.keys)))
+    sections.append(_array_bytes(numbers))
+    sections.append(''.join(postings).encode('utf-8', 'surrogatepass'))
+    sections.append(_array_bytes(lengths))
+    sections.append(_array_bytes(positions))
+    return len(records), sections
+
+
+def _pack_notes(notes):
+    notes = list(notes)
+    sections = _pack_texts([note.title.value for note in notes])
+    sections.extend(_pack_texts([note.description.value for note in notes]))
+    sections.append(_array_bytes(array('H', [len(note.tags) for note in notes])))
+    sections.extend(_pack_texts([tag.value for note in notes for tag in note.tags]))
+    return len(notes), sections
+
+
+def write_snapshot(path, kind, items, stamp, search_index=None):
+    '''
+    Атомарно записує знімок з відміткою JSON-джерела. Для контактів items - словник записів
+    за іменем, а search_index - його TrigramIndex; для нотаток items - самі нотатки
+    '''
+    if kind == KIND_CONTACTS:
+        count, sections = _pack_records(items, search_index)
+    else:
+        count, sections = _pack_notes(items)
+    mtime_ns, size = stamp or (0, -1)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, kind, mtime_ns, size, count))
+        for data in sections:
+            file.write(SECTION.pack(len(data)))
+            file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class SnapshotReader:
+    '''
+    Читає розділи знімка з відображеного в пам'ять файлу
+    '''
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = HEADER.size
+
+    def section(self):
+        (length,) = SECTION.unpack_from(self.buffer, self.offset)
+        start = self.offset + SECTION.size
+        self.offset = start + length
+        if self.offset > len(self.buffer):
+            raise ValueError("Truncated snapshot")
+        return self.buffer[start:self.offset]
+
+    def array(self, typecode, count=None):
+        values = array(typecode)
+        values.frombytes(self.section())
+        if sys.byteorder != 'little':
+            values.byteswap()
+        if count is not None and len(values) != count:
+            raise ValueError("Snapshot column has a wrong length")
+        return values
+
+    def texts(self, count=None):
+        lengths = self.array('i', count)
+        data = str(self.section(), 'utf-8', 'surrogatepass')
+        texts = []
+        position = 0
+        for length in lengths:
+            if length == NO_VALUE:
+                texts.append(None)
+            else:
+                end = position + length
+                texts.append(data[position:end])
+                position = end
+        if position != len(data):
+            raise ValueError("Snapshot column has a wrong length")
+        return texts
+
+    def records(self, count):
+        names = self.texts(count)
+        ordinals = self.array('i', count)
+        addresses = self.texts(count)
+        emails = self.texts(count)
+        phone_counts = self.array('H', count)
+        phones = str(self.section(), 'ascii')
+        if len(phones) != PHONE_SIZE * sum(phone_counts):
+            raise ValueError("Snapshot column has a wrong length")
+
+        records = []
+        position = 0
+        for name, ordinal, address, email, phone_count in zip(names, ordinals, addresses, emails, phone_counts):
+            end = position + PHONE_SIZE * phone_count
+            record_phones = [phones[start:start + PHONE_SIZE] for start in range(position, end, PHONE_SIZE)]
+            position = end
+            birthday = datetime.fromordinal(ordinal) if ordinal else None
+            records.append(Record.restore(name, record_phones, birthday=birthday, address=address, email=email))
+
+        (size,) = SIZE.unpack(self.section())
+        numbers = self.array('I', count)
+        keys = [None] * size
+        for number, name in zip(numbers, names):
+            keys[number] = name
+        grams = str(self.section(), 'utf-8', 'surrogatepass')
+        lengths = self.array('I', len(grams) // GRAM_SIZE)
+        positions = self.array('I', sum(lengths))
+        postings = {}
+        position = 0
+        for start, length in zip(range(0, len(grams), GRAM_SIZE), lengths):
+            end = position + length
+            postings[grams[start:start + GRAM_SIZE]] = positions[position:end]
+            position = end
+        return Snapshot(records, TrigramIndex.restore(keys, postings))
+
+    def notes(self, count):
+        titles = self.texts(count)
+        descriptions = self.texts(count)
+        tag_counts = self.array('H', count)
+        tags = self.texts(sum(tag_counts))
+        notes = []
+        position = 0
+        for title, description, tag_count in zip(titles, descriptions, tag_counts):
+            note = Note(title, description)
+            note.tags = [Tag.trusted(tag) for tag in tags[position:position + tag_count]]
+            position += tag_count
+            notes.append(note)
+        return Snapshot(notes, None)
+
+
+def read_snapshot(path, kind, stamp=None):
+    '''
+    Повертає Snapshot або None, якщо знімка немає, він іншого типу,
+    пошкоджений чи застарів відносно stamp
+    '''
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, version, snapshot_kind, mtime_ns, size, count = HEADER.unpack_from(buffer)
+            if magic != MAGIC or version != SNAPSHOT_VERSION or snapshot_kind != kind:
+                return None
+            if stamp is not None and (mtime_ns, size) != stamp:
+                return None
+            reader = SnapshotReader(buffer)
+            try:
+                return reader.records(count) if kind == KIND_CONTACTS else reader.notes(count)
+            except (struct.error, UnicodeDecodeError, ValueError, IndexError):
+                # Обрізаний або пошкоджений знімок: читаємо книгу з JSON
+                return None
+
+
+def read_snapshot_header(path):
+    with open(path, 'rb') as file:
+        return HEADER.unpack(file.read(HEADER.size))
+
+
+def to_snapshot(source, target, kind):
+    errors = []
+    build = Record.from_dict if kind == KIND_CONTACTS else Note.from_dict
+    items = []
+    for number, item_dict in iter_json_records(source, errors):
+        try:
+            items.append(build(item_dict))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            errors.append(f"Record {number}: {e}")
+    search_index = None
+    if kind == KIND_CONTACTS:
+        # Як і в книзі, пізніший контакт з тим самим іменем замінює попередній
+        items = {record.name.value: record for record in items}
+        search_index = TrigramIndex()
+        for record in items.values():
+            search_index.add(record)
+    write_snapshot(target, kind, items, source_stamp(source), search_index)
+    return len(items), errors
+
+
+def to_json(source, target):
+    kind = read_snapshot_header(source)[2]
+    snapshot = read_snapshot(source, kind)
+    items = snapshot.items if snapshot is not None else []
+    write_json_records(target, (item.to_dict() for item in items))
+    return len(items), []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert books between JSON and binary snapshots")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    to_snapshot_parser = subparsers.add_parser("to-snapshot", help="JSON or JSON Lines to snapshot")
+    to_snapshot_parser.add_argument("source")
+    to_snapshot_parser.add_argument("target", nargs="?")
+    to_snapshot_parser.add_argument("--notes", action="store_true", help="source is a notes book")
+    to_json_parser = subparsers.add_parser("to-json", help="snapshot to JSON or JSON Lines")
+    to_json_parser.add_argument("source")
+    to_json_parser.add_argument("target", nargs="?")
+    options = parser.parse_args(argv)
+
+    if options.action == "to-snapshot":
+        target = options.target or snapshot_path(options.source)
+        kind = KIND_NOTES if options.notes else KIND_CONTACTS
+        count, errors = to_snapshot(options.source, target, kind)
+    else:
+        target = options.target or os.path.splitext(options.source)[0] + '.json'
+        count, errors = to_json(options.source, target)
+
+    for error in errors:
+        print(error)
+    print(f"Converted {count} record(s) to {target}")
+
+
+if __name__ == "__main__":
+    main()
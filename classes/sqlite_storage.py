@@ -0,0 +1,515 @@
+from classes import Record, Note, Phone
+from note_index import MODE_AND, tokenize
+from contact_query import BirthdayTerm, QueryResult
+from dedupe import find_duplicate_groups, merge_groups
+from address_book import group_birthdays
+from indexes import edit_distance, FUZZY_LIMIT, FUZZY_MAX_DISTANCE, FIELD_SEPARATOR, searchable_text, birthday_key, birthday_in_year, birthday_key_ranges, LEAP_YEAR
+from validators import PHONE_LENGTH
+from book_view import BookView
+from itertools import groupby
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+import heapq
+import sqlite3
+
+
+CONTACTS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    birthday TEXT,
+    birthday_key INTEGER,
+    address TEXT,
+    email TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_birthday_key ON contacts (birthday_key);
+CREATE TABLE IF NOT EXISTS phones (
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+CREATE INDEX IF NOT EXISTS phones_contact ON phones (contact_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5 (text, tokenize='trigram');
+'''
+
+NOTES_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5 (title, description, tokenize='trigram');
+CREATE TABLE IF NOT EXISTS note_tags (
+    note_id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags (tag);
+CREATE INDEX IF NOT EXISTS note_tags_note ON note_tags (note_id);
+'''
+
+# Триграмний токенізатор FTS5 індексує лише підрядки довжиною від трьох символів
+MIN_FTS_QUERY = 3
+
+
+def connect(path, schema):
+    # Кожна зміна фіксується одразу, тож окремий журнал для SQLite не потрібен
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.executescript(schema)
+    return connection
+
+
+@contextmanager
+def transaction(connection):
+    '''
+    Транзакція, що приєднується до вже відкритої, якщо така є
+    '''
+    if connection.in_transaction:
+        yield
+        return
+    connection.execute('BEGIN')
+    try:
+        yield
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def like_pattern(text):
+    return f'%{like_escape(text)}%'
+
+
+def lower_text(value):
+    # Вбудована lower() у SQLite змінює лише латинські літери
+    return value.lower() if isinstance(value, str) else value
+
+
+def term_patterns(term, separator=None):
+    '''
+    Шаблони LIKE для текстової умови з межами ^ та $. Якщо значення - кілька полів
+    через separator, межі полів усередині тексту теж вважаються межами значення
+    '''
+    text = like_escape(term.text)
+    start = '' if term.prefix else '%'
+    end = '' if term.suffix else '%'
+    patterns = [f'{start}{text}{end}']
+    if separator is not None:
+        if term.prefix:
+            patterns.append(f'%{separator}{text}{end}')
+        if term.suffix:
+            patterns.append(f'{start}{text}{separator}%')
+        if term.prefix and term.suffix:
+            patterns.append(f'%{separator}{text}{separator}%')
+    return patterns
+
+
+def query_condition(term):
+    '''
+    Умова WHERE та її параметри для умови запиту до контактів
+    '''
+    if isinstance(term, BirthdayTerm):
+        conditions = ['c.birthday_key BETWEEN ? AND ?'] * len(term.ranges)
+        params = [bound for key_range in term.ranges for bound in key_range]
+        condition = f"({' OR '.join(conditions)})" if conditions else 'c.birthday IS NOT NULL'
+        if term.year is not None:
+            condition += ' AND substr(c.birthday, 7, 4) = ?'
+            params.append(f'{term.year:04d}')
+        return condition, params
+
+    if term.field == 'phone':
+        if len(term.text) == PHONE_LENGTH:
+            return 'c.id IN (SELECT contact_id FROM phones WHERE phone = ?)', [term.text]
+        return ("EXISTS (SELECT 1 FROM phones WHERE contact_id = c.id AND phone LIKE ? ESCAPE '\\')",
+                term_patterns(term))
+    if term.field is not None:
+        return f"lower_text(c.{term.field}) LIKE ? ESCAPE '\\'", term_patterns(term)
+
+    # Будь-яке поле: текст пошуку вже в нижньому регістрі й розбитий на поля
+    if not term.prefix and not term.suffix and len(term.text) >= MIN_FTS_QUERY:
+        return 'c.id IN (SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH ?)', [fts_phrase(term.text)]
+    patterns = term_patterns(term, FIELD_SEPARATOR)
+    condition = ' OR '.join(["text LIKE ? ESCAPE '\\'"] * len(patterns))
+    return f'c.id IN (SELECT rowid FROM contacts_fts WHERE {condition})', patterns
+
+
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def split_pieces(text, count):
+    '''
+    Ділить рядок на count сусідніх шматків майже однакової довжини
+    '''
+    size = len(text) // count
+    bounds = [part * size for part in range(count)] + [len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+class SQLiteAddressBook:
+    '''
+    Адресна книга, що зберігає контакти в SQLite замість словника в пам'яті
+    '''
+    SELECT_CONTACTS = '''
+        SELECT c.name, c.birthday, c.address, c.email,
+               (SELECT group_concat(phone, ' ') FROM
+                   (SELECT phone FROM phones WHERE contact_id = c.id ORDER BY position))
+        FROM contacts AS c
+    '''
+
+    def __init__(self):
+        self.connection = None
+        self.data = BookView(self)
+
+    def load_address_book(self, path):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = connect(path, CONTACTS_SCHEMA)
+        self.connection.create_function('lower_text', 1, lower_text, deterministic=True)
+        return []
+
+    def save_address_book(self, path):
+        '''
+        Зміни вже зафіксовані; лише скидаємо журнал WAL у файл бази
+        '''
+        self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _record_from_row(self, row):
+        name, birthday, address, email, phones = row
+        record = Record(name, birthday=birthday)
+        if address:
+            record.add_address(address)
+        if email:
+            record.add_email(email)
+        for phone in (phones or '').split():
+            record.add_phone(phone)
+        record.book = self
+        return record
+
+    def _select(self, where='', params=(), order='ORDER BY c.name'):
+        cursor = self.connection.execute(f'{self.SELECT_CONTACTS} {where} {order}', params)
+        for row in cursor:
+            yield self._record_from_row(row)
+
+    def _write(self, record):
+        birthday = record.birthday.value if record.birthday else None
+        values = (
+            birthday.strftime('%d.%m.%Y') if birthday else None,
+            birthday_key(birthday.month, birthday.day) if birthday else None,
+            record.address.value if record.address else None,
+            record.email.value if record.email else None,
+            record.name.value,
+        )
+        with transaction(self.connection):
+            row = self.connection.execute(
+                'SELECT id FROM contacts WHERE name = ?', (record.name.value,)).fetchone()
+            if row:
+                contact_id = row[0]
+                self.connection.execute(
+                    'UPDATE contacts SET birthday = ?, birthday_key = ?, address = ?, email = ? '
+                    'WHERE name = ?', values)
+                self.connection.execute('DELETE FROM phones WHERE contact_id = ?', (contact_id,))
+                self.connection.execute('DELETE FROM contacts_fts WHERE rowid = ?', (contact_id,))
+            else:
+                contact_id = self.connection.execute(
+                    'INSERT INTO contacts (birthday, birthday_key, address, email, name) '
+                    'VALUES (?, ?, ?, ?, ?)', values).lastrowid
+            self.connection.executemany(
+                'INSERT INTO phones (contact_id, position, phone) VALUES (?, ?, ?)',
+                [(contact_id, position, phone.value) for position, phone in enumerate(record.phones)])
+            self.connection.execute(
+                'INSERT INTO contacts_fts (rowid, text) VALUES (?, ?)',
+                (contact_id, searchable_text(record)))
+
+    def add_record(self, record):
+        if isinstance(record, Record):
+            self._write(record)
+            record.book = self
+
+    def add_records(self, records):
+        '''
+        Додає кілька записів однією транзакцією
+        '''
+        with transaction(self.connection):
+            for record in records:
+                self.add_record(record)
+
+    def reindex_record(self, record):
+        '''
+        Зберігає зміни запису, отриманого з цієї книги
+        '''
+        if self.find(record.name.value) is not None:
+            self._write(record)
+
+    def find(self, name):
+        return next(self._select('WHERE c.name = ?', (name,), order=''), None)
+
+    def delete_record(self, name):
+        with transaction(self.connection):
+            row = self.connection.execute('SELECT id FROM contacts WHERE name = ?', (name,)).fetchone()
+            if row:
+                self.connection.execute('DELETE FROM contacts_fts WHERE rowid = ?', row)
+                self.connection.execute('DELETE FROM contacts WHERE id = ?', row)
+
+    def find_similar(self, name, limit=FUZZY_LIMIT, max_distance=FUZZY_MAX_DISTANCE):
+        '''
+        Нечіткий пошук без дерева імен у пам'яті. Ім'я в межах max_distance правок містить без змін
+        хоча б один з max_distance + 1 шматків запиту: якщо шматки мають від трьох символів,
+        кандидатів дає триграмний індекс FTS5, інакше перевіряються імена схожої довжини
+        '''
+        query = name.lower()
+        pieces = split_pieces(query, max_distance + 1)
+        if min(map(len, pieces)) >= MIN_FTS_QUERY:
+            rows = self.connection.execute(
+                'SELECT c.name FROM contacts_fts JOIN contacts AS c ON c.id = contacts_fts.rowid '
+                'WHERE contacts_fts MATCH ?', (' OR '.join(fts_phrase(piece) for piece in pieces),))
+        else:
+            rows = self.connection.execute(
+                'SELECT name FROM contacts WHERE length(name) BETWEEN ? AND ?',
+                (len(query) - max_distance, len(query) + max_distance))
+        matches = []
+        for (candidate,) in rows:
+            distance = edit_distance(query, candidate.lower(), max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        return [record for record in (self.find(key) for _, key in heapq.nsmallest(limit, matches))
+                if record is not None]
+
+    def search_contacts(self, search_string):
+        query = search_string.lower()
+        if len(query) >= MIN_FTS_QUERY:
+            where = 'WHERE c.id IN (SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH ?)'
+            return list(self._select(where, (fts_phrase(query),)))
+        where = "WHERE c.id IN (SELECT rowid FROM contacts_fts WHERE text LIKE ? ESCAPE '\\')"
+        return list(self._select(where, (like_pattern(query),)))
+
+    def query_contacts(self, terms):
+        '''
+        Умови запиту стають умовами WHERE; індекс обирає планувальник SQLite,
+        і його план повертається для explain
+        '''
+        conditions, params = [], []
+        for term in terms:
+            condition, term_params = query_condition(term)
+            conditions.append(f'({condition})')
+            params.extend(term_params)
+        where = 'WHERE ' + ' AND '.join(conditions)
+        plan = self.connection.execute(f'EXPLAIN QUERY PLAN {self.SELECT_CONTACTS} {where} ORDER BY c.name', params)
+        details = tuple(row[-1] for row in plan)
+        records = list(self._select(where, params))
+        return QueryResult(records, (), None, 1, details)
+
+    def find_duplicates(self):
+        return find_duplicate_groups(self.values())
+
+    def merge_records(self, groups):
+        '''
+        Зливає групи дублікатів однією транзакцією
+        '''
+        with transaction(self.connection):
+            return merge_groups(self, groups)
+
+    def find_by_phone(self, phone_number):
+        phone = Phone(phone_number).value
+        where = 'WHERE c.id IN (SELECT contact_id FROM phones WHERE phone = ?)'
+        return list(self._select(where, (phone,)))
+
+    def find_shared_phones(self):
+        rows = self.connection.execute('''
+            SELECT p.phone, group_concat(c.name, char(10)) FROM phones AS p
+            JOIN contacts AS c ON c.id = p.contact_id
+            WHERE p.phone IN (
+                SELECT phone FROM phones GROUP BY phone HAVING count(DISTINCT contact_id) > 1)
+            GROUP BY p.phone
+        ''')
+        return {phone: sorted(set(names.split('\n'))) for phone, names in rows}
+
+    def get_birthdays_in_x_days(self, days):
+        today = datetime.today().date()
+        upcoming = []
+        seen = set()
+        total = self.connection.execute(
+            'SELECT count(*) FROM contacts WHERE birthday_key IS NOT NULL').fetchone()[0]
+
+        for year, low, high in birthday_key_ranges(today, days):
+            rows = self.connection.execute(
+                'SELECT name, birthday_key FROM contacts WHERE birthday_key BETWEEN ? AND ? '
+                'ORDER BY birthday_key, name', (low, high))
+            for name, key in rows:
+                if name in seen:
+                    continue
+                seen.add(name)
+                birthday = date(LEAP_YEAR, 1, 1) + timedelta(days=key - 1)
+                upcoming.append((name, birthday_in_year(birthday.month, birthday.day, year)))
+            if len(seen) == total:
+                break
+
+        return group_birthdays(upcoming)
+
+    def iter_sorted(self, after=None, offset=0):
+        '''
+        Записи за зростанням імені; унікальний індекс за іменем дозволяє почати одразу з after
+        '''
+        where = 'WHERE c.name > ?' if after is not None else ''
+        params = (after, offset) if after is not None else (offset,)
+        return self._select(where, params, order='ORDER BY c.name LIMIT -1 OFFSET ?')
+
+    def keys(self):
+        return (row[0] for row in self.connection.execute('SELECT name FROM contacts ORDER BY id'))
+
+    def values(self):
+        return self._select(order='ORDER BY c.id')
+
+    def __len__(self):
+        return self.connection.execute('SELECT count(*) FROM contacts').fetchone()[0]
+
+    def __iter__(self):
+        return self.keys()
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+
+class SQLiteNotesBook:
+    '''
+    Книга нотаток у SQLite з повнотекстовим індексом FTS5 за заголовками та описами
+    '''
+    SELECT_NOTES = '''
+        SELECT n.title, n.description,
+               (SELECT group_concat(tag, ' ') FROM
+                   (SELECT tag FROM note_tags WHERE note_id = n.id ORDER BY rowid))
+        FROM notes AS n
+    '''
+
+    def __init__(self):
+        self.connection = None
+        self.data = BookView(self)
+
+    def load_notes(self, filename):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = connect(filename, NOTES_SCHEMA)
+        return []
+
+    def save_notes(self, filename):
+        self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _note_from_row(self, row):
+        title, description, tags = row
+        note = Note(title, description, tags.split(' ') if tags else ())
+        note.book = self
+        return note
+
+    def _write(self, note):
+        with transaction(self.connection):
+            row = self.connection.execute(
+                'SELECT id FROM notes WHERE title = ?', (note.title.value,)).fetchone()
+            if row:
+                note_id = row[0]
+                self.connection.execute(
+                    'UPDATE notes SET description = ? WHERE id = ?', (note.description.value, note_id))
+                self.connection.execute('DELETE FROM notes_fts WHERE rowid = ?', (note_id,))
+                self.connection.execute('DELETE FROM note_tags WHERE note_id = ?', (note_id,))
+            else:
+                note_id = self.connection.execute(
+                    'INSERT INTO notes (title, description) VALUES (?, ?)',
+                    (note.title.value, note.description.value)).lastrowid
+            self.connection.execute(
+                'INSERT INTO notes_fts (rowid, title, description) VALUES (?, ?, ?)',
+                (note_id, note.title.value, note.description.value))
+            self.connection.executemany(
+                'INSERT INTO note_tags (note_id, tag) VALUES (?, ?)', ((note_id, tag.value) for tag in note.tags))
+
+    def add_note(self, note):
+        if isinstance(note, Note):
+            self._write(note)
+            note.book = self
+
+    def reindex_record(self, note):
+        if self.find(note.title.value) is not None:
+            self._write(note)
+
+    def find(self, title):
+        row = self.connection.execute(self.SELECT_NOTES + 'WHERE n.title = ?', (title,)).fetchone()
+        return self._note_from_row(row) if row else None
+
+    def search(self, query, mode=MODE_AND, limit=None):
+        '''
+        Пошук нотаток, упорядкований за вбудованою в FTS5 оцінкою BM25
+        '''
+        terms = tokenize(query) if isinstance(query, str) else [term for text in query for term in tokenize(text)]
+        if not terms:
+            return []
+        joiner = ' AND ' if mode == MODE_AND else ' OR '
+        limit_clause = ' LIMIT ?' if limit is not None else ''
+        limit_params = (limit,) if limit is not None else ()
+        if all(len(term) >= MIN_FTS_QUERY for term in terms):
+            rows = self.connection.execute(
+                self.SELECT_NOTES + 'JOIN notes_fts ON n.id = notes_fts.rowid '
+                'WHERE notes_fts MATCH ? ORDER BY notes_fts.rank, n.id' + limit_clause,
+                (joiner.join(fts_phrase(term) for term in terms), *limit_params))
+        else:
+            condition = joiner.join(["(n.title LIKE ? ESCAPE '\\' OR n.description LIKE ? ESCAPE '\\')"] * len(terms))
+            params = [pattern for term in terms for pattern in (like_pattern(term),) * 2]
+            rows = self.connection.execute(
+                self.SELECT_NOTES + f"WHERE {condition} ORDER BY n.id" + limit_clause,
+                (*params, *limit_params))
+        return [self._note_from_row(row) for row in rows]
+
+    def find_by_tags(self, groups, exclude=()):
+        '''
+        Теги відбираються запитом з INTERSECT та EXCEPT над індексом тегів
+        '''
+        selects, params = [], []
+        for group in groups:
+            selects.append(f"SELECT note_id FROM note_tags WHERE tag IN ({', '.join('?' * len(group))})")
+            params.extend(group)
+        if not selects:
+            selects.append('SELECT id FROM notes')
+        query = ' INTERSECT '.join(selects)
+        if exclude:
+            query += f" EXCEPT SELECT note_id FROM note_tags WHERE tag IN ({', '.join('?' * len(exclude))})"
+            params.extend(exclude)
+        rows = self.connection.execute(self.SELECT_NOTES + f'WHERE n.id IN ({query}) ORDER BY n.title', params)
+        return [self._note_from_row(row) for row in rows]
+
+    def notes_by_tag(self):
+        rows = self.connection.execute(
+            'SELECT t.tag, n.title FROM note_tags AS t JOIN notes AS n ON n.id = t.note_id ORDER BY t.tag, n.title')
+        grouped = groupby(rows.fetchall(), key=lambda row: row[0])
+        return [(tag, [self.find(title) for _, title in group]) for tag, group in grouped]
+
+    def delete(self, title):
+        with transaction(self.connection):
+            row = self.connection.execute('SELECT id FROM notes WHERE title = ?', (title,)).fetchone()
+            if row:
+                self.connection.execute('DELETE FROM notes_fts WHERE rowid = ?', row)
+                self.connection.execute('DELETE FROM notes WHERE id = ?', row)
+
+    def iter_sorted(self, after=None, offset=0):
+        where = 'WHERE n.title > ?' if after is not None else ''
+        params = (after, offset) if after is not None else (offset,)
+        rows = self.connection.execute(self.SELECT_NOTES + f'{where} ORDER BY n.title LIMIT -1 OFFSET ?', params)
+        return (self._note_from_row(row) for row in rows)
+
+    def keys(self):
+        return (row[0] for row in self.connection.execute('SELECT title FROM notes ORDER BY id'))
+
+    def values(self):
+        rows = self.connection.execute(self.SELECT_NOTES + 'ORDER BY n.id')
+        return (self._note_from_row(row) for row in rows)
+
+    def __len__(self):
+        return self.connection.execute('SELECT count(*) FROM notes').fetchone()[0]
+
+    def __iter__(self):
+        return self.keys()
+
+    def __contains__(self, title):
+        return self.find(title) is not None
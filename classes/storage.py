@@ -0,0 +1,252 @@
+from itertools import islice
+import json
+import os
+
+
+# Розмір блоку, яким читається файл книги
+CHUNK_SIZE = 64 * 1024
+
+# Максимальний розмір одного запису; довший незавершений запис вважається пошкодженим
+MAX_RECORD_SIZE = 1024 * 1024
+
+JSON_LINES_EXTENSION = '.jsonl'
+
+
+def is_json_lines(path):
+    return path.endswith(JSON_LINES_EXTENSION)
+
+
+def iter_json_records(path, errors):
+    '''
+    Потоково читає записи книги з JSON-масиву або JSON Lines.
+    Повертає пари (номер запису, словник); помилки окремих записів додаються до errors
+    '''
+    for number, record, _ in iter_json_texts(path, errors):
+        yield number, record
+
+
+def iter_json_texts(path, errors):
+    '''
+    Те саме, що iter_json_records, але разом зі словником повертає й текст запису у файлі
+    '''
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as file:
+        head = file.read(CHUNK_SIZE)
+        stripped = head.lstrip()
+        if stripped.startswith('['):
+            yield from _iter_array(file, stripped[1:], errors)
+        elif stripped:
+            yield from _iter_lines(file, head, errors)
+
+
+def _check_record(number, record, text, errors):
+    try:
+        # Некоректні байти UTF-8 залишаються у тексті як сурогати
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        errors.append(f"Record {number}: invalid UTF-8 data")
+        return False
+    if not isinstance(record, dict):
+        errors.append(f"Record {number}: expected an object")
+        return False
+    return True
+
+
+def _iter_lines(file, head, errors):
+    number = 0
+    # Перший блок уже прочитано, тому дочитуємо його рядок до кінця
+    lines = (head + file.readline()).splitlines()
+    for line in _chain_lines(lines, file):
+        line = line.strip()
+        if not line:
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append(f"Record {number}: {e.msg}")
+            continue
+        if _check_record(number, record, line, errors):
+            yield number, record, line
+
+
+def _chain_lines(lines, file):
+    yield from lines
+    yield from file
+
+
+def _iter_array(file, buffer, errors):
+    decoder = json.JSONDecoder()
+    position = 0
+    number = 0
+    eof = False
+
+    while True:
+        # Пропускаємо пробіли та коми між записами, дочитуючи файл за потреби
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+
+        if position >= len(buffer):
+            errors.append("Unexpected end of file: closing ']' is missing")
+            return
+        if buffer[position] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if not eof and len(buffer) - position < MAX_RECORD_SIZE:
+                # Запис міг обірватися на межі блоку
+                chunk = file.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+
+            number += 1
+            errors.append(f"Record {number}: {e.msg}")
+            # Записи книги не містять вкладених об'єктів, тож наступний '{' починає новий запис
+            next_record = buffer.find('{', position + 1)
+            while next_record == -1 and not eof:
+                chunk = file.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                next_record = buffer.find('{', position + 1)
+            if next_record == -1:
+                return
+            position = next_record
+            continue
+
+        number += 1
+        text = buffer[position:end]
+        if _check_record(number, record, text, errors):
+            yield number, record, text
+        position = end
+
+
+def write_json_records(path, records):
+    '''
+    Потоково записує словники записів у JSON-масив або JSON Lines.
+    Файл замінюється атомарно, тож збій під час запису не пошкоджує попередню версію
+    '''
+    write_serialized_records(path, (json.dumps(record, ensure_ascii=False) for record in records))
+
+
+def write_serialized_records(path, texts):
+    '''
+    Те саме, що write_json_records, для записів, уже перетворених на рядки JSON
+    '''
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        if is_json_lines(path):
+            for text in texts:
+                file.write(text)
+                file.write('\n')
+        else:
+            file.write('[')
+            separator = ''
+            for text in texts:
+                file.write(separator)
+                file.write(text)
+                separator = ', '
+            file.write(']')
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class SerializedRecords:
+    '''
+    Зміни книги для фонового збереження. Книга позначає змінені ключі, і під час збереження
+    серіалізуються лише вони, а незмінені записи копіюються текстом з попередньої версії файлу.
+    Рядки JSON змінених записів тримаються в пам'яті лише до успішного запису файлу
+    '''
+    def __init__(self, key_field):
+        # Поле словника запису, за яким у файлі впізнається його ключ
+        self.key_field = key_field
+        # Ключ -> рядок JSON або None для видаленого запису
+        self.lines = {}
+        # Словник замість множини зберігає порядок, у якому записи змінювались
+        self.changed = {}
+        # Файл треба скласти лише з рядків lines, не копіюючи нічого з попередньої версії
+        self.rewrite = False
+        # Ключі, змінені після останнього запису змін у журнал
+        self.touched = {}
+
+    def mark(self, key):
+        self.changed[key] = None
+        self.touched[key] = None
+
+    def take_touched(self):
+        '''
+        Ключі, змінені з попереднього виклику, у порядку зміни
+        '''
+        touched, self.touched = self.touched, {}
+        return touched
+
+    def reset(self):
+        '''
+        Книга збігається зі своїм файлом, наприклад одразу після завантаження
+        '''
+        self.lines = {}
+        self.changed = {}
+        self.rewrite = False
+        self.touched = {}
+
+    def mark_all(self, keys):
+        '''
+        Наступне збереження перепише файл лише з записів keys, зокрема без записів файлу,
+        які не вдалося завантажити
+        '''
+        self.rewrite = True
+        for key in keys:
+            self.changed[key] = None
+
+    def pending(self):
+        return bool(self.lines or self.changed or self.rewrite)
+
+    def serialize(self, data, limit=None):
+        '''
+        Серіалізує до limit змінених записів (усі, якщо limit None).
+        Повертає True, коли змінених записів більше немає
+        '''
+        keys = list(islice(self.changed, limit))
+        for key in keys:
+            del self.changed[key]
+            item = data.get(key)
+            self.lines[key] = None if item is None else json.dumps(item.to_dict(), ensure_ascii=False)
+        return not self.changed
+
+    def snapshot(self):
+        '''
+        Незмінна копія серіалізованих змін для write(): її записують уже без блокування книги
+        '''
+        return dict(self.lines), self.rewrite
+
+    def write(self, path, snapshot):
+        '''
+        Записує файл книги зі знімка змін: незмінені записи потоково копіюються з попередньої
+        версії файлу, змінені замінюються новими рядками, видалені пропускаються.
+        Після запису забуває рядки, які відтоді не змінювались
+        '''
+        lines, rewrite = snapshot
+        write_serialized_records(path, self._texts(path, lines, rewrite))
+        for key, line in lines.items():
+            if key in self.lines and self.lines[key] is line:
+                del self.lines[key]
+        if rewrite:
+            self.rewrite = False
+
+    def _texts(self, path, lines, rewrite):
+        if not rewrite and os.path.isfile(path):
+            for _, record, text in iter_json_texts(path, []):
+                key = record.get(self.key_field)
+                if not isinstance(key, str) or key not in lines:
+                    yield text
+        for line in lines.values():
+            if line is not None:
+                yield line
@@ -0,0 +1,44 @@
+class TrieNode:
+    __slots__ = ('children', 'words')
+
+    def __init__(self):
+        self.children = {}
+        # Усі слова з префіксом, що веде до вузла, у відсортованому порядку
+        self.words = []
+
+
+class PrefixTrie:
+    '''
+    Префіксне дерево для доповнення скорочених команд
+    '''
+    def __init__(self, words=()):
+        self.root = TrieNode()
+        for word in words:
+            self.insert(word)
+
+    def insert(self, word):
+        node = self.root
+        self._add_word(node, word)
+        for char in word:
+            node = node.children.setdefault(char, TrieNode())
+            self._add_word(node, word)
+
+    @staticmethod
+    def _add_word(node, word):
+        if word not in node.words:
+            node.words.append(word)
+            node.words.sort()
+
+    def longest_prefix(self, text):
+        '''
+        Повертає довжину найдовшого префікса text, що є в дереві, і його вузол
+        '''
+        node = self.root
+        depth = 0
+        for char in text:
+            child = node.children.get(char)
+            if child is None:
+                break
+            node = child
+            depth += 1
+        return depth, node
@@ -0,0 +1,110 @@
+'''
+Перевірка та нормалізація значень полів контактів.
+
+Шаблони компілюються один раз, дата DD.MM.YYYY розбирається без strptime,
+а функції *_many обробляють цілі списки значень, наприклад під час імпорту.
+Тексти помилок збігаються з тими, які input_error показує користувачу.
+'''
+from datetime import datetime
+import re
+
+
+PHONE_ERROR = "Phone number must be 10 digits long"
+EMAIL_ERROR = "Email is not valid"
+BIRTHDAY_ERROR = "Birthday must be in the format DD.MM.YYYY"
+TAG_ERROR = "Tag must be a single word"
+
+PHONE_LENGTH = 10
+BIRTHDAY_FORMAT = '%d.%m.%Y'
+
+EMAIL_PATTERN = re.compile(r'[a-zA-Z][a-zA-Z0-9_.]{1,}@[a-zA-Z]+\.[a-zA-Z]{2,}')
+NON_DIGITS = re.compile(r'[^0-9]')
+# Для пакетної нормалізації номери з'єднуються через \n, тож його зберігаємо
+NON_DIGITS_OR_NEWLINE = re.compile(r'[^0-9\n]')
+
+
+def normalize_phone(phone):
+    '''
+    Повертає номер з 10 цифр без роздільників
+    '''
+    if len(phone) == PHONE_LENGTH and phone.isascii() and phone.isdigit():
+        return phone
+    cleaned = NON_DIGITS.sub('', phone)
+    if len(cleaned) != PHONE_LENGTH:
+        raise ValueError(PHONE_ERROR)
+    return cleaned
+
+
+def validate_email(email):
+    if not EMAIL_PATTERN.search(email):
+        raise ValueError(EMAIL_ERROR)
+    return email
+
+
+def parse_birthday(text):
+    '''
+    Розбирає дату DD.MM.YYYY; інші варіанти, які приймає strptime, йдуть повільним шляхом
+    '''
+    if (len(text) == 10 and text[2] == '.' and text[5] == '.' and text.isascii()
+            and text[:2].isdigit() and text[3:5].isdigit() and text[6:].isdigit()):
+        try:
+            return datetime(int(text[6:]), int(text[3:5]), int(text[:2]))
+        except ValueError:
+            raise ValueError(BIRTHDAY_ERROR)
+    try:
+        return datetime.strptime(text, BIRTHDAY_FORMAT)
+    except ValueError:
+        raise ValueError(BIRTHDAY_ERROR)
+
+
+def normalize_tag(tag):
+    '''
+    Тег - одне слово в нижньому регістрі; необов'язковий # на початку відкидається
+    '''
+    tag = tag.strip().lstrip('#').lower()
+    if not tag or any(char.isspace() for char in tag):
+        raise ValueError(TAG_ERROR)
+    return tag
+
+
+def validate_many(validator, values):
+    '''
+    Застосовує validator до кожного значення.
+    Повертає список результатів (None для некоректних) і список пар (індекс, помилка)
+    '''
+    results, errors = [], []
+    for index, value in enumerate(values):
+        try:
+            results.append(validator(value))
+        except ValueError as e:
+            results.append(None)
+            errors.append((index, str(e)))
+    return results, errors
+
+
+def normalize_phones_many(phones):
+    '''
+    Нормалізує список номерів одним проходом регулярного виразу
+    '''
+    joined = '\n'.join(phones)
+    cleaned = NON_DIGITS_OR_NEWLINE.sub('', joined).split('\n')
+    if len(cleaned) != len(phones):
+        # Номер містив перенесення рядка: повертаємось до обробки по одному
+        return validate_many(normalize_phone, phones)
+
+    results, errors = [], []
+    for index, number in enumerate(cleaned):
+        if len(number) == PHONE_LENGTH:
+            results.append(number)
+        else:
+            results.append(None)
+            errors.append((index, PHONE_ERROR))
+    return results, errors
+
+
+def validate_emails_many(emails):
+    return validate_many(validate_email, emails)
+
+
+def parse_birthdays_many(birthdays):
+    return validate_many(parse_birthday, birthdays)
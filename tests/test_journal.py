@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from assistant_bot import run_journaled, replay_journal
+from address_book import AddressBook
+from journal import Journal
+from note_book import NotesBook
+
+
+COMMANDS = [
+    ("add-contact", ["John", "1234567890"]),
+    ("add-contact", ["Jonh", "1234567890"]),
+    ("add-contact", ["Anna", "5555555555"]),
+    ("add-contact", ["Ana", "5555555555"]),
+    ("merge-duplicates", ["1"]),
+    ("add-contact", ["Bill", "1111111111"]),
+    ("change-phone", ["Bill", "2222222222"]),
+    ("add-note", ["plan", "first", "draft"]),
+    ("add-tag", ["plan", "work"]),
+]
+
+
+def contents(book, notebook):
+    contacts = {name: record.to_dict() for name, record in book.data.items()}
+    notes = {title: note.to_dict() for title, note in notebook.data.items()}
+    return contacts, notes
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.directory.name, 'assistant_bot.journal')
+        self.book_path = os.path.join(self.directory.name, 'address_book.json')
+        self.notes_path = os.path.join(self.directory.name, 'note_book.json')
+        self.journal = Journal(self.journal_path)
+        self.book, self.notebook = AddressBook(), NotesBook()
+        for command, args in COMMANDS:
+            run_journaled(self.journal, command, args, self.book, self.notebook)
+        self.journal.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def restore(self):
+        book, notebook = AddressBook(), NotesBook()
+        if os.path.exists(self.book_path):
+            book.load_address_book(self.book_path)
+        if os.path.exists(self.notes_path):
+            notebook.load_notes(self.notes_path)
+        journal = Journal(self.journal_path)
+        try:
+            replay_journal(journal, book, notebook)
+        finally:
+            journal.close()
+        return book, notebook
+
+    def test_replay_from_empty_books(self):
+        self.assertEqual(contents(*self.restore()), contents(self.book, self.notebook))
+
+    def test_replay_over_books_that_already_contain_changes(self):
+        # Збій між збереженням книг і очищенням журналу
+        self.book.save_address_book(self.book_path)
+        self.notebook.save_notes(self.notes_path)
+        expected = contents(self.book, self.notebook)
+        # Повторне "merge-duplicates 1" злило б уже іншу групу
+        self.assertEqual(len(self.book.find_duplicates().groups), 1)
+        self.assertEqual(contents(*self.restore()), expected)
+        self.assertEqual(contents(*self.restore()), expected)
+
+    def test_replay_after_only_one_book_was_saved(self):
+        self.book.save_address_book(self.book_path)
+        self.assertEqual(contents(*self.restore()), contents(self.book, self.notebook))
+
+    def test_command_without_changes_is_executed_again(self):
+        journal = Journal(self.journal_path)
+        # Як під час запуску: нумерація продовжується після записаних команд
+        list(journal.replay())
+        # Збій між записом команди та записом її змін
+        journal.append("add-email", ["Bill", "bill@example.com"])
+        journal.close()
+        book, _ = self.restore()
+        self.assertEqual(book.find("Bill").email.value, "bill@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
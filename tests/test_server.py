@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classes'))
+from server import BookServer
+
+
+class FailingJournal:
+    '''
+    Журнал, синхронізація якого падає, доки failures не вичерпаються
+    '''
+    def __init__(self, failures):
+        self.failures = failures
+        self.entries = []
+
+    def append(self, command, args, sync=True):
+        self.entries.append((command, args))
+
+    def sync(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("No space left on device")
+
+
+def prepare(line):
+    command, *args = line.split()
+    return command, command, args, None
+
+
+class WriteLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.book = {}
+
+    def execute(self, command, args):
+        if command == 'add':
+            self.book[args[0]] = args[1]
+            return "Added."
+        return self.book.get(args[0], "Not found.")
+
+    def request(self, server, command):
+        return server.handle_request(json.dumps({'id': 1, 'command': command}))
+
+    async def run_server(self, journal):
+        server = BookServer(prepare, self.execute, {'add'}, set(), journal)
+        await server.start('127.0.0.1', 0)
+        try:
+            failed = await asyncio.wait_for(self.request(server, 'add John 1'), 5)
+            added = await asyncio.wait_for(self.request(server, 'add Jane 2'), 5)
+            shown = await asyncio.wait_for(self.request(server, 'show Jane'), 5)
+        finally:
+            await server.stop()
+        return failed, added, shown
+
+    def test_journal_failure_fails_batch_and_keeps_writer(self):
+        failed, added, shown = asyncio.run(self.run_server(FailingJournal(failures=1)))
+        self.assertIn('No space left on device', failed['error'])
+        self.assertNotIn('result', failed)
+        self.assertNotIn('John', self.book)
+        self.assertEqual(added['result'], "Added.")
+        self.assertEqual(shown['result'], "2")
+
+    def test_after_writes_failure_fails_batch(self):
+        def after_writes(commands):
+            if commands[0][1][0] == 'John':
+                raise RuntimeError("publish failed")
+
+        async def run():
+            server = BookServer(prepare, self.execute, {'add'}, set(), after_writes=after_writes)
+            await server.start('127.0.0.1', 0)
+            try:
+                failed = await asyncio.wait_for(self.request(server, 'add John 1'), 5)
+                added = await asyncio.wait_for(self.request(server, 'add Jane 2'), 5)
+            finally:
+                await server.stop()
+            return failed, added
+
+        failed, added = asyncio.run(run())
+        self.assertIn('publish failed', failed['error'])
+        self.assertEqual(added['result'], "Added.")
+
+
+if __name__ == '__main__':
+    unittest.main()